@@ -1,14 +1,42 @@
+import copy
+import fcntl
+import hashlib
 import json
+import math
+import mmap
 import os
+import random
+import re
 import signal
+import socketserver
+import sqlite3
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from contextlib import closing, contextmanager, nullcontext
 from enum import Enum, auto
+from fnmatch import fnmatch
+from itertools import chain
 
-import inquirer
-import ollama
-from openai import OpenAI
-from rich import print
+
+def print(*args, **kwargs):
+    """
+    Prints with rich markup. rich is imported on first use to keep startup fast.
+    """
+    from rich import print as rich_print
+
+    rich_print(*args, **kwargs)
 
 
 class Constants(Enum):
@@ -21,6 +49,35 @@ class Constants(Enum):
     OPEN_AI_MAX_TOKENS = "OPEN_AI_MAX_TOKENS"
     OPEN_AI_FREQUENCY_PENALTY = "OPEN_AI_FREQUENCY_PENALTY"
     OPEN_AI_PRESENCE_PENALTY = "OPEN_AI_PRESENCE_PENALTY"
+    PROMPT_TOKEN_BUDGET = "PROMPT_TOKEN_BUDGET"
+    DIFF_CONTEXT_LINES = "DIFF_CONTEXT_LINES"
+    OPEN_AI_BASE_URL = "OPEN_AI_BASE_URL"
+    OLLAMA_HOST = "OLLAMA_HOST"
+    MAP_REDUCE_FILE_THRESHOLD = "MAP_REDUCE_FILE_THRESHOLD"
+    MAP_REDUCE_CHUNK_BY = "MAP_REDUCE_CHUNK_BY"
+    MAP_REDUCE_CHUNK_TOKENS = "MAP_REDUCE_CHUNK_TOKENS"
+    MAP_REDUCE_CONCURRENCY = "MAP_REDUCE_CONCURRENCY"
+    RESPONSE_CACHE_MAX_BYTES = "RESPONSE_CACHE_MAX_BYTES"
+    STREAM_OUTPUT = "STREAM_OUTPUT"
+    CANDIDATE_COUNT = "CANDIDATE_COUNT"
+    CANDIDATE_TEMPERATURE = "CANDIDATE_TEMPERATURE"
+    WARM_UP_MODEL = "WARM_UP_MODEL"
+    OLLAMA_KEEP_ALIVE = "OLLAMA_KEEP_ALIVE"
+    BATCH_CONCURRENCY = "BATCH_CONCURRENCY"
+    BATCH_MAX_RETRIES = "BATCH_MAX_RETRIES"
+    USE_DAEMON = "USE_DAEMON"
+    HOOK_TIMEOUT_SECONDS = "HOOK_TIMEOUT_SECONDS"
+    DAEMON_TIMEOUT_SECONDS = "DAEMON_TIMEOUT_SECONDS"
+    UNTRACKED_FILE_MAX_BYTES = "UNTRACKED_FILE_MAX_BYTES"
+    SUMMARY_CACHE_MAX_BYTES = "SUMMARY_CACHE_MAX_BYTES"
+    SUMMARY_CACHE_MAX_AGE_DAYS = "SUMMARY_CACHE_MAX_AGE_DAYS"
+    SPECULATIVE_GENERATION = "SPECULATIVE_GENERATION"
+    JSON_OUTPUT = "JSON_OUTPUT"
+    HEDGE_MODEL = "HEDGE_MODEL"
+    HEDGE_DELAY_SECONDS = "HEDGE_DELAY_SECONDS"
+    HEDGE_TIMEOUT_SECONDS = "HEDGE_TIMEOUT_SECONDS"
+    SPLIT_COMMITS = "SPLIT_COMMITS"
+    HISTORY_EXAMPLE_COUNT = "HISTORY_EXAMPLE_COUNT"
 
 
 class Models(Enum):
@@ -28,95 +85,1755 @@ class Models(Enum):
     LLAMA3 = "llama3"
 
 
+# model 이름(~/.acw 의 MODEL 값) -> (provider 이름, provider 에서 쓰는 model id, 설명)
+MODEL_REGISTRY = {}
+# provider 이름 -> ChatProvider 를 상속한 class
+PROVIDER_REGISTRY = {}
+
+
+def register_model(name, provider_name, model_id, description):
+    MODEL_REGISTRY[name] = (provider_name, model_id, description)
+
+
+def register_provider(name):
+    def decorator(provider_class):
+        provider_class.name = name
+        provider_class.clients = {}
+        PROVIDER_REGISTRY[name] = provider_class
+        return provider_class
+
+    return decorator
+
+
+class Profiler:
+    """
+    Records how long each phase of a run takes (`--profile`, `--trace-file`).
+    When disabled `phase` returns a shared no-op context manager, so the instrumentation costs almost nothing.
+    """
+
+    disabled_phase = nullcontext({})
+
+    def __init__(self, enabled=False) -> None:
+        self.enabled = enabled
+        self.started_at_ns = time.perf_counter_ns()
+        # (phase 이름, 시작 ns, 걸린 ns, thread id, counts)
+        self.events = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def phase(self, name):
+        if not self.enabled:
+            return self.disabled_phase
+        return self.record_phase(name)
+
+    @contextmanager
+    def record_phase(self, name):
+        counts = {}
+        stack = self.local.__dict__.setdefault("stack", [])
+        stack.append(counts)
+        started_at_ns = time.perf_counter_ns()
+        try:
+            yield counts
+        finally:
+            elapsed_ns = time.perf_counter_ns() - started_at_ns
+            stack.pop()
+            with self.lock:
+                self.events.append(
+                    (name, started_at_ns, elapsed_ns, threading.get_ident(), counts)
+                )
+
+    def add_counts(self, **counts):
+        """
+        Adds the counts (e.g. tokens) to the innermost phase of the current thread.
+        """
+        if not self.enabled:
+            return
+        stack = self.local.__dict__.get("stack")
+        if not stack:
+            return
+        for name, value in counts.items():
+            if value is not None:
+                stack[-1][name] = stack[-1].get(name, 0) + value
+
+    def count_tokens(self, prompt_tokens, completion_tokens):
+        self.add_counts(
+            prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+        )
+
+    def summarize(self):
+        """
+        Returns one row per phase name in the order the phases first finished:
+        (name, calls, total seconds, prompt tokens, completion tokens).
+        """
+        rows = {}
+        with self.lock:
+            events = list(self.events)
+        for name, _, elapsed_ns, _, counts in events:
+            row = rows.setdefault(name, [name, 0, 0.0, 0, 0])
+            row[1] += 1
+            row[2] += elapsed_ns / 1e9
+            row[3] += counts.get("prompt_tokens", 0)
+            row[4] += counts.get("completion_tokens", 0)
+        return [tuple(row) for row in rows.values()]
+
+    def print_summary(self, providers=()):
+        """
+        Prints the phase table and, for the `providers` that sent requests, their request latencies.
+        """
+        from rich.console import Console
+        from rich.table import Table
+
+        table = Table(title="acw profile")
+        table.add_column("Phase")
+        table.add_column("Calls", justify="right")
+        table.add_column("Time (ms)", justify="right")
+        table.add_column("Prompt tokens", justify="right")
+        table.add_column("Completion tokens", justify="right")
+        for name, calls, seconds, prompt_tokens, completion_tokens in self.summarize():
+            table.add_row(
+                name,
+                str(calls),
+                f"{seconds * 1000:.1f}",
+                str(prompt_tokens or "-"),
+                str(completion_tokens or "-"),
+            )
+        Console(stderr=True).print(table)
+
+        latency_rows = [
+            (provider.model_id, provider.summarize_latencies())
+            for provider in providers
+        ]
+        latency_rows = [(model, summary) for model, summary in latency_rows if summary]
+        if not latency_rows:
+            return
+        table = Table(title="acw latency")
+        table.add_column("Model")
+        table.add_column("Requests", justify="right")
+        table.add_column("Avg (ms)", justify="right")
+        table.add_column("P50 (ms)", justify="right")
+        table.add_column("Max (ms)", justify="right")
+        for model, (requests, average, median, maximum) in latency_rows:
+            table.add_row(
+                model,
+                str(requests),
+                f"{average * 1000:.1f}",
+                f"{median * 1000:.1f}",
+                f"{maximum * 1000:.1f}",
+            )
+        Console(stderr=True).print(table)
+
+    def write_trace(self, path):
+        """
+        Writes the phases in the Chrome trace event format (chrome://tracing, Perfetto).
+        """
+        with self.lock:
+            events = list(self.events)
+        trace_events = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (started_at_ns - self.started_at_ns) / 1000,
+                "dur": elapsed_ns / 1000,
+                "pid": os.getpid(),
+                "tid": thread_id,
+                "args": counts,
+            }
+            for name, started_at_ns, elapsed_ns, thread_id, counts in events
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+class ChatProvider:
+    """
+    Base class of the model backends registered with `register_provider`.
+    A backend keeps one pooled keep-alive HTTP client per endpoint, can warm up the model
+    and records the latency of every request in `latencies`.
+    """
+
+    name = None
+    clients = {}
+    client_lock = threading.Lock()
+    # OpenAI 의 `n` 처럼 한 번의 요청으로 여러 개의 답을 받을 수 있는지
+    supports_choices = False
+    # chat, chat_choices, stream_chat 이 json_output 인자로 JSON 출력을 강제할 수 있는지
+    supports_json_output = False
+    latency_history_size = 1000
+
+    def __init__(self, acw, model_id) -> None:
+        self.acw = acw
+        self.model_id = model_id
+        # daemon 은 오래 실행되므로 최근 요청의 latency 만 남긴다
+        self.latencies = deque(maxlen=self.latency_history_size)
+
+    def get_client(self):
+        """
+        Returns the pooled client of the current endpoint, creating it on first use.
+        """
+        key = self.get_client_key()
+        with ChatProvider.client_lock:
+            if key not in self.clients:
+                self.clients[key] = self.create_client()
+            return self.clients[key]
+
+    def get_client_key(self):
+        raise NotImplementedError
+
+    def create_client(self):
+        raise NotImplementedError
+
+    def chat(self, messages):
+        """
+        Returns the content of the answer to `messages`.
+        """
+        raise NotImplementedError
+
+    def chat_choices(self, messages, n, temperature=None):
+        """
+        Returns `n` answers to `messages`, generated in one request.
+        `temperature` overrides the configured one so that the answers differ.
+        """
+        raise NotImplementedError
+
+    def stream_chat(self, messages):
+        """
+        Yields the content chunks of the answer to `messages` as they arrive.
+        """
+        yield self.chat(messages)
+
+    def warm_up(self):
+        """
+        Prepares the model and the connection before the first request.
+        """
+
+    def ask_initial_config(self, config_map):
+        """
+        Asks the values the backend needs when the config file is created for the first time.
+        """
+
+    def record_latency(self, started_at):
+        self.latencies.append(time.perf_counter() - started_at)
+
+    def summarize_latencies(self):
+        """
+        Returns (requests, average, median, max) of the recorded latencies in seconds, or None without requests.
+        """
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return (
+            len(latencies),
+            sum(latencies) / len(latencies),
+            latencies[len(latencies) // 2],
+            latencies[-1],
+        )
+
+
+@register_provider("openai")
+class OpenAIChatProvider(ChatProvider):
+    supports_choices = True
+    supports_json_output = True
+
+    def get_client_key(self):
+        return (self.acw.open_ai_api_key, self.acw.open_ai_base_url)
+
+    def create_client(self):
+        from openai import OpenAI
+
+        return OpenAI(
+            api_key=self.acw.open_ai_api_key, base_url=self.acw.open_ai_base_url
+        )
+
+    def create_completion(
+        self, messages, json_output=False, temperature=None, **kwargs
+    ):
+        if json_output:
+            kwargs["response_format"] = {"type": "json_object"}
+        if temperature is None:
+            temperature = self.acw.open_ai_temperature
+        return self.get_client().chat.completions.create(
+            messages=messages,
+            model=self.model_id,
+            frequency_penalty=self.acw.open_ai_frequency_penalty,
+            max_tokens=self.acw.open_ai_max_tokens,
+            temperature=temperature,
+            top_p=self.acw.open_ai_top_p,
+            presence_penalty=self.acw.open_ai_presence_penalty,
+            stop=None,
+            **kwargs,
+        )
+
+    def chat(self, messages, json_output=False):
+        return self.chat_choices(messages, 1, json_output=json_output)[0]
+
+    def chat_choices(self, messages, n, json_output=False, temperature=None):
+        started_at = time.perf_counter()
+        if n == 1:
+            completion = self.create_completion(
+                messages, json_output=json_output, temperature=temperature
+            )
+        else:
+            completion = self.create_completion(
+                messages, json_output=json_output, temperature=temperature, n=n
+            )
+        self.record_latency(started_at)
+        self.count_tokens(completion.usage)
+        return [choice.message.content for choice in completion.choices]
+
+    def stream_chat(self, messages, json_output=False):
+        started_at = time.perf_counter()
+        kwargs = {}
+        if self.acw.profiler.enabled:
+            # 마지막 chunk 로 token 사용량을 받는다
+            kwargs["stream_options"] = {"include_usage": True}
+        try:
+            for chunk in self.create_completion(
+                messages, json_output=json_output, stream=True, **kwargs
+            ):
+                if chunk.usage:
+                    self.count_tokens(chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            self.record_latency(started_at)
+
+    def count_tokens(self, usage):
+        if usage:
+            self.acw.profiler.count_tokens(usage.prompt_tokens, usage.completion_tokens)
+
+    def warm_up(self):
+        # TLS 연결을 미리 맺어두면 첫 요청에서 handshake 시간을 아낄 수 있다
+        self.get_client().models.retrieve(self.model_id)
+
+    def ask_initial_config(self, config_map):
+        open_ai_api_key = input("Enter your OpenAI API key: ")
+        config_map[Constants.OPEN_AI_API_KEY.name] = open_ai_api_key
+        config_map[Constants.OPEN_AI_TEMPERATURE.name] = self.acw.open_ai_temperature
+        config_map[Constants.OPEN_AI_TOP_P.name] = self.acw.open_ai_top_p
+        config_map[Constants.OPEN_AI_MAX_TOKENS.name] = self.acw.open_ai_max_tokens
+        config_map[Constants.OPEN_AI_FREQUENCY_PENALTY.name] = (
+            self.acw.open_ai_frequency_penalty
+        )
+        config_map[Constants.OPEN_AI_PRESENCE_PENALTY.name] = (
+            self.acw.open_ai_presence_penalty
+        )
+
+
+@register_provider("ollama")
+class OllamaChatProvider(ChatProvider):
+    supports_json_output = True
+
+    def get_client_key(self):
+        return self.acw.ollama_host
+
+    def create_client(self):
+        import ollama
+
+        return ollama.Client(host=self.acw.ollama_host)
+
+    def chat(self, messages, json_output=False):
+        started_at = time.perf_counter()
+        completion = self.get_client().chat(
+            model=self.model_id,
+            messages=messages,
+            keep_alive=self.acw.ollama_keep_alive,
+            **self.get_format_options(json_output),
+        )
+        self.record_latency(started_at)
+        self.count_tokens(completion)
+        return completion["message"]["content"]
+
+    def stream_chat(self, messages, json_output=False):
+        started_at = time.perf_counter()
+        try:
+            for chunk in self.get_client().chat(
+                model=self.model_id,
+                messages=messages,
+                keep_alive=self.acw.ollama_keep_alive,
+                stream=True,
+                **self.get_format_options(json_output),
+            ):
+                if chunk.get("done"):
+                    self.count_tokens(chunk)
+                yield chunk["message"]["content"]
+        finally:
+            self.record_latency(started_at)
+
+    def count_tokens(self, response):
+        self.acw.profiler.count_tokens(
+            response.get("prompt_eval_count"), response.get("eval_count")
+        )
+
+    def get_format_options(self, json_output):
+        return {"format": "json"} if json_output else {}
+
+    def warm_up(self):
+        # prompt 없이 generate 를 호출하면 model 을 memory 에 올리고 keep_alive 동안 유지한다
+        self.get_client().generate(
+            model=self.model_id, keep_alive=self.acw.ollama_keep_alive
+        )
+
+
+register_model(
+    Models.GPT_3_5_TURBO.name,
+    "openai",
+    Models.GPT_3_5_TURBO.value,
+    "OpenAI, Need to connect your OpenAI account.",
+)
+register_model(
+    Models.LLAMA3.name, "ollama", Models.LLAMA3.value, "Ollama, Run locally."
+)
+
+
 class GitCommand(Enum):
-    UNSTAGED_FILES = ["git", "ls-files", "--others", "--exclude-standard"]
-    MODIFIED_FILES = ["git", "diff", "--name-only"]
+    STATUS = [
+        "git",
+        "status",
+        "--porcelain=v2",
+        "-z",
+        "--branch",
+        "--untracked-files=all",
+    ]
+    # git add --pathspec-from-file 는 pathspec 마다 index 전체를 비교해서 파일이 많으면 느리므로
+    # 정확한 경로를 받는 update-index 로 한 번에 stage 한다 (삭제된 파일은 --remove 로 처리)
+    UPDATE_INDEX = ["git", "update-index", "--add", "--remove", "-z", "--stdin"]
+    REV_LIST = ["git", "rev-list", "--reverse"]
+    # 커밋마다 NUL 로 시작하고 바뀐 파일 이름이 줄마다 나온다
+    LOG_NAMES = [
+        "git",
+        "-c",
+        "core.quotePath=false",
+        "log",
+        "--name-only",
+        "--no-renames",
+        "--format=%x00",
+    ]
+    # 커밋마다 NUL, hash, 제목, 본문을 0x1f 로 나누고 바뀐 파일 이름이 줄마다 나온다
+    LOG_MESSAGES = [
+        "git",
+        "-c",
+        "core.quotePath=false",
+        "log",
+        "--no-merges",
+        "--name-only",
+        "--no-renames",
+        "--format=%x00%H%x1f%s%x1f%b%x1f",
+    ]
+    GIT_COMMON_DIR = ["git", "rev-parse", "--path-format=absolute", "--git-common-dir"]
+    HEAD = ["git", "rev-parse", "--verify", "-q", "HEAD"]
+    TOP_LEVEL = ["git", "rev-parse", "--show-toplevel"]
+    COMMIT_PATHS = [
+        "git",
+        "--literal-pathspecs",
+        "commit",
+        "--pathspec-from-file=-",
+        "--pathspec-file-nul",
+    ]
+    SHOW = [
+        "git",
+        "-c",
+        "core.quotePath=false",
+        "show",
+        "--format=",
+        "--diff-merges=first-parent",
+        "--no-color",
+        "--no-ext-diff",
+        "--full-index",
+    ]
+    DIFF = [
+        "git",
+        "-c",
+        "core.quotePath=false",
+        "--literal-pathspecs",
+        "diff",
+        "--no-color",
+        "--no-ext-diff",
+        # 전체 blob id 는 파일별 요약 cache 의 key 로 사용한다
+        "--full-index",
+    ]
 
 
-class ACW:
-    def __init__(self, check_subcommands=True, home_directory=None) -> None:
+class CommitPlanner:
+    """
+    Groups the selected files into logical commits without asking the model, from how close their paths are,
+    how often they changed together in `git log` and how many identifiers their changed lines share.
+    """
+
+    identifier_pattern = re.compile(r"[A-Za-z_][A-Za-z0-9_]{2,}")
+    path_weight = 0.4
+    co_change_weight = 0.4
+    hunk_weight = 0.2
+    # 같은 directory 의 파일이나 항상 같이 바뀌어 온 파일은 이것만으로 한 그룹이 된다
+    threshold = 0.35
+    # 한 번 같이 바뀐 것은 (첫 커밋 등) 우연일 수 있다
+    co_change_min_count = 2
+
+    def __init__(self, file_diffs, file_counts, pair_counts) -> None:
+        self.filenames = [filename for filename, _ in file_diffs]
+        self.file_counts = file_counts
+        self.pair_counts = pair_counts
+        self.tokens = [self.get_tokens(lines) for _, lines in file_diffs]
+        self.directories = [filename.split("/")[:-1] for filename in self.filenames]
+
+    def get_tokens(self, lines):
+        if not lines or not lines[0].startswith("diff --git "):
+            # untracked 파일은 내용 전체가 추가된 줄이다
+            return set(self.identifier_pattern.findall("\n".join(lines)))
+        tokens = set()
+        for line in lines:
+            if line[:1] in "+-" and not line.startswith(("+++ ", "--- ")):
+                tokens.update(self.identifier_pattern.findall(line))
+        return tokens
+
+    def get_path_similarity(self, first, second):
+        first_directory, second_directory = (
+            self.directories[first],
+            self.directories[second],
+        )
+        if first_directory == second_directory:
+            return 1.0
+        common = len(os.path.commonprefix([first_directory, second_directory]))
+        return common / max(len(first_directory), len(second_directory))
+
+    def get_co_change_similarity(self, first, second):
+        first_name, second_name = sorted(
+            (self.filenames[first], self.filenames[second])
+        )
+        together = self.pair_counts.get((first_name, second_name), 0)
+        if together < self.co_change_min_count:
+            return 0.0
+        return together / (
+            self.file_counts[first_name] + self.file_counts[second_name] - together
+        )
+
+    def get_hunk_similarity(self, first, second):
+        first_tokens, second_tokens = self.tokens[first], self.tokens[second]
+        if not first_tokens or not second_tokens:
+            return 0.0
+        return len(first_tokens & second_tokens) / len(first_tokens | second_tokens)
+
+    def get_similarity(self, first, second):
+        return (
+            self.path_weight * self.get_path_similarity(first, second)
+            + self.co_change_weight * self.get_co_change_similarity(first, second)
+            + self.hunk_weight * self.get_hunk_similarity(first, second)
+        )
+
+    def plan(self):
         """
-        Initialize the command_map with the appropriate method references,
-        process the subcommands provided as arguments,
-        and call the corresponding method based on the input subcommand.
+        Returns the groups of file names, joining every pair above `threshold` (single linkage).
+        Groups and the files in them keep the selection order.
         """
-        self.text_color = "light_slate_blue"
-        self.home_directory = os.path.expanduser("~")
-        if home_directory:
-            self.home_directory = home_directory
-        self.acw_config_path = self.home_directory + "/.acw"
-        self.commit_message_language = "English"
-        self.prompt_message = (
-            "You are a robot that only outputs JSON."
-            " "
-            "You will be provided with a piece of code."
-            " "
-            "Your task is to generate a commit message for it in a conventional commit message format."
-            " "
-            f"Use {self.commit_message_language} as the commit message language."
-            " "
-            "Subject should be like 'feat: add new feature'"
-            " "
-            "The description should be summarized as a maximum of 70 characters per row and a maximum of 5 lines."
-            " "
-            "Return as a JSON object with the keys 'subject' and 'description' (e.g., {'subject': '...', 'description': ['...', '...']})."
+        parents = list(range(len(self.filenames)))
+
+        def find(index):
+            while parents[index] != index:
+                parents[index] = parents[parents[index]]
+                index = parents[index]
+            return index
+
+        for first in range(len(self.filenames)):
+            for second in range(first + 1, len(self.filenames)):
+                first_root, second_root = find(first), find(second)
+                if first_root == second_root:
+                    continue
+                if self.get_similarity(first, second) >= self.threshold:
+                    parents[max(first_root, second_root)] = min(first_root, second_root)
+        groups = {}
+        for index, filename in enumerate(self.filenames):
+            groups.setdefault(find(index), []).append(filename)
+        return list(groups.values())
+
+
+class RepositoryStatus:
+    """
+    Snapshot of the working tree built from one `git status --porcelain=v2 -z --branch` call.
+    Paths are relative to the repository root.
+    """
+
+    def __init__(self) -> None:
+        self.branch = None
+        self.upstream = None
+        self.ahead = 0
+        self.behind = 0
+        # git ls-files --others --exclude-standard 에 해당
+        self.untracked = []
+        # git diff --name-only 에 해당 (index 와 working tree 가 다른 파일)
+        self.modified = []
+        self.staged = []
+        # (새 경로, 원래 경로)
+        self.renamed = []
+        self.deleted = []
+        self.unmerged = []
+
+    @classmethod
+    def parse(cls, output):
+        status = cls()
+        records = iter(output.split("\0"))
+        for record in records:
+            if record.startswith("# "):
+                status.parse_header(record[2:])
+            elif record.startswith("1 "):
+                fields = record.split(" ", 8)
+                status.add_entry(fields[1], fields[8])
+            elif record.startswith("2 "):
+                fields = record.split(" ", 9)
+                original_path = next(records)
+                status.renamed.append((fields[9], original_path))
+                status.add_entry(fields[1], fields[9])
+            elif record.startswith("u "):
+                path = record.split(" ", 10)[10]
+                status.unmerged.append(path)
+                status.modified.append(path)
+            elif record.startswith("? "):
+                status.untracked.append(record[2:])
+        return status
+
+    def parse_header(self, header):
+        key, _, value = header.partition(" ")
+        if key == "branch.head" and value != "(detached)":
+            self.branch = value
+        elif key == "branch.upstream":
+            self.upstream = value
+        elif key == "branch.ab":
+            ahead, behind = value.split(" ")
+            self.ahead, self.behind = int(ahead), -int(behind)
+
+    def add_entry(self, xy, path):
+        index_status, worktree_status = xy[0], xy[1]
+        if index_status != ".":
+            self.staged.append(path)
+        if worktree_status != ".":
+            self.modified.append(path)
+        if "D" in xy:
+            self.deleted.append(path)
+
+
+class ResponseCache:
+    """
+    Size-bounded on-disk LRU cache of model responses. One JSON file per key,
+    the file mtime is the last access time used for eviction.
+    With `max_age_seconds` entries not used for that long are evicted as well.
+    """
+
+    entry_directory_name = "responses"
+    stats_file_name = "stats.json"
+    # 같은 stats.json 을 여러 instance 와 thread 가 고치므로 lock 은 class 에 하나만 둔다
+    counter_lock = threading.Lock()
+
+    def __init__(self, cache_directory, max_bytes, max_age_seconds=None) -> None:
+        self.cache_directory = cache_directory
+        self.response_directory = os.path.join(
+            cache_directory, self.entry_directory_name
         )
-        self.open_ai_temperature = 0
-        self.open_ai_top_p = 0.95
-        self.open_ai_max_tokens = 500
-        self.open_ai_frequency_penalty = 0
-        self.open_ai_presence_penalty = 0
+        self.stats_path = os.path.join(cache_directory, self.stats_file_name)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
 
-        if check_subcommands:
-            subcommands = sys.argv[1:]
+    def make_key(self, *parts):
+        return hashlib.sha256(
+            json.dumps(parts, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
 
-            if len(subcommands) > 1:
-                # subcommand 를 2개 이상 입력한 경우
-                print("Too many arguments")
-                sys.exit(1)
-            elif len(subcommands) == 1:
-                # subcommand 를 1개만 입력한 경우
-                if subcommands[0] == "config":
-                    self.config(edit_config=True)
-                elif subcommands[0] == "commit":
-                    self.commit()
+    def get(self, key):
+        path = os.path.join(self.response_directory, key + ".json")
+        try:
+            with open(path, "r") as f:
+                content = json.load(f)["content"]
+        except (OSError, ValueError, KeyError):
+            self.increase_counter("misses")
+            return None
+        os.utime(path)
+        self.increase_counter("hits")
+        return content
+
+    def contains(self, key):
+        """
+        Returns True when `key` is cached, without counting a hit or a miss.
+        """
+        return os.path.exists(os.path.join(self.response_directory, key + ".json"))
+
+    def put(self, key, content):
+        os.makedirs(self.response_directory, exist_ok=True)
+        path = os.path.join(self.response_directory, key + ".json")
+        self.write_json_atomically(path, {"content": content})
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the expired entries, then the least recently used ones until the cache fits in `max_bytes`.
+        """
+        entries = self.list_entries()
+        total_bytes = sum(entry.stat().st_size for entry in entries)
+        expires_before = -math.inf
+        if self.max_age_seconds is not None:
+            expires_before = time.time() - self.max_age_seconds
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            if (
+                total_bytes <= self.max_bytes
+                and entry.stat().st_mtime >= expires_before
+            ):
+                break
+            total_bytes -= entry.stat().st_size
+            os.remove(entry.path)
+
+    def list_entries(self):
+        try:
+            with os.scandir(self.response_directory) as entries:
+                return [entry for entry in entries if entry.name.endswith(".json")]
+        except FileNotFoundError:
+            return []
+
+    def read_counters(self):
+        try:
+            with open(self.stats_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def increase_counter(self, name):
+        os.makedirs(self.cache_directory, exist_ok=True)
+        # daemon 과 다른 acw process 도 같은 파일을 고치므로 file lock 도 잡는다
+        with self.counter_lock, open(self.stats_path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            counters = self.read_counters()
+            counters[name] = counters.get(name, 0) + 1
+            self.write_json_atomically(self.stats_path, counters)
+
+    def write_json_atomically(self, path, value):
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(temporary_path, path)
+
+    def stats(self):
+        entries = self.list_entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(entry.stat().st_size for entry in entries),
+            "max_bytes": self.max_bytes,
+            **self.read_counters(),
+        }
+
+    def clear(self):
+        for entry in self.list_entries():
+            os.remove(entry.path)
+        if os.path.exists(self.stats_path):
+            os.remove(self.stats_path)
+
+
+class CommitHistoryIndex:
+    """
+    On-disk SQLite FTS5 index of the past commit messages of a repository and the paths they touched.
+    `update` indexes only the commits made since the last update, `search` ranks them with BM25 and path overlap.
+    """
+
+    token_pattern = re.compile(r"[^\W_]+")
+    # 이보다 많은 커밋에 나오는 단어 (py, src, fix 등) 는 검색에 쓰지 않는다
+    max_document_ratio = 0.005
+    min_max_documents = 50
+    max_query_terms = 8
+    max_query_characters = 20000
+    update_lock = threading.Lock()
+
+    def __init__(self, path, max_commits=20000) -> None:
+        self.path = path
+        self.max_commits = max_commits
+
+    def connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS indexed_commits (hash TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, documents INTEGER);
+            CREATE VIRTUAL TABLE IF NOT EXISTS commit_messages USING fts5(subject, body, paths);
+            """)
+        return connection
+
+    def tokenize(self, text):
+        # FTS5 의 unicode61 tokenizer 와 같은 단위 (영숫자 이외는 구분자) 로 나눈다
+        return self.token_pattern.findall(text.lower())
+
+    def update(self, repository_path):
+        """
+        Indexes the commits reachable from HEAD that are not indexed yet, at most `max_commits`.
+        Returns the number of indexed commits.
+        """
+        head = subprocess.run(
+            GitCommand.HEAD.value,
+            cwd=repository_path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ).stdout.strip()
+        if not head:
+            return 0
+        head = head.decode("ascii")
+        with CommitHistoryIndex.update_lock, closing(self.connect()) as connection:
+            last_head = connection.execute(
+                "SELECT value FROM state WHERE key = 'head'"
+            ).fetchone()
+            if last_head and last_head[0] == head:
+                return 0
+            command = GitCommand.LOG_MESSAGES.value + [f"-{self.max_commits}"]
+            result = None
+            if last_head:
+                result = subprocess.run(
+                    command + [f"{last_head[0]}..{head}"],
+                    cwd=repository_path,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                )
+            if result is None or result.returncode != 0:
+                # 처음이거나 마지막으로 색인한 커밋이 사라졌으면 (rebase 후 gc 등) 최근 커밋부터 다시 읽는다
+                result = subprocess.run(
+                    command + [head],
+                    cwd=repository_path,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                )
+            count = 0
+            term_documents = {}
+            with connection:
+                for record in result.stdout.decode("utf-8", "surrogateescape").split(
+                    "\0"
+                )[1:]:
+                    commit_hash, subject, body, names = record.split("\x1f", 3)
+                    if not connection.execute(
+                        "INSERT OR IGNORE INTO indexed_commits VALUES (?)",
+                        (commit_hash,),
+                    ).rowcount:
+                        continue
+                    paths = "\n".join(name for name in names.split("\n") if name)
+                    body = body.strip()
+                    connection.execute(
+                        "INSERT INTO commit_messages VALUES (?, ?, ?)",
+                        (subject, body, paths),
+                    )
+                    for term in set(self.tokenize(f"{subject} {body} {paths}")):
+                        term_documents[term] = term_documents.get(term, 0) + 1
+                    count += 1
+                connection.executemany(
+                    "INSERT INTO terms VALUES (?, ?)"
+                    " ON CONFLICT(term) DO UPDATE SET documents = documents + excluded.documents",
+                    term_documents.items(),
+                )
+                connection.execute(
+                    "INSERT OR REPLACE INTO state VALUES ('head', ?)", (head,)
+                )
+                # 검색할 때마다 count(*) 하면 수십만 커밋에서 몇 ms 가 걸리므로 저장해 둔다
+                connection.execute(
+                    "INSERT OR REPLACE INTO state VALUES"
+                    " ('commits', (SELECT count(*) FROM indexed_commits))"
+                )
+            return count
+
+    def search(self, paths, text, limit):
+        """
+        Returns the subjects of the `limit` past commits most similar to a change of `paths`
+        whose changed lines are `text`. Only the rarest terms are searched to keep lookups in milliseconds.
+        """
+        if not os.path.exists(self.path):
+            return []
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                "SELECT value FROM state WHERE key = 'commits'"
+            ).fetchone()
+            commit_count = int(row[0]) if row else 0
+            max_documents = max(
+                self.min_max_documents, commit_count * self.max_document_ratio
+            )
+            query_terms = set(
+                self.tokenize(" ".join(paths) + " " + text[: self.max_query_characters])
+            )
+            term_documents = []
+            for term in query_terms:
+                row = connection.execute(
+                    "SELECT documents FROM terms WHERE term = ?", (term,)
+                ).fetchone()
+                if row and row[0] <= max_documents:
+                    term_documents.append((row[0], term))
+            if not term_documents:
+                return []
+            query = " OR ".join(
+                f'"{term}"'
+                for _, term in sorted(term_documents)[: self.max_query_terms]
+            )
+            rows = connection.execute(
+                "SELECT subject, paths, bm25(commit_messages, 1.0, 0.5, 2.0) FROM commit_messages"
+                " WHERE commit_messages MATCH ? ORDER BY rank LIMIT ?",
+                (query, limit * 10),
+            ).fetchall()
+        # BM25 로 고른 후보를 같은 파일, 같은 directory 를 바꾼 정도로 다시 정렬한다
+        selected_paths = set(paths)
+        selected_directories = {os.path.dirname(path) for path in paths}
+        ranked = []
+        for subject, commit_paths, bm25 in rows:
+            commit_paths = commit_paths.split("\n")
+            path_overlap = len(selected_paths.intersection(commit_paths))
+            directory_overlap = len(
+                selected_directories.intersection(
+                    os.path.dirname(path) for path in commit_paths
+                )
+            )
+            ranked.append((-bm25 + 2 * path_overlap + directory_overlap, subject))
+        ranked.sort(key=lambda item: -item[0])
+        subjects = []
+        for _, subject in ranked:
+            if subject not in subjects:
+                subjects.append(subject)
+        return subjects[:limit]
+
+    def clear(self):
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+
+class SummaryCache(ResponseCache):
+    """
+    Map step summaries of single files, keyed by the blob object IDs of the file before and after the change.
+    """
+
+    entry_directory_name = "summaries"
+    stats_file_name = "summary_stats.json"
+
+
+class CommitMessageStreamParser:
+    """
+    Incremental parser for the {"subject": "...", "description": ["...", ...]} answer.
+    `feed` takes the next chunk of model output and returns the ("subject" | "description", text)
+    events completed by it. Every character is scanned once.
+    """
+
+    def __init__(self) -> None:
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_buffer = []
+        self.expect_key = False
+        self.current_key = None
+
+    def feed(self, chunk):
+        events = []
+        for character in chunk:
+            if self.in_string:
+                self.string_buffer.append(character)
+                if self.escape:
+                    self.escape = False
+                elif character == "\\":
+                    self.escape = True
+                elif character == '"':
+                    self.in_string = False
+                    events += self.complete_string("".join(self.string_buffer))
+            elif self.depth == 0 and character != "{":
+                # JSON 객체 앞에 붙은 설명이나 code fence 는 무시
+                continue
+            elif character == '"':
+                self.in_string = True
+                self.string_buffer = [character]
+            elif character in "{[":
+                self.depth += 1
+                self.expect_key = character == "{" and self.depth == 1
+            elif character in "}]":
+                self.depth -= 1
+            elif character == "," and self.depth == 1:
+                self.expect_key = True
+            elif character == ":" and self.depth == 1:
+                self.expect_key = False
+        return events
+
+    def complete_string(self, literal):
+        try:
+            value = json.loads(literal)
+        except ValueError:
+            return []
+        if self.depth == 1 and self.expect_key:
+            self.current_key = value
+            return []
+        if self.current_key == "subject" and self.depth == 1:
+            return [("subject", value)]
+        if self.current_key == "description" and self.depth == 2:
+            return [("description", value)]
+        if self.current_key == "description" and self.depth == 1:
+            return [("description", line) for line in value.split("\n") if line]
+        return []
+
+
+class CommitMessageStreamRenderer:
+    """
+    Renders the commit message inside the message box frame while the model output streams in.
+    """
+
+    def __init__(self, acw, width=72, indent=1) -> None:
+        self.acw = acw
+        self.width = width
+        self.indent = indent
+        self.rendered = False
+        # 요청이 중간에 실패하면 지울 수 있도록 화면에 그린 줄 수를 센다
+        self.printed_lines = 0
+        # 화면에 보여준 제목과 설명. 최종 메시지와 다르면 다시 보여줘야 한다
+        self.rendered_subject = ""
+        self.rendered_description = []
+
+    def render(self, chunks):
+        """
+        Consumes the streamed chunks, prints the subject and description lines as soon as they are complete
+        and returns the whole answer.
+        """
+        parser = CommitMessageStreamParser()
+        space = " " * self.indent
+        border = "═" * (self.width + self.indent * 2)
+        contents = []
+        for chunk in chunks:
+            contents.append(chunk)
+            for name, text in parser.feed(chunk):
+                if not self.rendered:
+                    self.acw.print_generated_commit_message_header()
+                    self.printed_lines += 2
+                    self.print_line(border)
+                    self.rendered = True
+                if name == "subject":
+                    self.rendered_subject = text.strip()
+                    self.print_line(f"{space}{text}\n")
                 else:
-                    # 모르는 subcommand 는 무시하도록 처리
-                    print("Unknown command")
-                    sys.exit(1)
-            else:
-                # 'acw' 만 입력한 경우
-                self.commit()
+                    self.rendered_description.append(text)
+                    self.print_line(f"{space}- {text}")
+        if self.rendered:
+            self.print_line(border)
+            self.print_line("")
+        return "".join(contents)
 
-    def config(self, edit_config=False):
-        exist = (
-            os.path.exists(self.acw_config_path)
-            and os.path.isfile(self.acw_config_path)
-            and os.access(self.acw_config_path, os.R_OK)
-            and os.path.getsize(self.acw_config_path) > 0
+    def print_line(self, text):
+        import shutil
+
+        columns = shutil.get_terminal_size().columns
+        self.printed_lines += sum(
+            max(1, math.ceil(len(line) / columns)) for line in text.split("\n")
         )
-        if exist:
-            self.current_config_map = {}
-            with open(self.acw_config_path, "rb") as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        k, v = line.split(b"=")
-                        self.current_config_map[k.decode("utf-8")] = v.decode("utf-8")
-            if edit_config:
-                for k, v in self.current_config_map.items():
-                    print('Current value of "{0}": "{1}"'.format(k, v))
-                    new_value = input(
-                        "Enter a new value or press Enter to keep the current value: "
-                    )
-                    if new_value:
-                        self.current_config_map[k] = new_value
-                    print()
-                with open(self.acw_config_path, "wb") as f:
-                    for k, v in self.current_config_map.items():
-                        f.write(k.encode("utf-8"))
-                        f.write(b"=")
-                        f.write(str(v).encode("utf-8"))
+        print(text)
+
+    def discard(self):
+        """
+        Erases the partly rendered message of a failed request so that the next answer is rendered from the start.
+        """
+        if not self.rendered:
+            return
+        if sys.stdout.isatty():
+            # 그린 줄 수만큼 커서를 올리고 그 아래를 모두 지운다
+            sys.stdout.write(f"\x1b[{self.printed_lines}F\x1b[J")
+            sys.stdout.flush()
+        else:
+            print("═" * (self.width + self.indent * 2))
+            print(
+                "[bold yellow]The answer was cut off, generating it again.[/bold yellow]"
+            )
+            print()
+        self.rendered = False
+        self.printed_lines = 0
+        self.rendered_subject = ""
+        self.rendered_description = []
+
+    def shows(self, commit_message):
+        """
+        Returns True when the rendered answer is exactly `commit_message`.
+        """
+        return self.rendered and commit_message == self.acw.build_commit_message(
+            {
+                "subject": self.rendered_subject,
+                "description": self.rendered_description,
+            }
+        )
+
+
+class DiffPager:
+    """
+    Paged viewer of the collected diff lines. Only the visible window is sliced and highlighted,
+    so opening it takes the same time for any diff size.
+    """
+
+    def __init__(self, lines, height=None, read_key=None, console=None) -> None:
+        import shutil
+
+        self.lines = lines
+        # 마지막 줄은 상태 표시줄로 사용한다
+        self.height = height or max(1, shutil.get_terminal_size().lines - 1)
+        self.read_key = read_key
+        self.console = console
+        self.top = 0
+
+    def run(self):
+        from rich.console import Console
+
+        if self.read_key is None:
+            import readchar
+
+            self.read_key = readchar.readkey
+        if self.console is None:
+            self.console = Console()
+        while True:
+            self.render()
+            if not self.handle_key(self.read_key()):
+                return
+
+    def handle_key(self, key):
+        """
+        Moves the window for `key`. Returns False when the viewer should close.
+        """
+        import readchar
+
+        last_top = max(0, len(self.lines) - self.height)
+        if key in ("q", readchar.key.ESC):
+            return False
+        if key in (" ", "f", readchar.key.PAGE_DOWN):
+            self.top = min(last_top, self.top + self.height)
+        elif key in ("b", readchar.key.PAGE_UP):
+            self.top = max(0, self.top - self.height)
+        elif key in ("j", readchar.key.DOWN, readchar.key.ENTER):
+            self.top = min(last_top, self.top + 1)
+        elif key in ("k", readchar.key.UP):
+            self.top = max(0, self.top - 1)
+        elif key in ("g", readchar.key.HOME):
+            self.top = 0
+        elif key in ("G", readchar.key.END):
+            self.top = last_top
+        elif key == "/":
+            self.search(self.console.input("/"))
+        return True
+
+    def search(self, text):
+        """
+        Moves the window to the next line containing `text`, wrapping around at the end.
+        """
+        if not text:
+            return
+        line_count = len(self.lines)
+        for offset in range(1, line_count + 1):
+            index = (self.top + offset) % line_count
+            if text in self.lines[index]:
+                self.top = index
+                return
+
+    def render(self):
+        from rich.syntax import Syntax
+
+        window = self.lines[self.top : self.top + self.height]
+        self.console.clear()
+        self.console.print(
+            Syntax("\n".join(window), "diff", theme="ansi_dark", word_wrap=False),
+            crop=True,
+            soft_wrap=False,
+        )
+        bottom = self.top + len(window)
+        self.console.print(
+            f"[reverse] lines {self.top + 1}-{bottom} of {len(self.lines)}"
+            " (space/b: page, j/k: line, g/G: top/end, /: search, q: quit) [/reverse]",
+            end="",
+        )
+
+
+class DaemonStreamWriter:
+    """
+    Stream renderer of the daemon: forwards the streamed chunks to the client instead of printing them.
+    """
+
+    def __init__(self, send) -> None:
+        self.send = send
+
+    def render(self, chunks):
+        contents = []
+        for chunk in chunks:
+            contents.append(chunk)
+            self.send({"chunk": chunk})
+        return "".join(contents)
+
+
+class FileTree:
+    """
+    Sorted paths used as a lazily expanded directory tree, with a prefix and a substring index for filtering.
+    The files under a directory are a contiguous range of the sorted list, found with binary search,
+    so opening a directory only visits its direct children.
+    """
+
+    def __init__(self, paths) -> None:
+        self.paths = sorted(paths)
+        # 모든 경로를 한 줄씩 이어 붙인 문자열에서 str.find 로 부분 문자열을 찾는다
+        self.lowered_text = "\n".join(self.paths).lower()
+        self.offsets = []
+        offset = 0
+        for path in self.paths:
+            self.offsets.append(offset)
+            offset += len(path) + 1
+
+    def get_range(self, directory):
+        """
+        Returns the [start, end) range of the paths under `directory` ("" for the root, otherwise ending with '/').
+        """
+        if not directory:
+            return 0, len(self.paths)
+        # '0' 은 '/' 바로 다음 문자라서 'dir0' 은 'dir/' 로 시작하는 모든 경로보다 뒤에 온다
+        start = bisect_left(self.paths, directory)
+        return start, bisect_left(self.paths, directory[:-1] + "0", start)
+
+    def get_children(self, directory):
+        """
+        Returns the ([(sub directory, file count)], [file path]) direct children of `directory`.
+        """
+        start, end = self.get_range(directory)
+        directories, files = [], []
+        index = start
+        while index < end:
+            name, slash, _ = self.paths[index][len(directory) :].partition("/")
+            if slash:
+                sub_directory = directory + name + "/"
+                sub_end = bisect_left(self.paths, directory + name + "0", index, end)
+                directories.append((sub_directory, sub_end - index))
+                index = sub_end
+            else:
+                files.append(self.paths[index])
+                index += 1
+        return directories, files
+
+    def get_files(self, directory):
+        start, end = self.get_range(directory)
+        return self.paths[start:end]
+
+    def search(self, query, limit):
+        """
+        Returns up to `limit` paths starting with `query`, followed by the paths containing it (case-insensitive).
+        """
+        if not query:
+            return []
+        result = []
+        start = bisect_left(self.paths, query)
+        for path in self.paths[start : start + limit]:
+            if not path.startswith(query):
+                break
+            result.append(path)
+        seen = set(result)
+        lowered_query = query.lower()
+        position = self.lowered_text.find(lowered_query)
+        while position != -1 and len(result) < limit:
+            index = bisect_right(self.offsets, position) - 1
+            if self.paths[index] not in seen:
+                result.append(self.paths[index])
+            if index + 1 == len(self.paths):
+                break
+            # 같은 경로에서 여러 번 찾지 않도록 다음 경로부터 찾는다
+            position = self.lowered_text.find(lowered_query, self.offsets[index + 1])
+        return result
+
+
+class TreeFilePicker:
+    """
+    File picker for long file lists: browses the directory tree one level at a time,
+    selects whole directories and filters the files by typed text.
+    """
+
+    def __init__(self, message, file_name_list, page_limit=500) -> None:
+        self.message = message
+        self.file_name_list = file_name_list
+        self.tree = FileTree(file_name_list)
+        self.page_limit = page_limit
+        self.selected = set()
+
+    def pick(self):
+        directory = ""
+        while True:
+            action = self.ask_browse(directory)
+            if action == "done":
+                return [path for path in self.file_name_list if path in self.selected]
+            if action == "up":
+                directory = directory[: directory[:-1].rfind("/") + 1]
+            elif action == "select":
+                self.ask_select(directory)
+            elif action == "filter":
+                self.ask_filter()
+            else:
+                directory = action
+
+    def prompt(self, question):
+        import inquirer
+
+        return inquirer.prompt([question])["answer"]
+
+    def count_selected(self, directory):
+        return sum(
+            1 for path in self.tree.get_files(directory) if path in self.selected
+        )
+
+    def ask_browse(self, directory):
+        import inquirer
+
+        sub_directories, files = self.tree.get_children(directory)
+        choices = [(f"Done ({len(self.selected)} selected)", "done")]
+        if directory:
+            choices.append(("..", "up"))
+        choices.append(("Filter by name", "filter"))
+        choices.append((f"Select in {directory or './'}", "select"))
+        for sub_directory, file_count in sub_directories:
+            choices.append(
+                (
+                    f"{sub_directory} ({self.count_selected(sub_directory)}/{file_count})",
+                    sub_directory,
+                )
+            )
+        return self.prompt(
+            inquirer.List(
+                "answer",
+                message=f"{self.message} {directory or './'} ({len(files)} files here)",
+                choices=choices,
+                carousel=True,
+            )
+        )
+
+    def ask_select(self, directory):
+        """
+        Checkbox of the direct children: checking a directory selects every file under it.
+        """
+        import inquirer
+
+        sub_directories, files = self.tree.get_children(directory)
+        choices, default = [], []
+        for sub_directory, file_count in sub_directories:
+            choices.append((f"{sub_directory} (all {file_count} files)", sub_directory))
+            if self.count_selected(sub_directory) == file_count:
+                default.append(sub_directory)
+        shown_files = files[: self.page_limit]
+        choices += [(path[len(directory) :], path) for path in shown_files]
+        default += [path for path in shown_files if path in self.selected]
+        message = f"{self.message} {directory or './'}"
+        if len(files) > len(shown_files):
+            message += (
+                f" (first {len(shown_files)} of {len(files)} files, filter to see more)"
+            )
+        answer = set(
+            self.prompt(
+                inquirer.Checkbox(
+                    "answer",
+                    message=message,
+                    choices=choices,
+                    default=default,
+                    carousel=True,
+                )
+            )
+        )
+        for sub_directory, _ in sub_directories:
+            if sub_directory in answer:
+                self.selected.update(self.tree.get_files(sub_directory))
+            elif sub_directory in default:
+                # 일부만 선택된 directory 는 체크하지 않아도 그대로 둔다
+                self.selected.difference_update(self.tree.get_files(sub_directory))
+        self.apply_file_answer(shown_files, answer)
+
+    def ask_filter(self):
+        import inquirer
+
+        query = self.prompt(inquirer.Text("answer", message="Filter"))
+        matched_files = self.tree.search(query.strip(), self.page_limit)
+        if not matched_files:
+            return
+        answer = set(
+            self.prompt(
+                inquirer.Checkbox(
+                    "answer",
+                    message=f"{self.message} matching '{query.strip()}'",
+                    choices=matched_files,
+                    default=[path for path in matched_files if path in self.selected],
+                    carousel=True,
+                )
+            )
+        )
+        self.apply_file_answer(matched_files, answer)
+
+    def apply_file_answer(self, shown_files, answer):
+        for path in shown_files:
+            if path in answer:
+                self.selected.add(path)
+            else:
+                self.selected.discard(path)
+
+
+class CommitMessageFormatError(ValueError):
+    pass
+
+
+class SpeculationCancelled(Exception):
+    pass
+
+
+class SpeculativeCommitMessage:
+    """
+    Reads the diffs of every candidate file and, optionally, generates the commit message for all of them
+    in the background while the user is still selecting files.
+    The streamed chunks are buffered so that they can be replayed when the user selects every file.
+    """
+
+    def __init__(self, acw, untracked, modified, generate=True) -> None:
+        self.acw = acw
+        self.untracked = list(untracked)
+        self.modified = list(modified)
+        self.generate = generate
+        self.file_diffs = Future()
+        self.content = Future()
+        self.chunks = []
+        self.done = False
+        self.condition = threading.Condition()
+        self.cancelled = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def run(self):
+        try:
+            with self.acw.profiler.phase("speculative read_file_diff"):
+                file_diffs = list(
+                    chain(
+                        self.acw.iter_file_diffs(self.untracked, False),
+                        self.acw.iter_file_diffs(self.modified, True),
+                    )
+                )
+            self.file_diffs.set_result(file_diffs)
+            if not file_diffs or self.cancelled.is_set():
+                raise SpeculationCancelled()
+            if not self.generate:
+                # 생성까지 미리 하지 않을 때는 cache 에 없는 변경일 때만 model 을 준비해 둔다
+                self.acw.warm_up_provider_if_not_cached(file_diffs)
+                raise SpeculationCancelled()
+            with self.acw.profiler.phase("speculative generation"):
+                content = self.acw.generate_commit_message_json(
+                    self.untracked, self.modified, file_diffs, stream_renderer=self
+                )
+            if not self.chunks:
+                # 응답 cache 에서 가져온 경우
+                self.add_chunk(content)
+            self.content.set_result(content)
+        except Exception as e:
+            if not self.file_diffs.done():
+                self.file_diffs.set_exception(e)
+            self.content.set_exception(e)
+        finally:
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def render(self, chunks):
+        """
+        Stream renderer of the speculative request: buffers the chunks, stops reading when cancelled.
+        """
+        for chunk in chunks:
+            if self.cancelled.is_set():
+                # 예외로 끝내야 잘린 답이 응답 cache 에 저장되지 않는다
+                raise SpeculationCancelled()
+            self.add_chunk(chunk)
+        return "".join(self.chunks)
+
+    def discard(self):
+        """
+        Called when the daemon failed after streaming part of the answer. The buffered chunks can no longer
+        be replayed, so the speculation gives up and the message is generated again after the selection.
+        """
+        if self.chunks:
+            raise SpeculationCancelled()
+
+    def add_chunk(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def iter_chunks(self):
+        """
+        Yields the buffered chunks, then the following ones as they arrive.
+        """
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.done:
+                    self.condition.wait()
+                chunks = self.chunks[index:]
+                done = self.done
+            index += len(chunks)
+            yield from chunks
+            if done and index >= len(self.chunks):
+                return
+
+    def matches(self, untracked, modified):
+        return list(untracked) == self.untracked and list(modified) == self.modified
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def get_file_diffs(self, untracked, modified):
+        selected_files = set(untracked) | set(modified)
+        return [
+            (filename, lines)
+            for filename, lines in self.file_diffs.result()
+            if filename in selected_files
+        ]
+
+    def take(self, stream_renderer=None):
+        """
+        Returns the speculative commit message JSON, rendering the chunks with `stream_renderer` when given.
+        """
+        if stream_renderer:
+            stream_renderer.render(self.iter_chunks())
+        return self.content.result()
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answers one generation request of the 'acw serve' daemon.
+    The request and the responses are JSON objects, one per line.
+    """
+
+    def handle(self):
+        def send(message):
+            self.wfile.write(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+            self.wfile.write(b"\n")
+            self.wfile.flush()
+
+        try:
+            request = json.loads(self.rfile.readline())
+            send({"content": self.server.acw.handle_daemon_request(request, send)})
+        except Exception as e:
+            send({"error": str(e)})
+
+
+class ACW:
+    def __init__(self, check_subcommands=True, home_directory=None) -> None:
+        """
+        Initialize the command_map with the appropriate method references,
+        process the subcommands provided as arguments,
+        and call the corresponding method based on the input subcommand.
+        """
+        self.text_color = "light_slate_blue"
+        self.home_directory = os.path.expanduser("~")
+        if home_directory:
+            self.home_directory = home_directory
+        self.acw_config_path = self.home_directory + "/.acw"
+        self.commit_message_language = "English"
+        self.prompt_message = (
+            "You are a robot that only outputs JSON."
+            " "
+            "You will be provided with a piece of code."
+            " "
+            "Your task is to generate a commit message for it in a conventional commit message format."
+            " "
+            f"Use {self.commit_message_language} as the commit message language."
+            " "
+            "Subject should be like 'feat: add new feature'"
+            " "
+            "The description should be summarized as a maximum of 70 characters per row and a maximum of 5 lines."
+            " "
+            "Return as a JSON object with the keys 'subject' and 'description' (e.g., {'subject': '...', 'description': ['...', '...']})."
+        )
+        self.open_ai_temperature = 0
+        self.open_ai_top_p = 0.95
+        self.open_ai_max_tokens = 500
+        self.open_ai_frequency_penalty = 0
+        self.open_ai_presence_penalty = 0
+        self.open_ai_api_key = None
+        self.open_ai_base_url = None
+        self.ollama_host = None
+        self.ollama_keep_alive = "30m"
+        # 유저가 파일을 고르는 동안 model 과 연결을 미리 준비한다
+        self.warm_up_model = True
+        self.providers = {}
+        self.repository_status = None
+        # git 명령을 실행할 repository 경로 (None 이면 현재 디렉토리)
+        self.repository_path = None
+        # '--key=value' 형태로 입력받은 option
+        self.options = {}
+        # '--profile' 또는 '--trace-file' 이 있을 때만 단계별 시간을 기록한다
+        self.profiler = Profiler()
+        # False 이면 진행 상황을 출력하지 않는다 (acw batch 의 JSONL 출력을 깨끗하게 유지)
+        self.verbose = True
+        # rate limit 이나 일시적인 오류로 실패한 요청을 다시 보내는 횟수 (acw batch 에서 사용)
+        self.max_retries = 0
+        self.retry_base_delay = 1.0
+        self.retry_max_delay = 60.0
+        self.retry_count = 0
+        self.batch_concurrency = 4
+        self.batch_max_retries = 5
+        # untracked 파일은 이 크기까지만 읽고, 넘으면 앞뒤 일부만 prompt 에 넣는다
+        self.untracked_file_max_bytes = 32 * 1024
+        # git 과 같이 앞부분 8000 byte 에 NUL 이 있으면 binary 파일로 본다
+        self.binary_sniff_bytes = 8000
+        # 한 번의 git diff 에 넘기는 pathspec 개수 (ARG_MAX 를 넘지 않도록 나눠서 실행)
+        self.diff_pathspec_chunk_size = 1000
+        # prompt 에 들어가는 diff 의 최대 token 수와 hunk 주변에 남길 context line 수
+        self.prompt_token_budget = 6000
+        self.diff_context_lines = 1
+        # 자동 생성되거나 vendoring 된 파일은 prompt 에서 제외
+        self.generated_file_name_patterns = [
+            "*.lock",
+            "package-lock.json",
+            "npm-shrinkwrap.json",
+            "pnpm-lock.yaml",
+            "go.sum",
+            "*.min.js",
+            "*.min.css",
+            "*.map",
+            "*.pb.go",
+            "*_pb2.py",
+        ]
+        self.vendored_directory_names = {"vendor", "node_modules", "third_party"}
+        # 변경된 파일이 많으면 chunk 단위로 요약(map)한 뒤 하나의 커밋 메시지로 합친다(reduce)
+        # threshold 가 0 이면 map-reduce 를 사용하지 않는다
+        self.map_reduce_file_threshold = 50
+        self.map_reduce_chunk_by = "directory"
+        self.map_reduce_chunk_tokens = 3000
+        self.map_reduce_concurrency = 4
+        self.map_prompt_message = self.build_map_prompt_message()
+        # 같은 diff 로 다시 실행하면 저장된 응답을 재사용 ('--no-cache' 로 끌 수 있음)
+        self.use_response_cache = True
+        self.cache_directory = self.home_directory + "/.acw_cache"
+        self.response_cache_max_bytes = 20 * 1024 * 1024
+        # 파일별 요약은 blob id 가 바뀐 파일만 다시 요청한다
+        self.summary_cache_max_bytes = 5 * 1024 * 1024
+        self.summary_cache_max_age_days = 30
+        # 모델 출력을 받는 대로 화면에 보여준다
+        self.stream_output = True
+        # 2 이상이면 여러 개의 커밋 메시지를 동시에 생성해서 유저가 고르게 한다
+        self.candidate_count = 1
+        # OPEN_AI_TEMPERATURE 가 0 이면 후보가 모두 같아지므로 후보를 만들 때는 이 값 이상을 쓴다
+        self.candidate_temperature = 0.8
+        # 파일이 이보다 많으면 directory tree 로 나눠서 고르게 한다
+        self.tree_picker_threshold = 200
+        # 유저가 파일을 고르는 동안 모든 후보 파일의 diff 를 읽는다
+        self.speculative_file_limit = 1000
+        # 켜면 커밋 메시지도 미리 생성한다. 고르기 전에 모든 변경 (untracked 파일 포함) 을 model 에 보내므로 기본으로 끈다
+        self.speculative_generation = False
+        # 지원하는 model 은 JSON 으로만 답하도록 강제한다 (OpenAI response_format, Ollama format)
+        self.json_output = True
+        self.repair_prompt_message = (
+            "You will be provided with an answer that should have been a commit message JSON object."
+            " "
+            "Output only the JSON object with the keys 'subject' (string) and 'description' (array of strings),"
+            " "
+            "keeping the original wording."
+        )
+        # MODEL 이 hedge_delay_seconds 안에 답하지 않거나 실패하면 HEDGE_MODEL 에도 같은 요청을 보낸다
+        self.hedge_model = ""
+        self.hedge_delay_seconds = 3.0
+        # 두 요청 모두 이 시간 안에 답하지 않으면 둘 다 멈추고 TimeoutError 를 낸다
+        self.hedge_timeout_seconds = 120.0
+        # 선택한 파일을 관련 있는 것끼리 나눠서 여러 커밋으로 만든다 ('--split' 으로도 켤 수 있음)
+        self.split_commits = False
+        self.split_file_limit = 200
+        self.split_history_commits = 500
+        # 파일을 이보다 많이 바꾼 커밋은 (대량 rename, formatting 등) 같이 바뀐 횟수에 넣지 않는다
+        self.split_history_max_files = 50
+        # 비슷한 파일을 바꾼 과거 커밋 제목을 prompt 에 예시로 넣어 저장소의 커밋 스타일을 따르게 한다 (0 이면 끔)
+        self.history_example_count = 3
+        # 처음 색인할 때는 최근 커밋만 읽는다 (수십만 커밋의 git log --name-only 는 수십 초 걸림)
+        self.history_index_max_commits = 20000
+        # repository 경로 -> 색인 파일 경로 (copy.copy 한 worker 와 공유)
+        self.history_index_paths = {}
+        # (cache 경로, 크기) -> ResponseCache (copy.copy 한 worker 와 공유)
+        self.response_caches = {}
+        # 'acw serve' 가 실행 중이면 커밋 메시지 생성을 daemon 에 맡긴다
+        self.use_daemon = True
+        self.daemon_socket_path = self.cache_directory + "/acw.sock"
+        self.config_mtime = None
+        self.config_lock = threading.Lock()
+        self.hook_timeout_seconds = 10.0
+        # daemon 이 이 시간 동안 아무것도 보내지 않으면 멈춘 것으로 보고 직접 생성한다
+        self.daemon_timeout_seconds = 30.0
+
+        if check_subcommands:
+            self.run_subcommands(sys.argv[1:])
+
+    def run_subcommands(self, arguments):
+        """
+        Applies the options and calls the method of the input subcommand from the command_map.
+        """
+        options = [argument for argument in arguments if argument.startswith("--")]
+        subcommands = [
+            argument for argument in arguments if not argument.startswith("--")
+        ]
+        for option in options:
+            name, has_value, value = option[2:].partition("=")
+            if name not in (
+                "no-cache",
+                "range",
+                "output",
+                "concurrency",
+                "profile",
+                "trace-file",
+                "split",
+            ):
+                print("Unknown option: " + option)
+                sys.exit(1)
+            self.options[name] = value if has_value else True
+        if "no-cache" in self.options:
+            self.use_response_cache = False
+        if "profile" in self.options or "trace-file" in self.options:
+            self.profiler = Profiler(enabled=True)
+
+        try:
+            self.run_subcommand(subcommands)
+        finally:
+            if "profile" in self.options:
+                self.profiler.print_summary(self.providers.values())
+            if "trace-file" in self.options:
+                self.profiler.write_trace(self.options["trace-file"])
+
+    def run_subcommand(self, subcommands):
+        if len(subcommands) == 0:
+            # 'acw' 만 입력한 경우
+            self.commit()
+            return
+        # subcommand 별로 (실행할 method, 받을 수 있는 인자 개수)
+        command_map = {
+            "config": (lambda: self.config(edit_config=True), 0),
+            "commit": (self.commit, 0),
+            "cache": (self.cache, 1),
+            "batch": (self.batch, math.inf),
+            "serve": (self.serve, 0),
+            "prepare-commit-msg": (self.prepare_commit_msg, 3),
+        }
+        if subcommands[0] not in command_map:
+            # 모르는 subcommand 는 무시하도록 처리
+            print("Unknown command")
+            sys.exit(1)
+        command, max_argument_count = command_map[subcommands[0]]
+        if len(subcommands) - 1 > max_argument_count:
+            print("Too many arguments")
+            sys.exit(1)
+        command(*subcommands[1:])
+
+    def config(self, edit_config=False):
+        exist = (
+            os.path.exists(self.acw_config_path)
+            and os.path.isfile(self.acw_config_path)
+            and os.access(self.acw_config_path, os.R_OK)
+            and os.path.getsize(self.acw_config_path) > 0
+        )
+        if exist:
+            self.current_config_map = {}
+            with open(self.acw_config_path, "rb") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        k, v = line.split(b"=")
+                        self.current_config_map[k.decode("utf-8")] = v.decode("utf-8")
+            if edit_config:
+                for k, v in self.current_config_map.items():
+                    print('Current value of "{0}": "{1}"'.format(k, v))
+                    new_value = input(
+                        "Enter a new value or press Enter to keep the current value: "
+                    )
+                    if new_value:
+                        self.current_config_map[k] = new_value
+                    print()
+                with open(self.acw_config_path, "wb") as f:
+                    for k, v in self.current_config_map.items():
+                        f.write(k.encode("utf-8"))
+                        f.write(b"=")
+                        f.write(str(v).encode("utf-8"))
                         f.write(b"\n")
             return
         else:
@@ -126,250 +1843,2011 @@ class ACW:
                 Constants.COMMIT_MESSAGE_LANGUAGE.name: self.commit_message_language,
                 Constants.PROMPT_MESSAGE.name: self.prompt_message,
             }
-            if self.model == Models.GPT_3_5_TURBO.name:
-                open_ai_api_key = input("Enter your OpenAI API key: ")
-                config_map[Constants.OPEN_AI_API_KEY.name] = open_ai_api_key
-                config_map[Constants.OPEN_AI_TEMPERATURE.name] = (
-                    self.open_ai_temperature
+            self.get_provider().ask_initial_config(config_map)
+            with open(self.acw_config_path, "wb") as f:
+                for k, v in config_map.items():
+                    f.write(k.encode("utf-8"))
+                    f.write(b"=")
+                    f.write(str(v).encode("utf-8"))
+                    f.write(b"\n")
+
+    def choose_model(self):
+        import inquirer
+
+        key = "confirm"
+        questions = [
+            inquirer.List(
+                key,
+                message="Select the models you want to use.",
+                choices=[
+                    name + "---(" + description + ")"
+                    for name, (_, _, description) in MODEL_REGISTRY.items()
+                ],
+            )
+        ]
+        return inquirer.prompt(questions)[key].split("---")[0].lstrip()
+
+    def set_properties_from_current_config_map(self):
+        self.model = self.current_config_map[Constants.MODEL.name]
+        current_config_map_commit_message_language = self.current_config_map.get(
+            Constants.COMMIT_MESSAGE_LANGUAGE.name, ""
+        )
+        current_config_map_prompt_message = self.current_config_map.get(
+            Constants.PROMPT_MESSAGE.name, ""
+        )
+        if (
+            len(current_config_map_commit_message_language) > 0
+            and len(current_config_map_prompt_message) > 0
+        ):
+            self.commit_message_language = current_config_map_commit_message_language
+            self.prompt_message = current_config_map_prompt_message
+            self.map_prompt_message = self.build_map_prompt_message()
+        self.prompt_token_budget = int(
+            self.current_config_map.get(
+                Constants.PROMPT_TOKEN_BUDGET.name, self.prompt_token_budget
+            )
+        )
+        self.diff_context_lines = int(
+            self.current_config_map.get(
+                Constants.DIFF_CONTEXT_LINES.name, self.diff_context_lines
+            )
+        )
+        self.open_ai_api_key = self.current_config_map.get(
+            Constants.OPEN_AI_API_KEY.name, self.open_ai_api_key
+        )
+        self.open_ai_temperature = float(
+            self.current_config_map.get(
+                Constants.OPEN_AI_TEMPERATURE.name, self.open_ai_temperature
+            )
+        )
+        self.open_ai_top_p = float(
+            self.current_config_map.get(
+                Constants.OPEN_AI_TOP_P.name, self.open_ai_top_p
+            )
+        )
+        self.open_ai_max_tokens = int(
+            self.current_config_map.get(
+                Constants.OPEN_AI_MAX_TOKENS.name, self.open_ai_max_tokens
+            )
+        )
+        self.open_ai_frequency_penalty = float(
+            self.current_config_map.get(
+                Constants.OPEN_AI_FREQUENCY_PENALTY.name,
+                self.open_ai_frequency_penalty,
+            )
+        )
+        self.open_ai_presence_penalty = float(
+            self.current_config_map.get(
+                Constants.OPEN_AI_PRESENCE_PENALTY.name, self.open_ai_presence_penalty
+            )
+        )
+        self.open_ai_base_url = self.current_config_map.get(
+            Constants.OPEN_AI_BASE_URL.name, self.open_ai_base_url
+        )
+        self.ollama_host = self.current_config_map.get(
+            Constants.OLLAMA_HOST.name, self.ollama_host
+        )
+        self.ollama_keep_alive = self.current_config_map.get(
+            Constants.OLLAMA_KEEP_ALIVE.name, self.ollama_keep_alive
+        )
+        self.warm_up_model = (
+            self.current_config_map.get(
+                Constants.WARM_UP_MODEL.name, str(self.warm_up_model)
+            ).lower()
+            == "true"
+        )
+        self.batch_concurrency = int(
+            self.current_config_map.get(
+                Constants.BATCH_CONCURRENCY.name, self.batch_concurrency
+            )
+        )
+        self.batch_max_retries = int(
+            self.current_config_map.get(
+                Constants.BATCH_MAX_RETRIES.name, self.batch_max_retries
+            )
+        )
+        self.use_daemon = (
+            self.current_config_map.get(
+                Constants.USE_DAEMON.name, str(self.use_daemon)
+            ).lower()
+            == "true"
+        )
+        self.hook_timeout_seconds = float(
+            self.current_config_map.get(
+                Constants.HOOK_TIMEOUT_SECONDS.name, self.hook_timeout_seconds
+            )
+        )
+        self.daemon_timeout_seconds = float(
+            self.current_config_map.get(
+                Constants.DAEMON_TIMEOUT_SECONDS.name, self.daemon_timeout_seconds
+            )
+        )
+        self.untracked_file_max_bytes = int(
+            self.current_config_map.get(
+                Constants.UNTRACKED_FILE_MAX_BYTES.name, self.untracked_file_max_bytes
+            )
+        )
+        self.map_reduce_file_threshold = int(
+            self.current_config_map.get(
+                Constants.MAP_REDUCE_FILE_THRESHOLD.name,
+                self.map_reduce_file_threshold,
+            )
+        )
+        self.map_reduce_chunk_by = self.current_config_map.get(
+            Constants.MAP_REDUCE_CHUNK_BY.name, self.map_reduce_chunk_by
+        )
+        self.map_reduce_chunk_tokens = int(
+            self.current_config_map.get(
+                Constants.MAP_REDUCE_CHUNK_TOKENS.name, self.map_reduce_chunk_tokens
+            )
+        )
+        self.map_reduce_concurrency = int(
+            self.current_config_map.get(
+                Constants.MAP_REDUCE_CONCURRENCY.name, self.map_reduce_concurrency
+            )
+        )
+        self.response_cache_max_bytes = int(
+            self.current_config_map.get(
+                Constants.RESPONSE_CACHE_MAX_BYTES.name, self.response_cache_max_bytes
+            )
+        )
+        self.summary_cache_max_bytes = int(
+            self.current_config_map.get(
+                Constants.SUMMARY_CACHE_MAX_BYTES.name, self.summary_cache_max_bytes
+            )
+        )
+        self.summary_cache_max_age_days = float(
+            self.current_config_map.get(
+                Constants.SUMMARY_CACHE_MAX_AGE_DAYS.name,
+                self.summary_cache_max_age_days,
+            )
+        )
+        self.speculative_generation = (
+            self.current_config_map.get(
+                Constants.SPECULATIVE_GENERATION.name, str(self.speculative_generation)
+            ).lower()
+            == "true"
+        )
+        self.json_output = (
+            self.current_config_map.get(
+                Constants.JSON_OUTPUT.name, str(self.json_output)
+            ).lower()
+            == "true"
+        )
+        self.hedge_model = self.current_config_map.get(
+            Constants.HEDGE_MODEL.name, self.hedge_model
+        )
+        self.hedge_delay_seconds = float(
+            self.current_config_map.get(
+                Constants.HEDGE_DELAY_SECONDS.name, self.hedge_delay_seconds
+            )
+        )
+        self.hedge_timeout_seconds = float(
+            self.current_config_map.get(
+                Constants.HEDGE_TIMEOUT_SECONDS.name, self.hedge_timeout_seconds
+            )
+        )
+        self.split_commits = (
+            self.current_config_map.get(
+                Constants.SPLIT_COMMITS.name, str(self.split_commits)
+            ).lower()
+            == "true"
+        )
+        self.history_example_count = int(
+            self.current_config_map.get(
+                Constants.HISTORY_EXAMPLE_COUNT.name, self.history_example_count
+            )
+        )
+        self.stream_output = (
+            self.current_config_map.get(
+                Constants.STREAM_OUTPUT.name, str(self.stream_output)
+            ).lower()
+            == "true"
+        )
+        self.candidate_count = int(
+            self.current_config_map.get(
+                Constants.CANDIDATE_COUNT.name, self.candidate_count
+            )
+        )
+        self.candidate_temperature = float(
+            self.current_config_map.get(
+                Constants.CANDIDATE_TEMPERATURE.name, self.candidate_temperature
+            )
+        )
+
+    def commit(self):
+        self.config()
+        self.set_properties_from_current_config_map()
+        self.repository_path = self.get_repository_root(self.repository_path)
+
+        with self.profiler.phase("file discovery"):
+            repository_status = self.get_repository_status()
+        speculation = self.start_speculation(repository_status)
+        with self.profiler.phase("select files"):
+            selected_unstaged_file_name_list = (
+                self.get_selected_unstaged_file_name_list()
+            )
+            selected_modified_file_name_list = (
+                self.get_selected_modified_file_name_list()
+            )
+        if speculation and not speculation.matches(
+            selected_unstaged_file_name_list, selected_modified_file_name_list
+        ):
+            speculation.cancel()
+
+        with self.profiler.phase("read_file_diff"):
+            file_diffs = None
+            if speculation:
+                try:
+                    file_diffs = speculation.get_file_diffs(
+                        selected_unstaged_file_name_list,
+                        selected_modified_file_name_list,
+                    )
+                except Exception:
+                    # 미리 읽지 못했으면 고른 파일만 다시 읽는다
+                    speculation = None
+            if file_diffs is None:
+                file_diffs = list(
+                    chain(
+                        self.iter_file_diffs(selected_unstaged_file_name_list, False),
+                        self.iter_file_diffs(selected_modified_file_name_list, True),
+                    )
+                )
+        diff_lines = [line for _, lines in file_diffs for line in lines]
+
+        self.validate_diff_lines(diff_lines)
+
+        if self.split_commits or "split" in self.options:
+            with self.profiler.phase("plan commits"):
+                groups = self.plan_commit_groups(file_diffs)
+            if len(groups) > 1 and self.confirm_commit_plan(groups):
+                if speculation:
+                    speculation.cancel()
+                self.commit_groups(groups, file_diffs)
+                self.git_push_if_needed()
+                return
+
+        if self.candidate_count > 1:
+            final_commit_message = self.select_commit_message_candidate(
+                self.start_commit_message_candidates(
+                    self.build_prompt_input(file_diffs)
+                ),
+                diff_lines,
+            )
+        else:
+            stream_renderer = None
+            if self.stream_output:
+                stream_renderer = CommitMessageStreamRenderer(self)
+
+            generated_commit_message_as_json_string = None
+            if speculation and not speculation.cancelled.is_set():
+                try:
+                    generated_commit_message_as_json_string = speculation.take(
+                        stream_renderer
+                    )
+                except Exception:
+                    # 미리 생성하지 못했으면 아래에서 다시 요청한다. 그리다 만 답은 지운다
+                    if stream_renderer:
+                        stream_renderer.discard()
+            if generated_commit_message_as_json_string is None:
+                generated_commit_message_as_json_string = (
+                    self.generate_commit_message_json(
+                        selected_unstaged_file_name_list,
+                        selected_modified_file_name_list,
+                        file_diffs,
+                        stream_renderer=stream_renderer,
+                    )
+                )
+
+            generated_commit_message = self.format_commit_message(
+                generated_commit_message_as_json_string
+            )
+
+            with self.profiler.phase("confirm"):
+                final_commit_message = self.confirm_commit_message(
+                    generated_commit_message,
+                    diff_lines,
+                    # 답을 고쳤거나 잘린 답을 이어 붙였으면 실제로 commit 할 메시지를 다시 보여준다
+                    print_message=not (
+                        stream_renderer
+                        and stream_renderer.shows(generated_commit_message)
+                    ),
+                )
+
+        with self.profiler.phase("git_add_files"):
+            self.git_add_files(
+                selected_unstaged_file_name_list + selected_modified_file_name_list
+            )
+
+        with self.profiler.phase("git_commit"):
+            self.git_commit(final_commit_message)
+        self.git_push_if_needed()
+
+    def plan_commit_groups(self, file_diffs):
+        """
+        Returns the selected file names grouped into logical commits by `CommitPlanner`.
+        """
+        if len(file_diffs) < 2 or len(file_diffs) > self.split_file_limit:
+            return [[filename for filename, _ in file_diffs]]
+        file_counts, pair_counts = self.read_co_changes(
+            [filename for filename, _ in file_diffs]
+        )
+        return CommitPlanner(file_diffs, file_counts, pair_counts).plan()
+
+    def read_co_changes(self, filenames):
+        """
+        Counts, over the last `split_history_commits` commits, how often each of `filenames`
+        and each (sorted) pair of them changed.
+        """
+        selected = set(filenames)
+        file_counts, pair_counts = {}, {}
+        output = subprocess.run(
+            GitCommand.LOG_NAMES.value + [f"-{self.split_history_commits}"],
+            cwd=self.repository_path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        ).stdout.decode("utf-8", "surrogateescape")
+        for commit in output.split("\0"):
+            changed = [line for line in commit.split("\n") if line]
+            if len(changed) > self.split_history_max_files:
+                continue
+            changed = sorted(selected.intersection(changed))
+            for index, first in enumerate(changed):
+                file_counts[first] = file_counts.get(first, 0) + 1
+                for second in changed[index + 1 :]:
+                    pair_counts[(first, second)] = (
+                        pair_counts.get((first, second), 0) + 1
+                    )
+        return file_counts, pair_counts
+
+    def confirm_commit_plan(self, groups):
+        import inquirer
+
+        print(f"[bold {self.text_color}]Planned Commits[/bold {self.text_color}]")
+        for index, group in enumerate(groups, 1):
+            print(f"{index}. " + ", ".join(group))
+        print()
+        key = "split"
+        questions = [
+            inquirer.List(
+                key,
+                message="Shall we split the changes into these commits?",
+                choices=[
+                    f"Yes, make {len(groups)} commits.",
+                    "No, make one commit.",
+                ],
+            ),
+        ]
+        return inquirer.prompt(questions)[key].startswith("Yes")
+
+    def commit_groups(self, groups, file_diffs):
+        """
+        Generates the messages of all the groups in one request, then stages and commits each group in order.
+        """
+        diffs = dict(file_diffs)
+        commit_messages = self.generate_split_commit_messages(groups, file_diffs)
+        for group, commit_message in zip(groups, commit_messages):
+            with self.profiler.phase("confirm"):
+                final_commit_message = self.confirm_commit_message(
+                    commit_message,
+                    [line for filename in group for line in diffs[filename]],
+                )
+            with self.profiler.phase("git_add_files"):
+                self.git_add_files(group)
+            with self.profiler.phase("git_commit"):
+                self.git_commit(final_commit_message, group)
+
+    def generate_split_commit_messages(self, groups, file_diffs):
+        """
+        Returns one formatted commit message per group, generated in a single request.
+        Falls back to one request per group when the answer does not have a valid message for every group.
+        """
+        diffs = dict(file_diffs)
+        if self.should_use_map_reduce(file_diffs):
+            sections = [
+                self.build_prompt_input(
+                    [(filename, diffs[filename]) for filename in group]
+                )
+                for group in groups
+            ]
+        else:
+            # token 예산은 그룹마다가 아니라 요청 전체에 적용한다
+            compacted = dict(self.compact_file_diffs(file_diffs))
+            sections = [
+                self.parse_diff_lines_to_single_string(
+                    line
+                    for filename in group
+                    if filename in compacted
+                    for line in compacted[filename]
+                )
+                for group in groups
+            ]
+        with self.profiler.phase("generate_split_commit_messages"):
+            content = self.request_chat_completion(
+                self.build_split_prompt_message(),
+                "\n".join(
+                    f"### Group {index}\n{section}"
+                    for index, section in enumerate(sections, 1)
+                ),
+                json_output=True,
+            )
+        answer = self.extract_json_object(content)
+        commits = answer.get("commits") if isinstance(answer, dict) else None
+        commit_message_jsons = (
+            [self.validate_commit_message(commit) for commit in commits]
+            if isinstance(commits, list)
+            else []
+        )
+        if len(commit_message_jsons) != len(groups) or None in commit_message_jsons:
+            commit_message_jsons = [
+                self.parse_commit_message(
+                    self.generate_commit_message_using_prompt(section)
+                )
+                for section in sections
+            ]
+        return [
+            self.build_commit_message(commit_message_json)
+            for commit_message_json in commit_message_jsons
+        ]
+
+    def build_split_prompt_message(self):
+        return (
+            "You are a robot that only outputs JSON."
+            " "
+            "You will be provided with several groups of code changes, each starting with a line like '### Group 1'."
+            " "
+            "Your task is to generate one commit message for each group in a conventional commit message format."
+            " "
+            f"Use {self.commit_message_language} as the commit message language."
+            " "
+            "Subject should be like 'feat: add new feature'"
+            " "
+            "The description should be summarized as a maximum of 70 characters per row and a maximum of 5 lines."
+            " "
+            "Return as a JSON object with the key 'commits', a list with one object with the keys 'subject' and 'description' per group in the same order"
+            " "
+            "(e.g., {'commits': [{'subject': '...', 'description': ['...']}]})."
+        )
+
+    def start_speculation(self, repository_status):
+        """
+        Starts reading the diffs of every candidate file in the background while the user selects files.
+        Unless disabled, the commit message for selecting all of them is generated as well.
+        """
+        candidate_count = len(repository_status.untracked) + len(
+            repository_status.modified
+        )
+        if candidate_count == 0 or candidate_count > self.speculative_file_limit:
+            return None
+        # picker 가 화면을 쓰는 동안 출력하지 않도록 조용한 복사본에서 실행한다
+        worker = copy.copy(self)
+        worker.verbose = False
+        return SpeculativeCommitMessage(
+            worker,
+            repository_status.untracked,
+            repository_status.modified,
+            generate=self.speculative_generation and self.candidate_count == 1,
+        ).start()
+
+    def generate_commit_message_json(
+        self, untracked, modified, file_diffs, stream_renderer=None
+    ):
+        """
+        Returns the commit message JSON for the selected files, from the 'acw serve' daemon when it is running.
+        """
+        generated_commit_message_as_json_string = self.request_daemon(
+            {
+                "repository": os.path.abspath(self.repository_path or "."),
+                "untracked": untracked,
+                "modified": modified,
+                "no_cache": not self.use_response_cache,
+                "stream": stream_renderer is not None,
+            },
+            stream_renderer=stream_renderer,
+            timeout=self.daemon_timeout_seconds,
+        )
+        if generated_commit_message_as_json_string is None:
+            if stream_renderer:
+                stream_renderer.discard()
+            parsed_diff_line = self.build_prompt_input(file_diffs)
+            with self.profiler.phase("generate_commit_message_using_prompt"):
+                generated_commit_message_as_json_string = (
+                    self.generate_commit_message_using_prompt(
+                        parsed_diff_line, stream_renderer=stream_renderer
+                    )
+                )
+        return generated_commit_message_as_json_string
+
+    def build_prompt_input(self, file_diffs):
+        """
+        Turns the file diffs into the user message of the generation request,
+        summarizing them with map-reduce when the changeset is too large.
+        """
+        if self.should_use_map_reduce(file_diffs):
+            with self.profiler.phase("map-reduce summaries"):
+                prompt_input = self.summarize_file_diffs_with_map_reduce(file_diffs)
+        else:
+            with self.profiler.phase("parse_diff_lines_to_single_string"):
+                compacted_file_diffs = self.compact_file_diffs(file_diffs)
+                prompt_input = self.parse_diff_lines_to_single_string(
+                    line for _, lines in compacted_file_diffs for line in lines
+                )
+        with self.profiler.phase("commit history examples"):
+            subjects = self.find_similar_commit_subjects(file_diffs)
+        if not subjects:
+            return prompt_input
+        return (
+            "Past commit messages of this repository for similar changes (follow their style):\n"
+            + "\n".join(f"- {subject}" for subject in subjects)
+            + "\n\n"
+            + prompt_input
+        )
+
+    def get_commit_history_index(self):
+        repository_path = os.path.abspath(self.repository_path or ".")
+        if repository_path not in self.history_index_paths:
+            # worktree 들이 같은 색인을 쓰도록 공통 .git directory 로 구분한다
+            git_directory = subprocess.run(
+                GitCommand.GIT_COMMON_DIR.value,
+                cwd=repository_path,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            ).stdout.strip()
+            self.history_index_paths[repository_path] = os.path.join(
+                self.cache_directory,
+                "history",
+                hashlib.sha1(git_directory).hexdigest() + ".sqlite",
+            )
+        return CommitHistoryIndex(
+            self.history_index_paths[repository_path], self.history_index_max_commits
+        )
+
+    def find_similar_commit_subjects(self, file_diffs):
+        """
+        Updates the commit history index of the repository with the new commits
+        and returns the subjects of the past commits most similar to `file_diffs`.
+        """
+        if self.history_example_count <= 0:
+            return []
+        try:
+            history_index = self.get_commit_history_index()
+            history_index.update(self.repository_path)
+            return history_index.search(
+                [filename for filename, _ in file_diffs],
+                "\n".join(
+                    line
+                    for _, lines in file_diffs
+                    for line in lines
+                    if line[:1] in "+-"
+                ),
+                self.history_example_count,
+            )
+        except sqlite3.Error:
+            # 예시는 없어도 되므로 색인을 쓸 수 없으면 (FTS5 없는 sqlite, 잠긴 파일 등) 건너뛴다
+            return []
+
+    def batch(self, *repository_paths):
+        """
+        'acw batch [--range=A..B] [--output=FILE] [--concurrency=N] [REPOSITORY ...]'
+        generates commit messages without any prompt and writes one JSON line per item.
+        With --range every commit of the range is an item, otherwise the working tree changes of each repository.
+        """
+        if not os.path.isfile(self.acw_config_path):
+            print("[bold red]Run 'acw config' before 'acw batch'.[/bold red]")
+            sys.exit(1)
+        self.config()
+        self.set_properties_from_current_config_map()
+        self.verbose = False
+        self.max_retries = self.batch_max_retries
+        # --range 로 다시 만드는 커밋의 원래 메시지가 예시로 들어가지 않도록 한다
+        self.history_example_count = 0
+        repository_paths = repository_paths or (".",)
+        commit_range = self.options.get("range")
+        if commit_range:
+            items = [
+                (repository_path, commit)
+                for repository_path in repository_paths
+                for commit in self.list_commits(repository_path, commit_range)
+            ]
+        else:
+            items = [(repository_path, None) for repository_path in repository_paths]
+        concurrency = int(self.options.get("concurrency", self.batch_concurrency))
+
+        output = sys.stdout
+        if "output" in self.options:
+            output = open(self.options["output"], "w")
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+                futures = [
+                    executor.submit(self.generate_batch_item, repository_path, commit)
+                    for repository_path, commit in items
+                ]
+                for future in as_completed(futures):
+                    output.write(json.dumps(future.result(), ensure_ascii=False))
+                    output.write("\n")
+                    output.flush()
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+    def serve(self):
+        """
+        'acw serve' keeps the config, the provider clients and the response cache warm
+        and generates commit messages for the 'acw' clients over a Unix domain socket.
+        """
+        server = self.create_daemon_server()
+        print(f"acw daemon is listening on {self.daemon_socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if os.path.exists(self.daemon_socket_path):
+                os.remove(self.daemon_socket_path)
+
+    def create_daemon_server(self):
+        if not os.path.isfile(self.acw_config_path):
+            print("[bold red]Run 'acw config' before 'acw serve'.[/bold red]")
+            sys.exit(1)
+        self.reload_config_if_changed()
+        self.verbose = False
+        self.warm_up_provider()
+        os.makedirs(self.cache_directory, exist_ok=True)
+        if os.path.exists(self.daemon_socket_path):
+            # 이전에 비정상 종료된 daemon 이 남긴 socket 파일
+            os.remove(self.daemon_socket_path)
+        server = socketserver.ThreadingUnixStreamServer(
+            self.daemon_socket_path, DaemonRequestHandler
+        )
+        server.daemon_threads = True
+        server.acw = self
+        os.chmod(self.daemon_socket_path, 0o600)
+        return server
+
+    def reload_config_if_changed(self):
+        """
+        Reads the config file again when its mtime has changed since the last read.
+        """
+        config_mtime = os.stat(self.acw_config_path).st_mtime_ns
+        with self.config_lock:
+            if config_mtime != self.config_mtime:
+                self.config()
+                self.set_properties_from_current_config_map()
+                self.config_mtime = config_mtime
+
+    def handle_daemon_request(self, request, send):
+        """
+        Generates the commit message JSON for the files selected by a client.
+        With "staged" the staged changes are used instead (prepare-commit-msg hook).
+        """
+        self.reload_config_if_changed()
+        worker = copy.copy(self)
+        # provider 는 만든 worker 의 설정을 보므로 요청마다 새로 만든다 (HTTP client pool 은 class 에 있어서 재사용됨)
+        worker.providers = {}
+        worker.repository_path = self.get_repository_root(request["repository"])
+        worker.repository_status = None
+        worker.use_response_cache = not request.get("no_cache", False)
+        if request.get("staged"):
+            env = None
+            if request.get("index_file"):
+                env = {"GIT_INDEX_FILE": request["index_file"]}
+            file_diffs = list(
+                worker.stream_file_diffs(GitCommand.DIFF.value + ["--cached"], env=env)
+            )
+        else:
+            file_diffs = list(
+                chain(
+                    worker.iter_file_diffs(request.get("untracked", []), False),
+                    worker.iter_file_diffs(request.get("modified", []), True),
+                )
+            )
+        if not file_diffs:
+            raise Exception("No files have been changed.")
+        stream_renderer = None
+        if request.get("stream"):
+            stream_renderer = DaemonStreamWriter(send)
+        return worker.generate_commit_message_using_prompt(
+            worker.build_prompt_input(file_diffs), stream_renderer=stream_renderer
+        )
+
+    def request_daemon(self, request, stream_renderer=None, timeout=None):
+        """
+        Sends a generation request to the running 'acw serve' daemon and returns the commit message JSON.
+        Returns None when no daemon is running so that the caller can generate it locally.
+        """
+        if not self.use_daemon or not os.path.exists(self.daemon_socket_path):
+            return None
+        import socket
+
+        response = {}
+
+        def iter_chunks(lines):
+            for line in lines:
+                message = json.loads(line)
+                if "chunk" not in message:
+                    response.update(message)
+                    return
+                yield message["chunk"]
+
+        try:
+            with (
+                self.profiler.phase("request_daemon"),
+                socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection,
+            ):
+                connection.settimeout(timeout)
+                connection.connect(self.daemon_socket_path)
+                connection.sendall(json.dumps(request).encode("utf-8") + b"\n")
+                with connection.makefile("r", encoding="utf-8") as lines:
+                    chunks = iter_chunks(lines)
+                    if stream_renderer:
+                        stream_renderer.render(chunks)
+                    for _ in chunks:
+                        pass
+        except (OSError, ValueError):
+            # daemon 이 없거나 응답이 늦거나 깨진 응답을 보내면 직접 생성한다
+            return None
+        if "error" in response:
+            raise Exception(response["error"])
+        return response.get("content")
+
+    def prepare_commit_msg(self, message_file, source="", commit=""):
+        """
+        'acw prepare-commit-msg' is meant to be called from the git hook of the same name.
+        Asks the running daemon for a message describing the staged changes and writes it to `message_file`.
+        Does nothing when git already has a message, when no daemon is running or when anything fails,
+        so that the hook never aborts `git commit`.
+        """
+        if source or not os.path.isfile(self.acw_config_path):
+            return
+        try:
+            self.config()
+            self.set_properties_from_current_config_map()
+            request = {
+                "repository": os.path.abspath(self.repository_path or "."),
+                "staged": True,
+            }
+            # 'git commit -a' 나 'git commit <paths>' 는 임시 index 로 커밋하므로 그 index 의 diff 를 써야 한다
+            if os.environ.get("GIT_INDEX_FILE"):
+                request["index_file"] = os.path.abspath(os.environ["GIT_INDEX_FILE"])
+            generated_commit_message_as_json_string = self.request_daemon(
+                request, timeout=self.hook_timeout_seconds
+            )
+            if generated_commit_message_as_json_string is None:
+                return
+            # hook 이 다시 요청하며 기다리게 하지 않도록 잘못된 답은 고치지 않는다
+            generated_commit_message = self.format_commit_message(
+                generated_commit_message_as_json_string, repair=False
+            )
+            with open(message_file, "r") as f:
+                template = f.read()
+            with open(message_file, "w") as f:
+                f.write(generated_commit_message + "\n" + template)
+        except Exception:
+            # hook 이 실패하면 git commit 이 중단되므로 아무것도 하지 않고 넘어간다
+            return
+
+    def list_commits(self, repository_path, commit_range):
+        return subprocess.check_output(
+            GitCommand.REV_LIST.value + [commit_range],
+            cwd=repository_path,
+            text=True,
+        ).split()
+
+    def generate_batch_item(self, repository_path, commit):
+        """
+        Generates the commit message of one commit (or of the working tree) and returns the JSON line as a dict.
+        """
+        # 요청마다 repository 와 상태가 다르므로 설정을 공유하는 사본으로 실행
+        worker = copy.copy(self)
+        worker.providers = {}
+        worker.repository_path = self.get_repository_root(repository_path)
+        worker.repository_status = None
+        worker.retry_count = 0
+        started_at = time.perf_counter()
+        result = {"repository": repository_path, "commit": commit}
+        try:
+            if commit:
+                file_diffs = list(
+                    worker.stream_file_diffs(GitCommand.SHOW.value + [commit])
+                )
+            else:
+                status = worker.get_repository_status()
+                file_diffs = list(
+                    chain(
+                        worker.iter_file_diffs(status.untracked, False),
+                        worker.iter_file_diffs(status.modified, True),
+                    )
+                )
+            if not file_diffs:
+                raise Exception("No files have been changed.")
+            generated_commit_message_json = worker.parse_commit_message(
+                worker.generate_commit_message_using_prompt(
+                    worker.build_prompt_input(file_diffs)
+                )
+            )
+            result["subject"] = generated_commit_message_json["subject"]
+            result["description"] = generated_commit_message_json["description"]
+        except Exception as e:
+            result["error"] = str(e)
+        result["retries"] = worker.retry_count
+        result["latency_seconds"] = round(time.perf_counter() - started_at, 3)
+        return result
+
+    def get_selected_unstaged_file_name_list(self) -> list:
+        unstaged_file_name_list = self.get_repository_status().untracked
+
+        if unstaged_file_name_list:
+            return self.select_checkbox(
+                "Select from [Untracked files]", unstaged_file_name_list
+            )
+        else:
+            return []
+
+    def get_selected_modified_file_name_list(self) -> list:
+        modified_file_name_list = self.get_repository_status().modified
+
+        if modified_file_name_list:
+            return self.select_checkbox(
+                "Select from [Changes not staged for commit]", modified_file_name_list
+            )
+        else:
+            return []
+
+    def get_repository_root(self, path=None):
+        """
+        Returns the top level directory of the repository containing `path` (the current directory by default).
+        The paths of `git status` are relative to it, so every git command and file read runs from there.
+        """
+        result = subprocess.run(
+            GitCommand.TOP_LEVEL.value,
+            cwd=path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            errors="surrogateescape",
+        )
+        if result.returncode != 0:
+            # repository 가 아니면 아래 git 명령이 오류를 보여주도록 그대로 둔다
+            return path
+        return result.stdout.rstrip("\n")
+
+    def get_repository_status(self, refresh=False):
+        """
+        Returns the status snapshot of the repository, scanning the working tree only once per run.
+        """
+        if self.repository_status is None or refresh:
+            try:
+                output = subprocess.check_output(
+                    GitCommand.STATUS.value,
+                    cwd=self.repository_path,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    errors="surrogateescape",
+                )
+            except subprocess.CalledProcessError as e:
+                # Handle errors (e.g., not a git repo, git command not found)
+                print(f"Error executing git command: {e.stderr}")
+                output = ""
+            self.repository_status = RepositoryStatus.parse(output)
+        return self.repository_status
+
+    def select_checkbox(self, message, file_name_list):
+        """
+        Prompt the user to select files from a list using a checkbox interface. Returns a list of selected file names.
+        """
+        if len(file_name_list) == 0:
+            return []
+        if len(file_name_list) > self.tree_picker_threshold:
+            return TreeFilePicker(message, file_name_list).pick()
+        import inquirer
+
+        key = "selected_files"
+        questions = [
+            inquirer.Checkbox(
+                key, message=message, choices=file_name_list, carousel=True
+            ),
+        ]
+        answers = inquirer.prompt(questions)
+        return answers[key]
+
+    def iter_file_diffs(self, selected_files, is_diff):
+        """
+        Yields (file name, lines) pairs for the selected files.
+        Diffs are collected with one streamed `git diff` over the whole pathspec and split per file while reading.
+        """
+        if not is_diff:
+            for filename in selected_files:
+                yield filename, self.read_untracked_file(filename)
+            return
+        chunk_size = self.diff_pathspec_chunk_size
+        for start in range(0, len(selected_files), chunk_size):
+            pathspec = selected_files[start : start + chunk_size]
+            yield from self.stream_file_diffs(GitCommand.DIFF.value + ["--"] + pathspec)
+
+    def read_untracked_file(self, filename):
+        """
+        Returns the lines of an untracked file for the prompt, reading at most `untracked_file_max_bytes`.
+        Binary files become a one-line stub and larger text files keep only a head and a tail excerpt.
+        """
+        path = self.get_repository_file_path(filename)
+        if os.path.islink(path):
+            return [f"Symbolic link to {os.readlink(path)}"]
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if self.is_binary_file(file, size):
+                return [f"Binary file {filename} ({size} bytes)"]
+            if size <= self.untracked_file_max_bytes:
+                return file.read().decode("utf-8", "replace").split("\n")
+            excerpt_bytes = self.untracked_file_max_bytes // 2
+            head = file.read(excerpt_bytes)
+            file.seek(size - excerpt_bytes)
+            tail = file.read(excerpt_bytes)
+        # 잘린 줄은 버리고 온전한 줄만 남긴다
+        if b"\n" in head:
+            head = head[: head.rindex(b"\n")]
+        tail = tail[tail.find(b"\n") + 1 :]
+        omitted_bytes = size - len(head) - len(tail)
+        return (
+            head.decode("utf-8", "replace").split("\n")
+            + [f"... ({omitted_bytes} bytes omitted)"]
+            + tail.decode("utf-8", "replace").split("\n")
+        )
+
+    def is_binary_file(self, file, size):
+        """
+        Looks for a NUL byte in the first `binary_sniff_bytes` through a memory map, without reading the file.
+        """
+        if size == 0:
+            return False
+        try:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return mapped.find(b"\0", 0, self.binary_sniff_bytes) != -1
+        except (OSError, ValueError):
+            # mmap 할 수 없는 파일은 앞부분만 읽어서 확인한다
+            is_binary = b"\0" in file.read(self.binary_sniff_bytes)
+            file.seek(0)
+            return is_binary
+
+    def get_repository_file_path(self, filename):
+        if self.repository_path is None:
+            return filename
+        return os.path.join(self.repository_path, filename)
+
+    def stream_file_diffs(self, command, env=None):
+        """
+        Runs a `git diff` command and splits its output into per-file hunks as it is read.
+        `env` holds environment variables to set for the command, such as GIT_INDEX_FILE.
+        """
+        # stderr 를 pipe 로 받으면 경고가 (core.autocrlf 등) pipe buffer 보다 많을 때
+        # stdout 을 다 읽기 전에 git 이 멈추므로 임시 파일에 쓰게 한다
+        error_file = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            command,
+            cwd=self.repository_path,
+            env={**os.environ, **env} if env else None,
+            stdout=subprocess.PIPE,
+            stderr=error_file,
+            text=True,
+            errors="replace",
+        )
+        filename, lines = None, []
+        completed = False
+        try:
+            for line in process.stdout:
+                line = line.rstrip("\n")
+                if line.startswith("diff --git "):
+                    if filename is not None:
+                        yield filename, lines
+                    filename, lines = self.parse_diff_header(line), []
+                if filename is not None:
+                    lines.append(line)
+            if filename is not None:
+                yield filename, lines
+            completed = True
+        finally:
+            if not completed:
+                # 소비하는 쪽이 중간에 멈춘 경우 남은 출력은 필요 없으므로 종료시킨다
+                process.kill()
+            process.stdout.close()
+            return_code = process.wait()
+            error_file.seek(0)
+            stderr = error_file.read().decode("utf-8", "replace")
+            error_file.close()
+            if return_code != 0 and completed:
+                # Handle errors (e.g., not a git repo, git command not found)
+                print(f"Error executing git command: {stderr}")
+
+    def parse_diff_header(self, header):
+        """
+        Extracts the file name from a 'diff --git a/<name> b/<name>' header line.
+        """
+        paths = header[len("diff --git ") :]
+        # rename 이 아닌 경우 a/ 와 b/ 경로가 같으므로 절반으로 나눠서 파일 이름을 구한다
+        half = (len(paths) - 1) // 2
+        if paths.startswith("a/") and paths[half:].startswith(" b/"):
+            return paths[2:half]
+        return paths.rsplit(" b/", 1)[-1]
+
+    def validate_diff_lines(self, diff_lines):
+        try:
+            if len(diff_lines) == 0:
+                print("[bold red]No files have been changed.[/bold red]")
+                raise Exception("diff lines is empty.")
+        except Exception:
+            sys.exit(0)
+
+    def parse_diff_lines_to_single_string(self, diff_lines):
+        return "\n".join(diff_lines)
+
+    def estimate_tokens(self, character_count):
+        """
+        Estimates the token count locally from a character count (about 4 characters per token).
+        """
+        return math.ceil(character_count / 4)
+
+    def is_generated_file(self, filename):
+        """
+        Returns True for lockfiles, minified or generated files and vendored code.
+        """
+        *directory_names, base_name = filename.split("/")
+        if any(name in self.vendored_directory_names for name in directory_names):
+            return True
+        return any(
+            fnmatch(base_name, pattern) for pattern in self.generated_file_name_patterns
+        )
+
+    def count_changed_lines(self, lines):
+        """
+        Counts added and removed lines of a diff, or all lines of an untracked file.
+        """
+        if not lines or not lines[0].startswith("diff --git "):
+            return len(lines)
+        return sum(
+            1
+            for line in lines
+            if line[:1] in ("+", "-") and not line.startswith(("+++ ", "--- "))
+        )
+
+    def shrink_context_lines(self, lines):
+        """
+        Keeps only `diff_context_lines` unchanged lines around the changes of each hunk.
+        The 'index' header line is dropped since blob object IDs mean nothing to the model.
+        """
+        if not lines or not lines[0].startswith("diff --git "):
+            return lines
+        context_lines = self.diff_context_lines
+        first_hunk_index = next(
+            (index for index, line in enumerate(lines) if line.startswith("@@")),
+            len(lines),
+        )
+        distances = [0] * len(lines)
+        # 앞/뒤 방향으로 한 번씩 훑어서 같은 hunk 안의 가장 가까운 변경 line 까지의 거리를 구한다
+        for indexes in (range(len(lines)), range(len(lines) - 1, -1, -1)):
+            distance = math.inf
+            for index in indexes:
+                line = lines[index]
+                if line.startswith("@@"):
+                    distance = math.inf
+                elif index > first_hunk_index and line[:1] == " ":
+                    distance += 1
+                    if indexes.step > 0 or distance < distances[index]:
+                        distances[index] = distance
+                else:
+                    distance = 0
+        return [
+            line
+            for index, (line, distance) in enumerate(zip(lines, distances))
+            if distance <= context_lines
+            and not (index < first_hunk_index and line.startswith("index "))
+        ]
+
+    def truncate_lines_to_tokens(self, lines, token_limit):
+        """
+        Keeps the leading lines that fit in `token_limit` tokens.
+        """
+        result, character_count = [], 0
+        for line in lines:
+            character_count += len(line) + 1
+            if self.estimate_tokens(character_count) > token_limit:
+                break
+            result.append(line)
+        return result
+
+    def build_dropped_file_stub(self, filename, lines, reason):
+        # 변경이 생성 파일에만 있어도 model 이 무엇이 바뀌었는지는 알 수 있게 한다
+        return f"{filename}: {self.count_changed_lines(lines)} changed lines not shown ({reason})"
+
+    def compact_file_diffs(self, file_diffs, token_budget=None):
+        """
+        Drops generated files, shrinks hunk context and ranks files by size of change
+        so that the prompt fits `token_budget` (`prompt_token_budget` by default). Prints what was dropped.
+        A dropped file is replaced by a one-line stub with its name and changed line count.
+        """
+        dropped_messages = []
+        candidates = []
+        compacted = {}
+        for filename, lines in file_diffs:
+            if self.is_generated_file(filename):
+                dropped_messages.append(f"{filename} (generated file)")
+                compacted[filename] = [
+                    self.build_dropped_file_stub(filename, lines, "generated file")
+                ]
+                continue
+            lines = self.shrink_context_lines(lines)
+            character_count = sum(len(line) + 1 for line in lines)
+            candidates.append(
+                (
+                    self.count_changed_lines(lines),
+                    self.estimate_tokens(character_count),
+                    filename,
+                    lines,
                 )
-                config_map[Constants.OPEN_AI_TOP_P.name] = self.open_ai_top_p
-                config_map[Constants.OPEN_AI_MAX_TOKENS.name] = self.open_ai_max_tokens
-                config_map[Constants.OPEN_AI_FREQUENCY_PENALTY.name] = (
-                    self.open_ai_frequency_penalty
+            )
+
+        if token_budget is None:
+            token_budget = self.prompt_token_budget
+        remaining_tokens = token_budget - self.estimate_tokens(len(self.prompt_message))
+        for stub_lines in compacted.values():
+            remaining_tokens -= self.estimate_tokens(len(stub_lines[0]) + 1)
+        # 변경량이 작은 파일부터 남은 budget 을 남은 파일 수로 나눈 만큼씩 나눠준다
+        # 작은 변경은 온전히 들어가고, 큰 변경은 남은 budget 을 최대한 사용하도록 잘린다
+        candidates.sort(key=lambda candidate: (candidate[0], candidate[1]))
+        for index, (changed_line_count, token_count, filename, lines) in enumerate(
+            candidates
+        ):
+            share = remaining_tokens // (len(candidates) - index)
+            if token_count <= share:
+                compacted[filename] = lines
+                remaining_tokens -= token_count
+                continue
+            # 잘렸다는 표시를 붙일 자리를 남겨둔다
+            truncated_lines = self.truncate_lines_to_tokens(lines, share - 16)
+            # 변경된 줄이 하나도 남지 않으면 header 만 보내는 대신 stub 으로 바꾼다
+            if self.count_changed_lines(truncated_lines):
+                omitted_line_count = len(lines) - len(truncated_lines)
+                truncated_lines.append(f"... ({omitted_line_count} lines truncated)")
+                compacted[filename] = truncated_lines
+                dropped_messages.append(
+                    f"{filename} ({omitted_line_count} lines over token budget)"
                 )
-                config_map[Constants.OPEN_AI_PRESENCE_PENALTY.name] = (
-                    self.open_ai_presence_penalty
+                remaining_tokens -= share
+            else:
+                dropped_messages.append(f"{filename} (over token budget)")
+                compacted[filename] = [
+                    self.build_dropped_file_stub(filename, lines, "over token budget")
+                ]
+                remaining_tokens -= self.estimate_tokens(
+                    len(compacted[filename][0]) + 1
                 )
-            with open(self.acw_config_path, "wb") as f:
-                for k, v in config_map.items():
-                    f.write(k.encode("utf-8"))
-                    f.write(b"=")
-                    f.write(str(v).encode("utf-8"))
-                    f.write(b"\n")
 
-    def choose_model(self):
-        key = "confirm"
-        questions = [
-            inquirer.List(
-                key,
-                message="Select the models you want to use.",
-                choices=[
-                    Models.GPT_3_5_TURBO.name
-                    + "---(OpenAI, Need to connect your OpenAI account.)",
-                    Models.LLAMA3.name + "---(Ollama, Run locally.)",
-                ],
-            )
+        if self.verbose:
+            for message in dropped_messages:
+                print(f"[yellow]Dropped from prompt: {message}[/yellow]")
+        return [
+            (filename, compacted[filename])
+            for filename, _ in file_diffs
+            if filename in compacted
         ]
-        return inquirer.prompt(questions)[key].split("---")[0].lstrip()
 
-    def set_properties_from_current_config_map(self):
-        self.model = self.current_config_map[Constants.MODEL.name]
-        current_config_map_commit_message_language = self.current_config_map.get(
-            Constants.COMMIT_MESSAGE_LANGUAGE.name, ""
+    def generate_commit_message_using_prompt(
+        self, parsed_diff_line, stream_renderer=None
+    ):
+        """
+        Automatically generate and suggest commit messages through prompt engineering
+        """
+        if self.hedge_model and self.hedge_model != self.model:
+            return self.request_hedged_chat_completion(
+                self.prompt_message, parsed_diff_line, stream_renderer=stream_renderer
+            )
+        return self.request_chat_completion(
+            self.prompt_message,
+            parsed_diff_line,
+            stream_renderer=stream_renderer,
+            json_output=True,
         )
-        current_config_map_prompt_message = self.current_config_map.get(
-            Constants.PROMPT_MESSAGE.name, ""
+
+    def cache(self, action="stats"):
+        """
+        'acw cache stats' prints the response cache usage, 'acw cache clear' empties it.
+        """
+        if os.path.isfile(self.acw_config_path):
+            self.config()
+            self.set_properties_from_current_config_map()
+        response_cache = self.get_response_cache()
+        summary_cache = self.get_summary_cache()
+        if action == "stats":
+            for k, v in response_cache.stats().items():
+                print(f"{k}: {v}")
+            for k, v in summary_cache.stats().items():
+                print(f"summary {k}: {v}")
+        elif action == "clear":
+            response_cache.clear()
+            summary_cache.clear()
+            history_directory = os.path.join(self.cache_directory, "history")
+            if os.path.isdir(history_directory):
+                for entry in os.scandir(history_directory):
+                    os.remove(entry.path)
+            print("Response cache cleared.")
+        else:
+            print("Unknown command")
+            sys.exit(1)
+
+    def get_response_cache(self):
+        key = (self.cache_directory, self.response_cache_max_bytes)
+        if key not in self.response_caches:
+            self.response_caches[key] = ResponseCache(*key)
+        return self.response_caches[key]
+
+    def get_summary_cache(self):
+        return SummaryCache(
+            self.cache_directory,
+            self.summary_cache_max_bytes,
+            max_age_seconds=self.summary_cache_max_age_days * 24 * 60 * 60,
+        )
+
+    def get_file_summary_key(self, summary_cache, filename, lines):
+        """
+        Keys the summary of one file by its blob object IDs before and after the change and the model.
+        """
+        old_oid, new_oid = self.parse_blob_oids(lines)
+        if new_oid is None:
+            # untracked 파일이나 index 줄이 없는 diff 는 prompt 에 들어가는 내용으로 blob id 를 계산한다
+            new_oid = self.hash_blob("\n".join(lines))
+        return summary_cache.make_key(
+            filename, old_oid, new_oid, self.model, self.map_prompt_message
+        )
+
+    def parse_blob_oids(self, lines):
+        """
+        Returns the (old, new) blob object IDs from the 'index <old>..<new>' line of a diff,
+        or (None, None) when there is none.
+        """
+        if not lines or not lines[0].startswith("diff --git "):
+            return None, None
+        for line in lines[1:]:
+            if line.startswith("@@"):
+                break
+            if line.startswith("index "):
+                old_oid, _, new_oid = line[6:].split(" ")[0].partition("..")
+                return old_oid, new_oid
+        return None, None
+
+    def hash_blob(self, content):
+        """
+        Same object ID as `git hash-object` for `content`.
+        """
+        data = content.encode("utf-8", "surrogateescape")
+        return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+    def get_response_cache_key(
+        self,
+        response_cache,
+        system_message,
+        user_message,
+        cache_variant=None,
+        model=None,
+    ):
+        return response_cache.make_key(
+            system_message,
+            user_message,
+            cache_variant,
+            model or self.model,
+            self.prompt_message,
+            self.commit_message_language,
+            self.open_ai_temperature,
+            self.open_ai_top_p,
+            self.open_ai_max_tokens,
+            self.open_ai_frequency_penalty,
+            self.open_ai_presence_penalty,
+        )
+
+    def request_chat_completion(
+        self,
+        system_message,
+        user_message,
+        stream_renderer=None,
+        cache_variant=None,
+        json_output=False,
+    ):
+        """
+        Returns the answer of the configured model, from the response cache when the same request was made before.
+        With a `stream_renderer` the answer is streamed and rendered while it arrives.
+        `cache_variant` separates the cache entries of several candidates for the same request.
+        `json_output` asks the backend to answer with a JSON object when it supports it.
+        """
+        if not self.use_response_cache:
+            return self.send_chat_request(
+                system_message,
+                user_message,
+                stream_renderer=stream_renderer,
+                json_output=json_output,
+            )
+        response_cache = self.get_response_cache()
+        key = self.get_response_cache_key(
+            response_cache, system_message, user_message, cache_variant
+        )
+        content = response_cache.get(key)
+        if content is None:
+            content = self.send_chat_request(
+                system_message,
+                user_message,
+                stream_renderer=stream_renderer,
+                json_output=json_output,
+            )
+            response_cache.put(key, content)
+        return content
+
+    def send_chat_request(
+        self, system_message, user_message, stream_renderer=None, json_output=False
+    ):
+        """
+        Sends one chat request to the configured model and returns the content of the answer.
+        """
+        messages = [
+            {
+                "role": "system",
+                "content": system_message,
+            },
+            {"role": "user", "content": user_message},
+        ]
+        provider = self.get_provider()
+        kwargs = self.get_json_output_options(provider, system_message, json_output)
+        if stream_renderer:
+            return stream_renderer.render(provider.stream_chat(messages, **kwargs))
+        return self.call_with_retry(lambda: provider.chat(messages, **kwargs))
+
+    def request_hedged_chat_completion(
+        self, system_message, user_message, stream_renderer=None
+    ):
+        """
+        Sends the request to the configured model and, after `hedge_delay_seconds` or as soon as it fails
+        or answers something that is not a commit message, to `hedge_model` as well.
+        The first valid commit message wins and the other request is cancelled.
+        Raises TimeoutError when no answer arrives within `hedge_timeout_seconds`.
+        """
+        models = [self.model, self.hedge_model]
+        response_cache = self.get_response_cache() if self.use_response_cache else None
+        keys = {}
+        if response_cache:
+            for model in models:
+                keys[model] = self.get_response_cache_key(
+                    response_cache, system_message, user_message, model=model
+                )
+                content = response_cache.get(keys[model])
+                if content is not None:
+                    return self.render_content(content, stream_renderer)
+        # provider registry 는 thread 에서 건드리지 않도록 미리 만들어 둔다
+        providers = [self.get_provider(model) for model in models]
+        cancelled = threading.Event()
+        futures = {}
+
+        def start(index):
+            future = Future()
+            threading.Thread(
+                target=self.run_in_future,
+                args=(
+                    future,
+                    lambda: self.stream_hedged_request(
+                        providers[index], system_message, user_message, cancelled
+                    ),
+                ),
+                daemon=True,
+            ).start()
+            futures[future] = index
+            return future
+
+        start(0)
+        pending = set(futures)
+        fallback_content, error = None, None
+        deadline = time.monotonic() + self.hedge_timeout_seconds
+        with self.profiler.phase("hedged request"):
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # 아직 답하지 않은 요청은 다음 chunk 를 받을 때 멈춘다
+                    cancelled.set()
+                    if fallback_content is not None:
+                        break
+                    raise TimeoutError(
+                        f"No answer from {' or '.join(models)}"
+                        f" within {self.hedge_timeout_seconds} seconds."
+                    )
+                timeout = remaining
+                if len(futures) < len(models):
+                    timeout = min(self.hedge_delay_seconds, remaining)
+                done, pending = wait(pending, timeout, FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        content = future.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    if self.validate_commit_message(self.extract_json_object(content)):
+                        # 진 쪽은 다음 chunk 를 받을 때 스트림을 닫고 멈춘다
+                        cancelled.set()
+                        model = models[futures[future]]
+                        if response_cache:
+                            response_cache.increase_counter(
+                                "hedge_primary_wins"
+                                if model == self.model
+                                else "hedge_secondary_wins"
+                            )
+                            response_cache.put(keys[model], content)
+                        return self.render_content(content, stream_renderer)
+                    if fallback_content is None:
+                        fallback_content = content
+                if len(futures) < len(models) and time.monotonic() < deadline:
+                    # 시간이 지났거나 MODEL 이 실패했다
+                    pending.add(start(1))
+                    if response_cache:
+                        response_cache.increase_counter("hedge_started")
+        if fallback_content is None:
+            raise error
+        # 둘 다 올바른 JSON 이 아니면 parse_commit_message 가 고쳐 보도록 MODEL 의 답을 넘긴다
+        return self.render_content(fallback_content, stream_renderer)
+
+    def stream_hedged_request(self, provider, system_message, user_message, cancelled):
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_message},
+        ]
+        chunks = []
+        stream = provider.stream_chat(
+            messages, **self.get_json_output_options(provider, system_message, True)
         )
+        try:
+            for chunk in stream:
+                if cancelled.is_set():
+                    break
+                chunks.append(chunk)
+        finally:
+            stream.close()
+        return "".join(chunks)
+
+    def render_content(self, content, stream_renderer):
+        if stream_renderer:
+            return stream_renderer.render([content])
+        return content
+
+    def get_json_output_options(self, provider, system_message, json_output):
+        # OpenAI 는 JSON mode 에서 message 에 'JSON' 이라는 단어가 없으면 요청을 거절한다
         if (
-            len(current_config_map_commit_message_language) > 0
-            and len(current_config_map_prompt_message) > 0
+            json_output
+            and self.json_output
+            and provider.supports_json_output
+            and "json" in system_message.lower()
         ):
-            self.commit_message_language = current_config_map_commit_message_language
-            self.prompt_message = current_config_map_prompt_message
+            return {"json_output": True}
+        return {}
 
-    def commit(self):
-        self.config()
-        self.set_properties_from_current_config_map()
+    def call_with_retry(self, request):
+        """
+        Calls `request`, retrying up to `max_retries` times with exponential backoff and jitter
+        when the backend is rate limited or temporarily unavailable. Honours Retry-After when present.
+        """
+        attempt = 0
+        while True:
+            try:
+                return request()
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable_error(e):
+                    raise
+                delay = self.get_retry_after(e)
+                if delay is None:
+                    delay = random.uniform(
+                        0, min(self.retry_max_delay, self.retry_base_delay * 2**attempt)
+                    )
+                attempt += 1
+                self.retry_count += 1
+                time.sleep(delay)
+
+    def is_retryable_error(self, error):
+        # openai 와 ollama 의 오류 모두 status_code 를 가지고 있다
+        status_code = getattr(error, "status_code", None)
+        if status_code in (408, 409, 429, 500, 502, 503, 504):
+            return True
+        return type(error).__name__ in (
+            "APIConnectionError",
+            "APITimeoutError",
+            "ConnectError",
+            "ConnectionError",
+            "ReadTimeout",
+        )
+
+    def get_retry_after(self, error):
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
         try:
-            with open(self.acw_config_path, "r") as file:
-                file_contents = file.read()
-                api_key = file_contents.split("\n")[0].split("=")[1]
-        except FileNotFoundError:
-            print(f"The file {self.acw_config_path} was not found.")
+            return min(self.retry_max_delay, float(headers.get("retry-after")))
+        except (TypeError, ValueError):
+            return None
+
+    def get_provider(self, model=None):
+        """
+        Returns the backend of `model` (the configured model by default) from the registry.
+        """
+        model = model or self.model
+        if model not in self.providers:
+            if model not in MODEL_REGISTRY:
+                raise Exception("Unsupported Model: " + model)
+            provider_name, model_id, _ = MODEL_REGISTRY[model]
+            self.providers[model] = PROVIDER_REGISTRY[provider_name](self, model_id)
+        return self.providers[model]
 
-        selected_unstaged_file_name_list = self.get_selected_unstaged_file_name_list()
-        selected_modified_file_name_list = self.get_selected_modified_file_name_list()
+    def warm_up_provider(self):
+        """
+        Warms up the model in the background while the user is selecting files.
+        """
+        if not self.warm_up_model:
+            return
+        provider = self.get_provider()
 
-        diff_lines = self.read_file_diff(
-            selected_unstaged_file_name_list, False
-        ) + self.read_file_diff(selected_modified_file_name_list, True)
+        def warm_up():
+            try:
+                provider.warm_up()
+            except Exception:
+                # warm-up 은 최적화일 뿐이므로 실패해도 무시한다
+                pass
 
-        self.validate_diff_lines(diff_lines)
+        threading.Thread(target=warm_up, daemon=True).start()
 
-        parsed_diff_line = self.parse_diff_lines_to_single_string(diff_lines)
+    def warm_up_provider_if_not_cached(self, file_diffs):
+        """
+        Warms up the model unless the response cache already has the commit message of `file_diffs`
+        or the 'acw serve' daemon will generate it.
+        """
+        if not self.warm_up_model:
+            return
+        if self.use_daemon and os.path.exists(self.daemon_socket_path):
+            return
+        if (
+            self.use_response_cache
+            and self.candidate_count == 1
+            and not self.hedge_model
+            and not self.should_use_map_reduce(file_diffs)
+        ):
+            response_cache = self.get_response_cache()
+            key = self.get_response_cache_key(
+                response_cache, self.prompt_message, self.build_prompt_input(file_diffs)
+            )
+            if response_cache.contains(key):
+                return
+        self.warm_up_provider()
 
-        generated_commit_message_as_json_string = (
-            self.generate_commit_message_using_prompt(parsed_diff_line)
+    def build_map_prompt_message(self):
+        return (
+            "You will be provided with one part of a larger code change."
+            " "
+            "Summarize what changed in each file of this part in at most 3 short lines of plain text."
+            " "
+            f"Use {self.commit_message_language} as the language."
+            " "
+            "Answer with a JSON object that maps each file path to its summary."
         )
 
-        generated_commit_message_json = json.loads(
-            generated_commit_message_as_json_string
+    def should_use_map_reduce(self, file_diffs):
+        """
+        Returns True when the changeset is too large for a single prompt.
+        """
+        if self.map_reduce_file_threshold <= 0:
+            return False
+        if len(file_diffs) >= self.map_reduce_file_threshold:
+            return True
+        character_count = sum(
+            len(line) + 1 for _, lines in file_diffs for line in lines
         )
+        return self.estimate_tokens(character_count) > self.prompt_token_budget
 
-        generated_commit_message = (
-            generated_commit_message_json["subject"]
-            + "\n\n"
-            + "\n".join(
-                map(lambda x: f"- {x}", generated_commit_message_json["description"])
+    def split_file_diffs_into_chunks(self, file_diffs):
+        """
+        Groups file diffs per file or per directory (`map_reduce_chunk_by`) and returns (chunk name, file diffs) pairs.
+        A group larger than `map_reduce_chunk_tokens` is split into several chunks of the same name.
+        """
+        groups = {}
+        for filename, lines in file_diffs:
+            groups.setdefault(self.get_chunk_name(filename), []).append(
+                (filename, lines)
             )
+        # compact_file_diffs 가 chunk 마다 빼는 prompt 몫을 뺀 만큼만 채운다
+        token_limit = self.map_reduce_chunk_tokens - self.estimate_tokens(
+            len(self.prompt_message)
         )
+        chunks = []
+        for chunk_name, group_file_diffs in groups.items():
+            chunk, token_count = [], 0
+            for filename, lines in group_file_diffs:
+                if self.is_generated_file(filename):
+                    file_token_count = 0
+                else:
+                    file_token_count = self.estimate_tokens(
+                        sum(len(line) + 1 for line in self.shrink_context_lines(lines))
+                    )
+                if chunk and token_count + file_token_count > token_limit:
+                    chunks.append((chunk_name, chunk))
+                    chunk, token_count = [], 0
+                chunk.append((filename, lines))
+                token_count += file_token_count
+            chunks.append((chunk_name, chunk))
+        return chunks
 
-        final_commit_message = self.confirm_commit_message(
-            generated_commit_message, diff_lines
-        )
+    def get_chunk_name(self, filename):
+        if self.map_reduce_chunk_by == "file":
+            return filename
+        return os.path.dirname(filename) or "."
 
-        self.git_add_files(
-            selected_unstaged_file_name_list + selected_modified_file_name_list
+    def summarize_chunk(self, chunk):
+        """
+        Map step: summarizes the changes of one chunk in plain text.
+        """
+        chunk_name, file_diffs = chunk
+        compacted_file_diffs = self.compact_file_diffs(
+            file_diffs, token_budget=self.map_reduce_chunk_tokens
+        )
+        if not compacted_file_diffs:
+            return chunk_name, ""
+        parsed_diff_line = self.parse_diff_lines_to_single_string(
+            line for _, lines in compacted_file_diffs for line in lines
         )
+        with self.profiler.phase("summarize chunk"):
+            summary = self.request_chat_completion(
+                self.map_prompt_message, parsed_diff_line, json_output=True
+            )
+        return chunk_name, summary.strip()
 
-        self.git_commit(final_commit_message)
-        self.git_push_if_needed()
+    def summarize_file_diffs_with_map_reduce(self, file_diffs):
+        """
+        Summarizes chunks of a large changeset concurrently (map)
+        and returns the summaries as the input of the final generation (reduce).
+        Files whose summary is in the summary cache are not sent again.
+        """
+        summary_cache = self.get_summary_cache() if self.use_response_cache else None
+        file_summaries, summary_keys, uncached_file_diffs = {}, {}, []
+        for filename, lines in file_diffs:
+            if summary_cache:
+                summary_keys[filename] = self.get_file_summary_key(
+                    summary_cache, filename, lines
+                )
+                summary = summary_cache.get(summary_keys[filename])
+                if summary is not None:
+                    file_summaries[filename] = summary
+                    continue
+            uncached_file_diffs.append((filename, lines))
 
-    def get_selected_unstaged_file_name_list(self) -> list:
-        unstaged_file_name_list = self.get_file_list_from_git_command(
-            git_command=GitCommand.UNSTAGED_FILES
-        )
+        chunks = self.split_file_diffs_into_chunks(uncached_file_diffs)
+        with ThreadPoolExecutor(
+            max_workers=max(1, self.map_reduce_concurrency)
+        ) as executor:
+            summaries = list(executor.map(self.summarize_chunk, chunks))
 
-        if unstaged_file_name_list:
-            return self.select_checkbox(
-                "Select from [Untracked files]", unstaged_file_name_list
+        # 파일별로 나눌 수 없는 답은 chunk 의 요약으로 그대로 사용한다
+        grouped_summaries = {}
+        for (chunk_name, chunk_file_diffs), (_, summary) in zip(chunks, summaries):
+            parsed_file_summaries = self.parse_file_summaries(
+                summary, [filename for filename, _ in chunk_file_diffs]
             )
-        else:
-            return []
+            if parsed_file_summaries is None:
+                if summary:
+                    grouped_summaries.setdefault(chunk_name, []).append(summary)
+                continue
+            for filename, file_summary in parsed_file_summaries.items():
+                file_summaries[filename] = file_summary
+                if summary_cache:
+                    summary_cache.put(summary_keys[filename], file_summary)
+        for filename, _ in file_diffs:
+            if filename in file_summaries:
+                grouped_summaries.setdefault(self.get_chunk_name(filename), []).append(
+                    f"{filename}: {file_summaries[filename]}"
+                )
+        parsed_summaries = "\n\n".join(
+            f"[{chunk_name}]\n" + "\n".join(summaries)
+            for chunk_name, summaries in grouped_summaries.items()
+        )
+        return (
+            "Summaries of the changes, grouped by "
+            + self.map_reduce_chunk_by
+            + ":\n\n"
+            + parsed_summaries
+        )
 
-    def get_selected_modified_file_name_list(self) -> list:
-        modified_file_name_list = self.get_file_list_from_git_command(
-            git_command=GitCommand.MODIFIED_FILES
+    def parse_file_summaries(self, summary, filenames):
+        """
+        Reads the {"<file path>": "<summary>"} answer of the map step.
+        Returns None when the answer has no summary of any of `filenames`.
+        """
+        answer = self.extract_json_object(summary)
+        if not isinstance(answer, dict):
+            return None
+        file_summaries = {}
+        for filename in filenames:
+            file_summary = answer.get(filename)
+            if isinstance(file_summary, list):
+                file_summary = " ".join(str(line) for line in file_summary)
+            if isinstance(file_summary, str) and file_summary.strip():
+                file_summaries[filename] = file_summary.strip()
+        return file_summaries or None
+
+    def format_commit_message(
+        self, generated_commit_message_as_json_string, repair=True
+    ):
+        return self.build_commit_message(
+            self.parse_commit_message(
+                generated_commit_message_as_json_string, repair=repair
+            )
         )
 
-        if modified_file_name_list:
-            return self.select_checkbox(
-                "Select from [Changes not staged for commit]", modified_file_name_list
+    def build_commit_message(self, generated_commit_message_json):
+        return (
+            generated_commit_message_json["subject"]
+            + "\n\n"
+            + "\n".join(
+                map(lambda x: f"- {x}", generated_commit_message_json["description"])
             )
-        else:
-            return []
+        )
 
-    def get_file_list_from_git_command(self, git_command: GitCommand):
+    def parse_commit_message(self, content, repair=True):
         """
-        Executes a Git command based on the GitCommand enum, returning a list of file names or an empty list on error.
-        Handles execution errors by printing the error message and returning an empty list.
+        Returns the {"subject", "description"} of a generated answer. Tries, in order:
+        `json.loads`, extracting the object from prose, code fences or a truncated answer,
+        and, only with `repair`, asking the model once to fix its answer.
+        Each outcome is counted as json_<path> in the cache stats.
         """
         try:
-            output = subprocess.check_output(
-                git_command.value,
-                stderr=subprocess.STDOUT,  # Capture stderr in case of errors
-                text=True,  # Automatically decode output to string
-            ).strip()  # Remove leading/trailing whitespace characters
-            if output:  # If there's any output, split it into a list
-                return output.split("\n")
-            else:
-                return []  # Return an empty list if there's no output
-        except subprocess.CalledProcessError as e:
-            # Handle errors (e.g., not a git repo, git command not found)
-            print(f"Error executing git command: {e.output}")
-            return []
+            commit_message = self.validate_commit_message(json.loads(content))
+            path = "direct"
+        except ValueError:
+            commit_message = self.validate_commit_message(
+                self.extract_json_object(content)
+            )
+            path = "extracted"
+        if commit_message is None and repair:
+            repaired_content = self.request_chat_completion(
+                self.repair_prompt_message, content, json_output=True
+            )
+            commit_message = self.validate_commit_message(
+                self.extract_json_object(repaired_content)
+            )
+            path = "repaired"
+        if commit_message is None:
+            path = "failed"
+        if self.use_response_cache:
+            self.get_response_cache().increase_counter("json_" + path)
+        if commit_message is None:
+            raise CommitMessageFormatError(
+                "The model did not answer with a commit message JSON: " + content[:200]
+            )
+        return commit_message
 
-    def select_checkbox(self, message, file_name_list):
+    def validate_commit_message(self, value):
         """
-        Prompt the user to select files from a list using a checkbox interface. Returns a list of selected file names.
+        Checks the {"subject": str, "description": [str]} schema. A description given as one string
+        is split into lines. Returns None when the value does not fit.
         """
-        if len(file_name_list) == 0:
-            return []
-        key = "selected_files"
-        questions = [
-            inquirer.Checkbox(
-                key, message=message, choices=file_name_list, carousel=True
-            ),
-        ]
-        answers = inquirer.prompt(questions)
-        return answers[key]
+        if not isinstance(value, dict):
+            return None
+        subject = value.get("subject")
+        description = value.get("description", [])
+        if isinstance(description, str):
+            description = [line for line in description.split("\n") if line.strip()]
+        if not isinstance(subject, str) or not subject.strip():
+            return None
+        if not isinstance(description, list) or not all(
+            isinstance(line, str) for line in description
+        ):
+            return None
+        return {"subject": subject.strip(), "description": description}
 
-    def read_file_diff(self, selected_files, is_diff):
+    def extract_json_object(self, content):
         """
-        Reads and returns the contents of selected files or their diffs if specified.
+        Returns the first JSON object in `content`, ignoring prose and code fences around it
+        and closing the strings and brackets of a truncated answer. Returns None when there is none.
         """
-        result = []
-        if is_diff:
-            for filename in selected_files:
-                try:
-                    output = subprocess.check_output(
-                        ["git", "diff", "--", filename],
-                        stderr=subprocess.STDOUT,  # Capture stderr in case of errors
-                        text=True,  # Automatically decode output to string
-                    ).strip()  # Remove leading/trailing whitespace characters
-                    if output:  # If there's any output, split it into a list
-                        result += output.split("\n")[:-1]
-                    else:
-                        continue
-                except subprocess.CalledProcessError as e:
-                    # Handle errors (e.g., not a git repo, git command not found)
-                    print(f"Error executing git command: {e.output}")
-                    return
+        decoder = json.JSONDecoder()
+        starts = [index for index, character in enumerate(content) if character == "{"]
+        # 설명 글에 있는 중괄호는 건너뛰고 객체로 읽히는 첫 위치를 찾는다
+        for start in starts:
+            try:
+                value, _ = decoder.raw_decode(content, start)
+            except ValueError:
+                continue
+            if isinstance(value, dict):
+                return value
+        for start in starts:
+            value = self.load_truncated_json(content[start:])
+            if isinstance(value, dict):
+                return value
+        return None
+
+    def load_truncated_json(self, text):
+        """
+        Reads the JSON value cut off at the end of `text` by closing its open strings and brackets.
+        Returns None when `text` is not the beginning of a truncated JSON value.
+        """
+        closers, in_string, escape = [], False, False
+        for character in text:
+            if in_string:
+                if escape:
+                    escape = False
+                elif character == "\\":
+                    escape = True
+                elif character == '"':
+                    in_string = False
+            elif character == '"':
+                in_string = True
+            elif character in "{[":
+                closers.append("}" if character == "{" else "]")
+            elif character in "}]":
+                # 끝나기 전에 닫히면 잘린 값이 아니다
+                if not closers or closers.pop() != character or not closers:
+                    return None
+        if escape:
+            text = text[:-1]
+        if in_string:
+            text += '"'
+        try:
+            return json.loads(text.rstrip().rstrip(",") + "".join(reversed(closers)))
+        except ValueError:
+            return None
+
+    def start_commit_message_candidates(self, parsed_diff_line):
+        """
+        Starts generating `candidate_count` commit messages in the background and returns their futures.
+        OpenAI produces all of them in one request with `n`, other models get one request per candidate.
+        Each future resolves to a list of generated commit message JSON strings.
+        """
+        if self.get_provider().supports_choices:
+            jobs = [
+                lambda: self.request_chat_completion_choices(
+                    self.prompt_message, parsed_diff_line, self.candidate_count
+                )
+            ]
         else:
-            for filename in selected_files:
-                with open(filename, "r") as file:
-                    raw_data = file.read()
-                    result += [raw_data]
-        return result
+            jobs = [
+                lambda index=index: [
+                    self.request_chat_completion(
+                        self.prompt_message,
+                        parsed_diff_line,
+                        cache_variant=index,
+                        json_output=True,
+                    )
+                ]
+                for index in range(self.candidate_count)
+            ]
+        futures = []
+        for job in jobs:
+            future = Future()
+            # 유저가 먼저 고르면 남은 요청을 기다리지 않고 종료할 수 있도록 daemon thread 로 실행
+            threading.Thread(
+                target=self.run_in_future, args=(future, job), daemon=True
+            ).start()
+            futures.append(future)
+        return futures
 
-    def validate_diff_lines(self, diff_lines):
+    def run_in_future(self, future, job):
         try:
-            if len(diff_lines) == 0:
-                print("[bold red]No files have been changed.[/bold red]")
-                raise Exception("diff lines is empty.")
-        except Exception:
-            sys.exit(0)
+            future.set_result(job())
+        except Exception as e:
+            future.set_exception(e)
 
-    def parse_diff_lines_to_single_string(self, diff_lines):
-        return "\n".join(diff_lines)
+    def request_chat_completion_choices(self, system_message, user_message, n):
+        """
+        Returns `n` answers generated in one request, from the response cache when possible.
+        """
+        temperature = max(self.open_ai_temperature, self.candidate_temperature)
+        response_cache = self.get_response_cache()
+        key = self.get_response_cache_key(
+            response_cache, system_message, user_message, ("n", n, temperature)
+        )
+        if self.use_response_cache:
+            cached_choices = response_cache.get(key)
+            if cached_choices is not None:
+                return json.loads(cached_choices)
+        provider = self.get_provider()
+        choices = provider.chat_choices(
+            [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": user_message},
+            ],
+            n,
+            temperature=temperature,
+            **self.get_json_output_options(provider, system_message, True),
+        )
+        if self.use_response_cache:
+            response_cache.put(key, json.dumps(choices))
+        return choices
 
-    def generate_commit_message_using_prompt(self, parsed_diff_line):
+    def select_commit_message_candidate(self, futures, diff_lines):
         """
-        Automatically generate and suggest commit messages through prompt engineering
+        Lets the user pick one of the generated commit messages as soon as the first one is ready.
+        The list grows as more candidates arrive.
         """
-        if self.model == Models.GPT_3_5_TURBO.name:
-            completion = OpenAI(api_key=api_key).chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": self.prompt_message,
-                    },
-                    {"role": "user", "content": parsed_diff_line},
-                ],
-                model=self.open_ai_model,
-                frequency_penalty=self.open_ai_frequency_penalty,
-                max_tokens=self.open_ai_max_tokens,
-                temperature=self.open_ai_temperature,
-                top_p=self.open_ai_top_p,
-                presence_penalty=self.open_ai_presence_penalty,
-                stop=None,
-            )
-            return completion.choices[0].message.content
-        if self.model == Models.LLAMA3.name:
-            completion = ollama.chat(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": self.prompt_message,
-                    },
-                    {"role": "user", "content": parsed_diff_line},
-                ],
-            )
-            return completion["message"]["content"]
-        raise Exception("Unsupported Model: " + self.model)
+        import inquirer
+
+        candidates = []
+        collected_futures = set()
+        while True:
+            if not candidates:
+                wait(
+                    [future for future in futures if future not in collected_futures],
+                    return_when=FIRST_COMPLETED,
+                )
+            for future in futures:
+                if not future.done() or future in collected_futures:
+                    continue
+                collected_futures.add(future)
+                try:
+                    new_candidates = future.result()
+                except Exception as e:
+                    print(f"[bold red]Failed to generate a candidate: {e}[/bold red]")
+                    continue
+                for generated_commit_message_as_json_string in new_candidates:
+                    try:
+                        # 다른 후보가 있으므로 잘못된 답을 고치려고 다시 요청하지 않는다
+                        generated_commit_message = self.format_commit_message(
+                            generated_commit_message_as_json_string, repair=False
+                        )
+                    except ValueError:
+                        continue
+                    if generated_commit_message in candidates:
+                        continue
+                    candidates.append(generated_commit_message)
+                    print(
+                        "[bold "
+                        + self.text_color
+                        + f"]Candidate {len(candidates)}[/bold "
+                        + self.text_color
+                        + "]"
+                    )
+                    self.print_msg_box(generated_commit_message)
+                    print()
+            # 위에서 모은 뒤에 끝난 요청도 아직 보여주지 않았으므로 pending 에 넣는다
+            pending = [future for future in futures if future not in collected_futures]
+            if not candidates and not pending:
+                print("[bold red]Failed to generate a commit message.[/bold red]")
+                return self.input_commit_message()
+            if not candidates:
+                continue
 
-    def confirm_commit_message(self, genenrated_commit_message, diff_lines):
+            key = "cofirm"
+            subjects = [candidate.split("\n")[0] for candidate in candidates]
+            choices = [
+                f"{index + 1}. {subject}" for index, subject in enumerate(subjects)
+            ]
+            wait_choice = f"Wait for more candidates ({len(pending)} pending)"
+            choices.append("View diff")
+            if pending:
+                choices.append(wait_choice)
+            choices.append("No, I want to modify it.")
+            questions = [
+                inquirer.List(
+                    key,
+                    message="Which commit message do you like?",
+                    choices=choices,
+                ),
+            ]
+            answers = inquirer.prompt(questions)
+            if answers[key] == wait_choice:
+                wait(pending, return_when=FIRST_COMPLETED)
+                continue
+            if answers[key] == "View diff":
+                self.view_diff(diff_lines)
+                continue
+            if answers[key] == "No, I want to modify it.":
+                return self.input_commit_message()
+            return candidates[choices.index(answers[key])]
+
+    def confirm_commit_message(
+        self, genenrated_commit_message, diff_lines, print_message=True
+    ):
         """
         Prompts the user to confirm or modify the generated commit message.
         """
-        print(
-            "[bold " + self.text_color + "]Generated Commit Message" + "[/"
-            "bold " + self.text_color + "] :point_down::point_down:"
-        )
-        print()
-        self.print_msg_box(genenrated_commit_message)
-        print()
+        import inquirer
+
+        if print_message:
+            self.print_generated_commit_message_header()
+            self.print_msg_box(genenrated_commit_message)
+            print()
         key = "cofirm"
         questions = [
             inquirer.List(
@@ -378,24 +3856,41 @@ class ACW:
                 choices=[
                     "Yes, please commit with this message.",
                     "No, I want to modify it.",
+                    "View diff",
                 ],
             ),
         ]
         answers = inquirer.prompt(questions)
+        while answers[key] == "View diff":
+            self.view_diff(diff_lines)
+            answers = inquirer.prompt(questions)
         result = genenrated_commit_message
         if answers[key] == "No, I want to modify it.":
-            print("Please enter a commit message.")
-            lines = []
-            while True:
-                line = input()
-                if line:
-                    lines.append(line)
-                else:
-                    break
-            text = "\n".join(lines)
-            result = text
+            result = self.input_commit_message()
         return result
 
+    def view_diff(self, diff_lines):
+        DiffPager(diff_lines).run()
+        print()
+
+    def input_commit_message(self):
+        print("Please enter a commit message.")
+        lines = []
+        while True:
+            line = input()
+            if line:
+                lines.append(line)
+            else:
+                break
+        return "\n".join(lines)
+
+    def print_generated_commit_message_header(self):
+        print(
+            "[bold " + self.text_color + "]Generated Commit Message" + "[/"
+            "bold " + self.text_color + "] :point_down::point_down:"
+        )
+        print()
+
     def print_msg_box(self, msg, indent=1, width=None, title=None):
         """
         Draw a message box with the given commit message.
@@ -413,12 +3908,33 @@ class ACW:
         print(box)
 
     def git_add_files(self, file_name_list):
-        for filename in file_name_list:
-            subprocess.run(["git", "add", filename], stdout=subprocess.PIPE)
+        """
+        Stages all the files with a single `git update-index`, passing the paths through stdin.
+        """
+        if not file_name_list:
+            return
+        subprocess.run(
+            GitCommand.UPDATE_INDEX.value,
+            cwd=self.repository_path,
+            input="\0".join(file_name_list).encode("utf-8", "surrogateescape"),
+            stdout=subprocess.PIPE,
+        )
 
-    def git_commit(self, final_commit_message):
+    def git_commit(self, final_commit_message, file_name_list=None):
+        """
+        Commits the index, or with `file_name_list` only those paths (leaving the rest of the index staged).
+        """
+        if file_name_list is None:
+            subprocess.run(
+                ["git", "commit", "-m", final_commit_message],
+                cwd=self.repository_path,
+                stdout=subprocess.PIPE,
+            )
+            return
         subprocess.run(
-            ["git", "commit", "-m", final_commit_message],
+            GitCommand.COMMIT_PATHS.value + ["-m", final_commit_message],
+            cwd=self.repository_path,
+            input="\0".join(file_name_list).encode("utf-8", "surrogateescape"),
             stdout=subprocess.PIPE,
         )
 
@@ -426,6 +3942,8 @@ class ACW:
         """
         Prompts the user to decide whether to proceed with pushing the current branch to the remote repository.
         """
+        import inquirer
+
         key = "cofirm"
         questions = [
             inquirer.List(
@@ -437,28 +3955,39 @@ class ACW:
 
         answers = inquirer.prompt(questions)
         if answers[key] == "Yes, push it.":
+            with self.profiler.phase("git push"):
+                self.git_push()
+
+    def git_push(self):
+        current_branch_name = self.get_repository_status().branch
+        if current_branch_name is None:
             current_branch_name = (
                 subprocess.run(
                     ["git", "rev-parse", "--abbrev-ref", "HEAD"],
+                    cwd=self.repository_path,
                     stdout=subprocess.PIPE,
                 )
                 .stdout.decode("utf-8")
                 .split("\n")[:-1]
             )[0]
-            subprocess.run(
-                [
-                    "git",
-                    "push",
-                    "--set-upstream",
-                    "origin",
-                    current_branch_name,
-                ],
-                stdout=subprocess.PIPE,
-            )
+        subprocess.run(
+            [
+                "git",
+                "push",
+                "--set-upstream",
+                "origin",
+                current_branch_name,
+            ],
+            cwd=self.repository_path,
+            stdout=subprocess.PIPE,
+        )
 
 
 if __name__ == "__main__":
     try:
         ACW()
-    except:
-        pass
+    except KeyboardInterrupt:
+        sys.exit(130)
+    except Exception as e:
+        print(f"[bold red]{e}[/bold red]")
+        sys.exit(1)
@@ -0,0 +1,491 @@
+"""
+Benchmarks for acw.
+
+Run with `uv run python bench_acw.py [micro|e2e|all]`.
+The end-to-end suite runs offline against a local fake LLM server, no API key is needed:
+
+    uv run python bench_acw.py e2e --save-baseline   # record the baseline
+    uv run python bench_acw.py e2e                   # compare with it, exits with 1 on regression
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from acw import ACW, CommitHistoryIndex, Constants, Models, Profiler
+from test_acw import FakeLLMServer
+
+
+@contextmanager
+def synthetic_repository(
+    file_count,
+    lines_per_file=20,
+    changed_lines_per_file=1,
+    untracked_file_count=0,
+    untracked_file_bytes=0,
+    binary_file_count=0,
+):
+    """
+    Creates a throwaway git repository with `file_count` committed files, all of them modified in the working tree
+    by `changed_lines_per_file` lines. Optionally adds untracked text files of `untracked_file_bytes` bytes
+    and modified binary files.
+    """
+    original_directory = os.getcwd()
+    random_bytes = random.Random(0).randbytes
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            subprocess.run(["git", "init", "-q"], check=True)
+            subprocess.run(["git", "config", "user.email", "acw@example.com"])
+            subprocess.run(["git", "config", "user.name", "acw"])
+            file_names = []
+            for index in range(file_count):
+                file_name = f"src/module_{index // 100}/file_{index}.py"
+                os.makedirs(os.path.dirname(file_name), exist_ok=True)
+                with open(file_name, "w") as f:
+                    f.writelines(f"value_{i} = {i}\n" for i in range(lines_per_file))
+                file_names.append(file_name)
+            binary_file_names = []
+            for index in range(binary_file_count):
+                file_name = f"assets/image_{index}.bin"
+                os.makedirs(os.path.dirname(file_name), exist_ok=True)
+                with open(file_name, "wb") as f:
+                    f.write(random_bytes(4096))
+                binary_file_names.append(file_name)
+            subprocess.run(["git", "add", "-A"], check=True)
+            subprocess.run(["git", "commit", "-q", "-m", "initial"], check=True)
+            for file_name in file_names:
+                with open(file_name, "a") as f:
+                    f.writelines(
+                        f"changed_{i} = True\n" for i in range(changed_lines_per_file)
+                    )
+            for file_name in binary_file_names:
+                with open(file_name, "wb") as f:
+                    f.write(random_bytes(4096))
+            line = "untracked = " + "x" * 68 + "\n"
+            for index in range(untracked_file_count):
+                file_name = f"new/untracked_{index}.txt"
+                os.makedirs(os.path.dirname(file_name), exist_ok=True)
+                with open(file_name, "w") as f:
+                    f.write(line * (untracked_file_bytes // len(line)))
+            yield file_names
+        finally:
+            os.chdir(original_directory)
+
+
+def read_file_diff_per_file(selected_files):
+    """
+    The previous implementation: one `git diff` subprocess per selected file.
+    """
+    result = []
+    for filename in selected_files:
+        output = subprocess.check_output(
+            ["git", "diff", "--", filename],
+            stderr=subprocess.STDOUT,
+            text=True,
+        ).strip()
+        if output:
+            result += output.split("\n")[:-1]
+    return result
+
+
+def list_files_with_git_command(command):
+    """
+    The previous implementation: one git command per file list
+    (`git ls-files --others --exclude-standard` and `git diff --name-only`).
+    """
+    output = subprocess.check_output(command, stderr=subprocess.STDOUT, text=True)
+    output = output.strip()
+    return output.split("\n") if output else []
+
+
+def measure(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started_at
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_read_file_diff(file_count=1000):
+    acw = ACW(check_subcommands=False)
+    with synthetic_repository(file_count) as file_names:
+        per_file = measure(lambda: read_file_diff_per_file(file_names))
+        batched = measure(
+            lambda: "\n".join(
+                line
+                for _, lines in acw.iter_file_diffs(file_names, is_diff=True)
+                for line in lines
+            )
+        )
+    print(f"read_file_diff ({file_count} files)")
+    print(f"  per-file git diff : {per_file * 1000:9.1f} ms")
+    print(f"  batched git diff  : {batched * 1000:9.1f} ms")
+    print(f"  speedup           : {per_file / batched:9.1f}x")
+
+
+def git_add_with_pathspec_file(file_names):
+    subprocess.run(
+        ["git", "add", "--pathspec-from-file=-", "--pathspec-file-nul"],
+        input="\0".join(file_names).encode("utf-8"),
+        stdout=subprocess.PIPE,
+    )
+
+
+def git_add_per_file(file_names):
+    """
+    The previous implementation: one `git add` subprocess per file.
+    """
+    for filename in file_names:
+        subprocess.run(["git", "add", filename], stdout=subprocess.PIPE)
+
+
+def bench_repository_status(file_count=10000, per_file_sample_count=1000):
+    acw = ACW(check_subcommands=False)
+    with synthetic_repository(file_count, lines_per_file=2) as file_names:
+        two_scans = measure(
+            lambda: (
+                list_files_with_git_command(
+                    ["git", "ls-files", "--others", "--exclude-standard"]
+                ),
+                list_files_with_git_command(["git", "diff", "--name-only"]),
+            )
+        )
+        snapshot = measure(lambda: acw.get_repository_status(refresh=True))
+        # 파일마다 git add 하는 방식은 너무 느려서 일부만 측정한 뒤 전체 파일 수로 환산한다
+        sample = file_names[:per_file_sample_count]
+        per_file_add = measure(lambda: git_add_per_file(sample), repeat=1)
+        per_file_add *= file_count / len(sample)
+        subprocess.run(["git", "reset", "-q"], check=True)
+        pathspec_file_add = measure(
+            lambda: git_add_with_pathspec_file(file_names), repeat=1
+        )
+        subprocess.run(["git", "reset", "-q"], check=True)
+        batched_add = measure(lambda: acw.git_add_files(file_names), repeat=1)
+    print(f"repository status and staging ({file_count} changed files)")
+    print(f"  ls-files + diff --name-only : {two_scans * 1000:9.1f} ms")
+    print(f"  status --porcelain=v2       : {snapshot * 1000:9.1f} ms")
+    print(
+        f"  per-file git add            : {per_file_add * 1000:9.1f} ms"
+        f" (scaled from {len(sample)} files)"
+    )
+    print(f"  git add --pathspec-from-file: {pathspec_file_add * 1000:9.1f} ms")
+    print(f"  git update-index --stdin    : {batched_add * 1000:9.1f} ms")
+
+
+def fast_import_history(commit_count, directory_count=300, file_count=3000):
+    """
+    Writes `commit_count` commits, each changing 1-3 files with a conventional subject, with `git fast-import`.
+    """
+    random.seed(0)
+    scopes = ["api", "cli", "parser", "cache", "docs", "build", "ui", "db"]
+    kinds = ["feat", "fix", "refactor", "docs", "test", "chore"]
+    lines = []
+    for index in range(commit_count):
+        subject = (
+            f"{random.choice(kinds)}({random.choice(scopes)}):"
+            f" update handler_{random.randrange(5000)} for case_{random.randrange(5000)}"
+        ).encode()
+        lines.append(b"commit refs/heads/main")
+        lines.append(b"committer acw <acw@example.com> %d +0000" % (1_000_000 + index))
+        lines.append(b"data %d" % len(subject))
+        lines.append(subject)
+        for _ in range(random.randint(1, 3)):
+            file_index = random.randrange(file_count)
+            path = f"src/dir_{file_index % directory_count}/module_{file_index}.py"
+            content = f"{index}\n".encode()
+            lines.append(b"M 100644 inline " + path.encode())
+            lines.append(b"data %d" % len(content))
+            lines.append(content)
+        lines.append(b"")
+    subprocess.run(
+        ["git", "fast-import", "--quiet"], input=b"\n".join(lines) + b"\n", check=True
+    )
+    subprocess.run(["git", "symbolic-ref", "HEAD", "refs/heads/main"], check=True)
+
+
+def bench_history_index(commit_count=300000):
+    original_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            subprocess.run(["git", "init", "-q"], check=True)
+            fast_import_history(commit_count)
+            history_index = CommitHistoryIndex(
+                os.path.join(directory, "history.sqlite"), max_commits=commit_count
+            )
+            capped_index = CommitHistoryIndex(os.path.join(directory, "capped.sqlite"))
+            started_at = time.perf_counter()
+            capped_index.update(directory)
+            capped_update = time.perf_counter() - started_at
+            started_at = time.perf_counter()
+            history_index.update(directory)
+            full_update = time.perf_counter() - started_at
+            subprocess.run(
+                [
+                    "git",
+                    "-c",
+                    "user.name=acw",
+                    "-c",
+                    "user.email=acw@example.com",
+                    "commit",
+                    "-q",
+                    "--allow-empty",
+                    "-m",
+                    "fix: new",
+                ],
+                check=True,
+            )
+            incremental_update = measure(lambda: history_index.update(directory))
+            paths = ["src/dir_17/module_317.py", "src/dir_42/module_42.py"]
+            text = "+def handler_1234(case_77):\n-    return parse(case_76)"
+            search = measure(lambda: history_index.search(paths, text, 3), repeat=20)
+        finally:
+            os.chdir(original_directory)
+    print(f"commit history index ({commit_count} commits)")
+    print(
+        f"  first update       : {capped_update * 1000:9.1f} ms"
+        f" (newest {capped_index.max_commits} commits, the default)"
+    )
+    print(f"  first update (all) : {full_update * 1000:9.1f} ms")
+    print(f"  incremental update : {incremental_update * 1000:9.1f} ms")
+    print(f"  search             : {search * 1000:9.1f} ms")
+
+
+class CountingPopen(subprocess.Popen):
+    """
+    Counts the subprocesses started while it replaces `subprocess.Popen`.
+    """
+
+    count = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingPopen.count += 1
+        super().__init__(*args, **kwargs)
+
+
+def reset_peak_rss():
+    # Linux 에서는 clear_refs 에 5 를 쓰면 VmHWM (peak RSS) 이 현재 RSS 로 초기화된다
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def read_peak_rss_kb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class BenchmarkProfiler(Profiler):
+    """
+    Adds the number of started subprocesses and the peak RSS to every phase.
+    """
+
+    @contextmanager
+    def record_phase(self, name):
+        started_subprocess_count = CountingPopen.count
+        # 중첩된 phase 나 다른 thread 에서 초기화하면 바깥 phase 의 peak 가 사라지므로 최상위에서만 초기화
+        if threading.current_thread() is threading.main_thread() and not (
+            self.local.__dict__.get("stack")
+        ):
+            reset_peak_rss()
+        with super().record_phase(name) as counts:
+            try:
+                yield counts
+            finally:
+                counts["subprocesses"] = CountingPopen.count - started_subprocess_count
+                counts["peak_rss_kb"] = read_peak_rss_kb()
+
+
+# (이름, synthetic_repository 인자)
+E2E_SCENARIOS = [
+    ("10 files", {"file_count": 10}),
+    ("1000 files", {"file_count": 1000}),
+    ("large diff", {"file_count": 5, "changed_lines_per_file": 5000}),
+    (
+        "large untracked",
+        {"file_count": 1, "untracked_file_count": 20, "untracked_file_bytes": 1 << 20},
+    ),
+    ("binary files", {"file_count": 10, "binary_file_count": 200}),
+]
+E2E_MODELS = [Models.GPT_3_5_TURBO.name, Models.LLAMA3.name]
+
+
+def run_commit_pipeline(home_directory, server, model):
+    """
+    Runs 'acw commit' in the current repository, selecting every file and accepting the generated message.
+    Returns {phase: {"seconds", "subprocesses", "peak_rss_kb"}}.
+    """
+    with open(os.path.join(home_directory, ".acw"), "w") as f:
+        f.write(f"{Constants.MODEL.name}={model}\n")
+        f.write(f"{Constants.OPEN_AI_API_KEY.name}=dummy_open_ai_api_key\n")
+        f.write(f"{Constants.OPEN_AI_BASE_URL.name}={server.url}/v1\n")
+        f.write(f"{Constants.OLLAMA_HOST.name}={server.url}\n")
+        f.write(f"{Constants.WARM_UP_MODEL.name}=false\n")
+        f.write(f"{Constants.USE_DAEMON.name}=false\n")
+    acw = ACW(check_subcommands=False, home_directory=home_directory)
+    acw.use_response_cache = False
+    acw.profiler = BenchmarkProfiler(enabled=True)
+    acw.select_checkbox = lambda message, choices: choices
+    acw.confirm_commit_message = lambda message, *args, **kwargs: message
+    acw.git_push_if_needed = lambda: None
+    with patch("acw.print"), patch("subprocess.Popen", CountingPopen):
+        with acw.profiler.phase("total"):
+            acw.commit()
+
+    result = {}
+    for name, _, elapsed_ns, _, counts in acw.profiler.events:
+        phase = result.setdefault(
+            name, {"seconds": 0.0, "subprocesses": 0, "peak_rss_kb": 0}
+        )
+        phase["seconds"] += elapsed_ns / 1e9
+        phase["subprocesses"] += counts["subprocesses"]
+        phase["peak_rss_kb"] = max(phase["peak_rss_kb"], counts["peak_rss_kb"])
+    return result
+
+
+def merge_best_run(best, phases):
+    """
+    Keeps the fastest wall time of every phase, and the largest subprocess count and peak RSS.
+    """
+    for name, phase in phases.items():
+        if name not in best:
+            best[name] = dict(phase)
+            continue
+        best[name]["seconds"] = min(best[name]["seconds"], phase["seconds"])
+        best[name]["subprocesses"] = max(
+            best[name]["subprocesses"], phase["subprocesses"]
+        )
+        best[name]["peak_rss_kb"] = max(best[name]["peak_rss_kb"], phase["peak_rss_kb"])
+
+
+def bench_end_to_end(latency=0.05, repeat=3):
+    """
+    Runs the full commit pipeline for every scenario and backend against the fake LLM server.
+    """
+    results = {}
+    with FakeLLMServer(latency=latency) as server:
+        for scenario_name, repository_options in E2E_SCENARIOS:
+            for model in E2E_MODELS:
+                key = f"{scenario_name} / {model}"
+                results[key] = {}
+                with tempfile.TemporaryDirectory() as home_directory:
+                    with synthetic_repository(**repository_options):
+                        for _ in range(repeat):
+                            merge_best_run(
+                                results[key],
+                                run_commit_pipeline(home_directory, server, model),
+                            )
+                            # 커밋을 되돌려서 다음 실행도 같은 working tree 에서 시작
+                            subprocess.run(["git", "reset", "-q", "HEAD~1"], check=True)
+                print_end_to_end_result(key, results[key])
+    return results
+
+
+def print_end_to_end_result(key, phases):
+    print(f"end-to-end commit: {key}")
+    print(f"  {'phase':<38} {'wall ms':>9} {'procs':>6} {'peak RSS MB':>12}")
+    for name, phase in phases.items():
+        print(
+            f"  {name:<38} {phase['seconds'] * 1000:9.1f}"
+            f" {phase['subprocesses']:6d} {phase['peak_rss_kb'] / 1024:12.1f}"
+        )
+
+
+def find_regressions(baseline, results, threshold):
+    """
+    Compares the results with the baseline. Wall time and peak RSS regress when they grow by more than
+    `threshold` (ignoring changes under 10 ms / 1 MB), the subprocess count regresses on any increase.
+    """
+    regressions = []
+    for key, phases in results.items():
+        for name, phase in phases.items():
+            base = baseline.get(key, {}).get(name)
+            if base is None:
+                continue
+            seconds, base_seconds = phase["seconds"], base["seconds"]
+            if (
+                seconds > base_seconds * (1 + threshold)
+                and seconds - base_seconds > 0.01
+            ):
+                regressions.append(
+                    f"{key} / {name}: wall time"
+                    f" {base_seconds * 1000:.1f} ms -> {seconds * 1000:.1f} ms"
+                )
+            if phase["subprocesses"] > base["subprocesses"]:
+                regressions.append(
+                    f"{key} / {name}: subprocesses"
+                    f" {base['subprocesses']} -> {phase['subprocesses']}"
+                )
+            rss, base_rss = phase["peak_rss_kb"], base["peak_rss_kb"]
+            if rss > base_rss * (1 + threshold) and rss - base_rss > 1024:
+                regressions.append(
+                    f"{key} / {name}: peak RSS"
+                    f" {base_rss / 1024:.1f} MB -> {rss / 1024:.1f} MB"
+                )
+    return regressions
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description="acw benchmarks")
+    parser.add_argument(
+        "suite", nargs="?", choices=["micro", "e2e", "all"], default="all"
+    )
+    parser.add_argument(
+        "--baseline",
+        default=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), ".bench_baseline.json"
+        ),
+    )
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args(arguments)
+
+    if options.suite in ("micro", "all"):
+        bench_read_file_diff()
+        bench_repository_status()
+        bench_history_index()
+    if options.suite not in ("e2e", "all"):
+        return 0
+
+    results = bench_end_to_end(latency=options.latency, repeat=options.repeat)
+    if options.save_baseline:
+        with open(options.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {options.baseline}")
+        return 0
+    if not os.path.exists(options.baseline):
+        print("no baseline yet, run with --save-baseline to record one")
+        return 0
+    with open(options.baseline, "r") as f:
+        regressions = find_regressions(json.load(f), results, options.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("no regression against the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -51,12 +51,13 @@ poetry install
 poetry add pyinstaller
 
 # Python 스크립트를 실행 파일로 변환
-poetry run pyinstaller --onefile acw.py
+# --onefile 은 실행할 때마다 임시 디렉토리에 압축을 풀기 때문에 cold start 가 느려서 --onedir 로 빌드
+poetry run pyinstaller --onedir acw.py
 
 # 실행 파일을 원하는 위치로 이동
 echo -e "\nsudo 권한이 필요합니다."
-sudo cp ./dist/acw $OPT_PATH/acw
-sudo ln -sf $OPT_PATH/acw $BIN_PATH/acw
+sudo cp -R ./dist/acw $OPT_PATH/acw
+sudo ln -sf $OPT_PATH/acw/acw $BIN_PATH/acw
 
 # build 폴더, dist 폴더, *.spec 파일 제거
 rm -rf build dist *.spec
@@ -1,9 +1,253 @@
+import copy
+import io
+import json
 import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest.mock
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import chain
 from unittest import TestCase
 from unittest.mock import mock_open, patch
 
-from acw import ACW, Constants, Models
+from acw import (
+    ACW,
+    MODEL_REGISTRY,
+    PROVIDER_REGISTRY,
+    ChatProvider,
+    CommitMessageFormatError,
+    CommitMessageStreamParser,
+    CommitMessageStreamRenderer,
+    Constants,
+    DiffPager,
+    FileTree,
+    Models,
+    RepositoryStatus,
+    ResponseCache,
+    SpeculativeCommitMessage,
+    SummaryCache,
+    register_model,
+    register_provider,
+)
+
+
+class FakeHTTPError(Exception):
+    """
+    Raised by a `FakeLLMServer` responder to answer with an HTTP error status.
+    """
+
+    def __init__(self, status, retry_after=None):
+        super().__init__(status)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class FakeLLMServer:
+    """
+    Local stand-in for the OpenAI and Ollama chat APIs with a configurable latency.
+    `responder` receives the chat messages of a request and returns the answer content.
+    """
+
+    def __init__(self, responder=None, latency=0.0, chunk_size=8, chunk_latency=0.0):
+        self.responder = responder or (
+            lambda messages: json.dumps(
+                {"subject": "feat: fake subject", "description": ["fake line"]}
+            )
+        )
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.requests = []
+        self.client_ports = []
+        self.active_request_count = 0
+        self.max_active_request_count = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        fake_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive 연결을 재사용하는지 확인할 수 있도록 HTTP/1.1 로 응답
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake_server.lock:
+                    fake_server.requests.append((self.path, body))
+                    fake_server.client_ports.append(self.client_address[1])
+                if self.path == "/api/generate":
+                    self.send_json(fake_server.ollama_generate_response(body))
+                    return
+                with fake_server.lock:
+                    fake_server.active_request_count += 1
+                    fake_server.max_active_request_count = max(
+                        fake_server.max_active_request_count,
+                        fake_server.active_request_count,
+                    )
+                try:
+                    time.sleep(fake_server.latency)
+                    try:
+                        content = fake_server.responder(body["messages"])
+                    except FakeHTTPError as e:
+                        self.send_error_json(e)
+                        return
+                    if body.get("stream"):
+                        self.send_stream(body, content)
+                    elif self.path.endswith("/chat/completions"):
+                        contents = [content] + [
+                            fake_server.responder(body["messages"])
+                            for _ in range((body.get("n") or 1) - 1)
+                        ]
+                        self.send_json(fake_server.open_ai_response(body, contents))
+                    else:
+                        self.send_json(fake_server.ollama_response(body, content))
+                finally:
+                    with fake_server.lock:
+                        fake_server.active_request_count -= 1
+
+            def send_stream(self, body, content):
+                is_open_ai = self.path.endswith("/chat/completions")
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type",
+                    "text/event-stream" if is_open_ai else "application/x-ndjson",
+                )
+                self.end_headers()
+                pieces = [
+                    content[index : index + fake_server.chunk_size]
+                    for index in range(0, len(content), fake_server.chunk_size)
+                ]
+                for piece in pieces:
+                    if is_open_ai:
+                        chunk = fake_server.open_ai_stream_chunk(body, piece)
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    else:
+                        chunk = fake_server.ollama_stream_chunk(body, piece, False)
+                        self.wfile.write(f"{json.dumps(chunk)}\n".encode())
+                    self.wfile.flush()
+                    time.sleep(fake_server.chunk_latency)
+                if is_open_ai:
+                    if body.get("stream_options", {}).get("include_usage"):
+                        chunk = fake_server.open_ai_usage_chunk(body, len(pieces))
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.write(b"data: [DONE]\n\n")
+                else:
+                    chunk = fake_server.ollama_stream_chunk(body, "", True)
+                    chunk.update(prompt_eval_count=1, eval_count=len(pieces))
+                    self.wfile.write(f"{json.dumps(chunk)}\n".encode())
+                self.wfile.flush()
+                self.close_connection = True
+
+            def send_error_json(self, error):
+                payload = json.dumps(
+                    {"error": {"message": "fake error", "type": "fake"}}
+                ).encode("utf-8")
+                self.send_response(error.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                if error.retry_after is not None:
+                    self.send_header("Retry-After", str(error.retry_after))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def send_json(self, response):
+                payload = json.dumps(response).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def open_ai_response(self, body, contents):
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [
+                {
+                    "index": index,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+                for index, content in enumerate(contents)
+            ],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }
+
+    def open_ai_stream_chunk(self, body, piece):
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": body["model"],
+            "choices": [
+                {"index": 0, "delta": {"content": piece}, "finish_reason": None}
+            ],
+        }
+
+    def open_ai_usage_chunk(self, body, completion_tokens):
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": body["model"],
+            "choices": [],
+            "usage": {
+                "prompt_tokens": 1,
+                "completion_tokens": completion_tokens,
+                "total_tokens": 1 + completion_tokens,
+            },
+        }
+
+    def ollama_stream_chunk(self, body, piece, done):
+        return {
+            "model": body["model"],
+            "created_at": "2024-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": piece},
+            "done": done,
+        }
+
+    def ollama_generate_response(self, body):
+        return {
+            "model": body["model"],
+            "created_at": "2024-01-01T00:00:00Z",
+            "response": "",
+            "done": True,
+        }
+
+    def ollama_response(self, body, content):
+        return {
+            "model": body["model"],
+            "created_at": "2024-01-01T00:00:00Z",
+            "message": {"role": "assistant", "content": content},
+            "done": True,
+            "prompt_eval_count": 1,
+            "eval_count": 1,
+        }
 
 
 class ACWTest(TestCase):
@@ -89,3 +333,1989 @@ class ACWTest(TestCase):
         config_map.pop(Constants.OPEN_AI_API_KEY.name)
         updated_config_map.pop(Constants.OPEN_AI_API_KEY.name)
         self.assertEqual(config_map, updated_config_map)
+
+
+class HomeDirectoryTestCase(TestCase):
+    """
+    Gives each test an empty home directory for the config file and the caches.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.home_directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.home_directory.cleanup)
+
+    def create_acw(self, server=None, model=None, **overrides):
+        """
+        Returns an ACW using the home directory, sending both OpenAI and Ollama requests to `server`.
+        `overrides` are set as attributes, e.g. `use_response_cache=False`.
+        """
+        acw = ACW(check_subcommands=False, home_directory=self.home_directory.name)
+        if model:
+            acw.model = model
+        if server:
+            acw.open_ai_api_key = "dummy_open_ai_api_key"
+            acw.open_ai_base_url = server.url + "/v1"
+            acw.ollama_host = server.url
+        for name, value in overrides.items():
+            setattr(acw, name, value)
+        return acw
+
+    def create_committing_acw(self, **overrides):
+        """
+        Returns an ACW whose `commit` selects every file, accepts the message and does not push.
+        """
+        return self.create_acw(
+            **{
+                "select_checkbox": lambda message, choices: choices,
+                "confirm_commit_message": lambda message, *args, **kwargs: message,
+                "git_push_if_needed": lambda: None,
+                **overrides,
+            }
+        )
+
+    def write_config(self, server, model=Models.LLAMA3.name, **settings):
+        """
+        Writes the config file of the home directory. `settings` are extra Constants names and values.
+        """
+        with open(os.path.join(self.home_directory.name, ".acw"), "w") as f:
+            f.write(f"{Constants.MODEL.name}={model}\n")
+            f.write(f"{Constants.OPEN_AI_API_KEY.name}=dummy_open_ai_api_key\n")
+            f.write(f"{Constants.OPEN_AI_BASE_URL.name}={server.url}/v1\n")
+            f.write(f"{Constants.OLLAMA_HOST.name}={server.url}\n")
+            for name, value in settings.items():
+                if isinstance(value, bool):
+                    value = str(value).lower()
+                f.write(f"{name}={value}\n")
+
+
+class GitRepositoryTestCase(HomeDirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.original_directory = os.getcwd()
+        self.repository_directory = tempfile.TemporaryDirectory()
+        os.chdir(self.repository_directory.name)
+        self.git("init", "-q")
+        self.git("config", "user.email", "acw@example.com")
+        self.git("config", "user.name", "acw")
+
+    def tearDown(self):
+        os.chdir(self.original_directory)
+        self.repository_directory.cleanup()
+        super().tearDown()
+
+    def git(self, *args):
+        return subprocess.run(
+            ["git", *args], check=True, stdout=subprocess.PIPE, text=True
+        ).stdout
+
+    def write_file(self, file_name, content):
+        directory = os.path.dirname(file_name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(file_name, "w") as f:
+            f.write(content)
+
+    def commit_files(self, file_map):
+        for file_name, content in file_map.items():
+            self.write_file(file_name, content)
+        self.git("add", "-A")
+        self.git("commit", "-q", "-m", "initial")
+
+
+class ReadFileDiffTest(GitRepositoryTestCase):
+    def test_should_split_single_git_diff_output_per_file(self):
+        # given
+        file_names = ["a.txt", "dir with space/b.txt", "c.txt"]
+        self.commit_files({file_name: "line\n" for file_name in file_names})
+        for file_name in file_names:
+            self.write_file(file_name, "line\nchanged\n")
+        acw = ACW(check_subcommands=False)
+
+        # when
+        with patch("subprocess.Popen", wraps=subprocess.Popen) as popen:
+            file_diffs = list(acw.iter_file_diffs(file_names, True))
+
+        # then
+        self.assertEqual(1, popen.call_count)
+        self.assertEqual(sorted(file_names), [name for name, _ in file_diffs])
+        for file_name, lines in file_diffs:
+            self.assertTrue(lines[0].startswith("diff --git a/" + file_name))
+            self.assertEqual("+changed", lines[-1])
+
+    def test_should_not_block_on_large_stderr_output(self):
+        # given
+        # core.autocrlf 경고처럼 pipe buffer (64KB) 보다 많은 stderr 를 쓰고 나서 diff 를 출력하는 명령
+        command = [
+            sys.executable,
+            "-c",
+            "import sys\n"
+            "sys.stderr.write('warning: LF will be replaced by CRLF\\n' * 10000)\n"
+            "sys.stderr.flush()\n"
+            "print('diff --git a/a.txt b/a.txt')\n"
+            "print('+changed')\n",
+        ]
+        acw = ACW(check_subcommands=False)
+        file_diffs = []
+
+        # when
+        thread = threading.Thread(
+            target=lambda: file_diffs.extend(acw.stream_file_diffs(command)),
+            daemon=True,
+        )
+        thread.start()
+        thread.join(timeout=10)
+
+        # then
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(
+            [("a.txt", ["diff --git a/a.txt b/a.txt", "+changed"])], file_diffs
+        )
+
+    def test_should_read_untracked_and_modified_files_as_lines(self):
+        # given
+        self.commit_files({"tracked.txt": "old\n"})
+        self.write_file("tracked.txt", "new\n")
+        self.write_file("untracked.txt", "first\nsecond")
+        acw = ACW(check_subcommands=False)
+
+        # when
+        diff_lines = [
+            line
+            for _, lines in chain(
+                acw.iter_file_diffs(["untracked.txt"], False),
+                acw.iter_file_diffs(["tracked.txt"], True),
+            )
+            for line in lines
+        ]
+
+        # then
+        self.assertEqual(["first", "second"], diff_lines[:2])
+        self.assertIn("-old", diff_lines)
+        self.assertIn("+new", diff_lines)
+
+    def test_should_replace_binary_untracked_file_with_stub(self):
+        # given
+        with open("image.png", "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR" + bytes(range(256)) * 100)
+        acw = ACW(check_subcommands=False)
+
+        # when
+        file_diffs = list(acw.iter_file_diffs(["image.png"], False))
+
+        # then
+        self.assertEqual(
+            [("image.png", ["Binary file image.png (25616 bytes)"])], file_diffs
+        )
+
+    def test_should_keep_head_and_tail_of_large_untracked_file(self):
+        # given
+        line_count = 100_000
+        with open("dataset.csv", "w") as f:
+            f.writelines(f"{index},value\n" for index in range(line_count))
+        acw = ACW(check_subcommands=False)
+        acw.untracked_file_max_bytes = 1024
+
+        # when
+        with patch("builtins.open", wraps=open) as mocked_open:
+            [(_, lines)] = list(acw.iter_file_diffs(["dataset.csv"], False))
+
+        # then
+        self.assertEqual("0,value", lines[0])
+        self.assertEqual(f"{line_count - 1},value", lines[-2])
+        self.assertEqual("", lines[-1])
+        self.assertEqual(1, sum("bytes omitted" in line for line in lines))
+        self.assertLessEqual(sum(len(line) + 1 for line in lines), 1024 + 64)
+        self.assertEqual(1, mocked_open.call_count)
+
+
+class StartupTimeTest(TestCase):
+    # acw 를 import 할 때 새로 불러와도 되는 module 수
+    # wall time 은 machine 부하에 따라 달라지므로 import 하는 양으로 startup 비용을 제한한다
+    IMPORTED_MODULE_BUDGET = 110
+
+    def import_acw(self):
+        """
+        Returns the modules `import acw` loads in a fresh interpreter without site packages.
+        """
+        script = (
+            "import sys\n"
+            "before = set(sys.modules)\n"
+            "import acw\n"
+            "print('\\n'.join(sorted(set(sys.modules) - before)))\n"
+        )
+        return subprocess.run(
+            [sys.executable, "-S", "-c", script],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True,
+        ).stdout.split()
+
+    def test_should_import_only_standard_library_within_startup_budget(self):
+        # when
+        modules = self.import_acw()
+
+        # then
+        self.assertLessEqual(len(modules), self.IMPORTED_MODULE_BUDGET)
+        self.assertEqual(
+            ["acw"],
+            [
+                module
+                for module in modules
+                if module.split(".")[0] not in sys.stdlib_module_names
+            ],
+        )
+
+    def test_should_not_import_providers_or_ui_library_at_startup(self):
+        # when
+        modules = self.import_acw()
+
+        # then
+        for package in ["openai", "ollama", "inquirer", "rich"]:
+            self.assertNotIn(package, modules)
+
+
+class CompactFileDiffsTest(TestCase):
+    def file_diff(self, file_name, changed_line_count, context_line_count=10):
+        return (
+            file_name,
+            [
+                f"diff --git a/{file_name} b/{file_name}",
+                f"--- a/{file_name}",
+                f"+++ b/{file_name}",
+                "@@ -1,20 +1,20 @@",
+            ]
+            + [" context"] * context_line_count
+            + ["+added line"] * changed_line_count
+            + [" context"] * context_line_count,
+        )
+
+    def test_should_drop_generated_files(self):
+        # given
+        acw = ACW(check_subcommands=False)
+        file_diffs = [
+            self.file_diff("uv.lock", 1),
+            self.file_diff("static/app.min.js", 1),
+            self.file_diff("vendor/lib/module.go", 1),
+            self.file_diff("src/main.py", 1),
+        ]
+
+        # when
+        with patch("acw.print") as mocked_print:
+            compacted_file_diffs = acw.compact_file_diffs(file_diffs)
+
+        # then
+        self.assertEqual(
+            [
+                ["uv.lock: 1 changed lines not shown (generated file)"],
+                ["static/app.min.js: 1 changed lines not shown (generated file)"],
+                ["vendor/lib/module.go: 1 changed lines not shown (generated file)"],
+            ],
+            [lines for _, lines in compacted_file_diffs[:3]],
+        )
+        self.assertEqual("src/main.py", compacted_file_diffs[3][0])
+        self.assertIn("+added line", compacted_file_diffs[3][1])
+        self.assertEqual(3, mocked_print.call_count)
+
+    def test_should_keep_stub_of_file_dropped_for_token_budget(self):
+        # given
+        acw = ACW(check_subcommands=False)
+        acw.prompt_token_budget = acw.estimate_tokens(len(acw.prompt_message)) + 40
+        file_diffs = [self.file_diff("package-lock.json", 3), self.file_diff("a.py", 5)]
+
+        # when
+        with patch("acw.print"):
+            compacted_file_diffs = acw.compact_file_diffs(file_diffs)
+
+        # then
+        self.assertEqual(
+            [
+                (
+                    "package-lock.json",
+                    ["package-lock.json: 3 changed lines not shown (generated file)"],
+                ),
+                ("a.py", ["a.py: 5 changed lines not shown (over token budget)"]),
+            ],
+            compacted_file_diffs,
+        )
+
+    def test_should_shrink_context_lines_around_hunks(self):
+        # given
+        acw = ACW(check_subcommands=False)
+        acw.diff_context_lines = 1
+
+        # when
+        compacted_file_diffs = acw.compact_file_diffs([self.file_diff("a.py", 2)])
+
+        # then
+        _, lines = compacted_file_diffs[0]
+        self.assertEqual(
+            [" context", "+added line", "+added line", " context"], lines[4:]
+        )
+
+    def test_should_fit_prompt_in_token_budget(self):
+        # given
+        acw = ACW(check_subcommands=False)
+        acw.prompt_token_budget = 1000
+        file_diffs = [self.file_diff("small.py", 5)] + [
+            self.file_diff(f"large_{index}.py", 1000) for index in range(3)
+        ]
+
+        # when
+        with patch("acw.print"):
+            compacted_file_diffs = acw.compact_file_diffs(file_diffs)
+
+        # then
+        parsed_diff_line = acw.parse_diff_lines_to_single_string(
+            line for _, lines in compacted_file_diffs for line in lines
+        )
+        self.assertLessEqual(
+            acw.estimate_tokens(len(parsed_diff_line) + len(acw.prompt_message)),
+            acw.prompt_token_budget,
+        )
+        self.assertEqual(file_diffs[0][1][:4], compacted_file_diffs[0][1][:4])
+        self.assertIn("+added line", compacted_file_diffs[0][1])
+
+
+class MapReduceTest(HomeDirectoryTestCase):
+    def responder(self, messages):
+        if messages[0]["content"].startswith("You will be provided with one part"):
+            return "summary of " + messages[1]["content"].split("\n")[0]
+        return json.dumps({"subject": "feat: reduce", "description": ["all chunks"]})
+
+    def file_diffs(self, directory_count, file_count_per_directory):
+        return [
+            (
+                f"dir_{directory}/file_{index}.py",
+                [
+                    f"diff --git a/dir_{directory}/file_{index}.py b/dir_{directory}/file_{index}.py",
+                    "@@ -1 +1 @@",
+                    "+changed",
+                ],
+            )
+            for directory in range(directory_count)
+            for index in range(file_count_per_directory)
+        ]
+
+    def test_should_summarize_chunks_concurrently_and_reduce_with_open_ai(self):
+        # given
+        acw = self.create_acw(
+            model=Models.GPT_3_5_TURBO.name,
+            map_reduce_file_threshold=2,
+            history_example_count=0,
+        )
+        acw.open_ai_api_key = "dummy_open_ai_api_key"
+        acw.map_reduce_concurrency = 3
+        # 요청 3개가 동시에 들어와야 답하므로 동시 실행 수가 시간에 따라 달라지지 않는다
+        map_requests = threading.Barrier(3)
+
+        def responder(messages):
+            if messages[0]["content"].startswith("You will be provided with one part"):
+                map_requests.wait(10)
+            return self.responder(messages)
+
+        with FakeLLMServer(responder=responder) as server:
+            acw.open_ai_base_url = server.url + "/v1"
+
+            # when
+            generated_commit_message_as_json_string = acw.generate_commit_message_json(
+                [], [], self.file_diffs(6, 2)
+            )
+
+        # then
+        self.assertEqual(
+            {"subject": "feat: reduce", "description": ["all chunks"]},
+            json.loads(generated_commit_message_as_json_string),
+        )
+        self.assertEqual(7, len(server.requests))
+        self.assertEqual(3, server.max_active_request_count)
+        reduce_messages = server.requests[-1][1]["messages"]
+        for directory in range(6):
+            self.assertIn(f"[dir_{directory}]", reduce_messages[1]["content"])
+
+    def test_should_chunk_per_file_with_ollama(self):
+        # given
+        acw = self.create_acw(
+            model=Models.LLAMA3.name,
+            map_reduce_file_threshold=2,
+            history_example_count=0,
+        )
+        acw.map_reduce_chunk_by = "file"
+
+        with FakeLLMServer(responder=self.responder) as server:
+            acw.ollama_host = server.url
+
+            # when
+            acw.generate_commit_message_json([], [], self.file_diffs(2, 2))
+
+        # then
+        self.assertEqual(5, len(server.requests))
+        self.assertTrue(all(path == "/api/chat" for path, _ in server.requests))
+
+    def test_should_split_large_directory_into_chunks_within_token_limit(self):
+        # given
+        acw = self.create_acw(
+            model=Models.LLAMA3.name,
+            map_reduce_file_threshold=2,
+            history_example_count=0,
+        )
+        acw.map_reduce_chunk_tokens = 200
+        file_diffs = self.file_diffs(1, 300)
+
+        with FakeLLMServer(responder=self.responder) as server:
+            acw.ollama_host = server.url
+
+            # when
+            with patch("acw.print") as mocked_print:
+                acw.generate_commit_message_json([], [], file_diffs)
+
+        # then
+        map_inputs = [
+            body["messages"][1]["content"] for _, body in server.requests[:-1]
+        ]
+        self.assertGreater(len(map_inputs), 1)
+        for filename, _ in file_diffs:
+            self.assertEqual(
+                1, sum(f"a/{filename} " in map_input for map_input in map_inputs)
+            )
+        mocked_print.assert_not_called()
+
+    def test_should_use_map_reduce_for_many_files(self):
+        # given
+        acw = self.create_acw()
+        acw.map_reduce_file_threshold = 10
+
+        # then
+        self.assertFalse(acw.should_use_map_reduce(self.file_diffs(3, 3)))
+        self.assertTrue(acw.should_use_map_reduce(self.file_diffs(5, 2)))
+
+
+class ResponseCacheTest(HomeDirectoryTestCase):
+    def test_should_return_cached_response_for_same_request(self):
+        with FakeLLMServer() as server:
+            # given
+            acw = self.create_acw(server, Models.LLAMA3.name)
+            first_content = acw.generate_commit_message_using_prompt("+added line")
+
+            # when
+            second_content = acw.generate_commit_message_using_prompt("+added line")
+            acw.open_ai_temperature = 0.5
+            acw.generate_commit_message_using_prompt("+added line")
+
+        # then
+        self.assertEqual(first_content, second_content)
+        self.assertEqual(2, len(server.requests))
+        stats = acw.get_response_cache().stats()
+        self.assertEqual(2, stats["entries"])
+        self.assertEqual(1, stats["hits"])
+        self.assertEqual(2, stats["misses"])
+
+    def test_should_bypass_cache_with_no_cache_option(self):
+        with FakeLLMServer() as server:
+            # given
+            acw = self.create_acw(server, Models.LLAMA3.name)
+            acw.run_subcommands(["--no-cache", "cache", "stats"])
+
+            # when
+            acw.generate_commit_message_using_prompt("+added line")
+            acw.generate_commit_message_using_prompt("+added line")
+
+        # then
+        self.assertEqual(2, len(server.requests))
+        self.assertEqual(0, acw.get_response_cache().stats()["entries"])
+
+    def test_should_evict_least_recently_used_entries(self):
+        # given
+        acw = self.create_acw()
+        acw.response_cache_max_bytes = 350
+        response_cache = acw.get_response_cache()
+        for index, key in enumerate(["first", "second", "third"]):
+            response_cache.put(key, "x" * 100)
+            os.utime(
+                os.path.join(response_cache.response_directory, key + ".json"),
+                (index, index),
+            )
+
+        # when
+        response_cache.get("first")
+        response_cache.put("fourth", "x" * 100)
+
+        # then
+        self.assertIsNotNone(response_cache.get("first"))
+        self.assertIsNone(response_cache.get("second"))
+        self.assertIsNotNone(response_cache.get("third"))
+        self.assertIsNotNone(response_cache.get("fourth"))
+
+    def test_should_clear_cache_with_subcommand(self):
+        # given
+        acw = self.create_acw()
+        acw.get_response_cache().put("key", "content")
+
+        # when
+        with patch("acw.print"):
+            acw.run_subcommands(["cache", "clear"])
+
+        # then
+        stats = acw.get_response_cache().stats()
+        self.assertEqual(0, stats["entries"])
+        self.assertEqual(0, stats["bytes"])
+
+    def test_should_not_lose_counter_updates_from_concurrent_threads(self):
+        # given
+        acw = self.create_acw()
+        response_caches = [
+            acw.get_response_cache(),
+            copy.copy(acw).get_response_cache(),
+        ]
+        response_caches.append(
+            ResponseCache(acw.cache_directory, acw.response_cache_max_bytes)
+        )
+
+        # when
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for index in range(60):
+                executor.submit(response_caches[index % 3].increase_counter, "hits")
+
+        # then
+        self.assertIs(response_caches[0], response_caches[1])
+        self.assertEqual(60, acw.get_response_cache().stats()["hits"])
+
+    def test_should_not_import_provider_on_cache_hit(self):
+        # given
+        acw = self.create_acw()
+        acw.model = Models.GPT_3_5_TURBO.name
+        response_cache = acw.get_response_cache()
+        response_cache.put(
+            acw.get_response_cache_key(
+                response_cache, acw.prompt_message, "+added line"
+            ),
+            "cached",
+        )
+        script = (
+            "import sys\n"
+            "from acw import ACW, Models\n"
+            f"acw = ACW(check_subcommands=False, home_directory={self.home_directory.name!r})\n"
+            "acw.model = Models.GPT_3_5_TURBO.name\n"
+            "print(acw.generate_commit_message_using_prompt('+added line'))\n"
+            "print('openai' in sys.modules)\n"
+        )
+
+        # when
+        output = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE,
+            text=True,
+            check=True,
+        ).stdout
+
+        # then
+        self.assertEqual(["cached", "False"], output.split())
+
+
+class StreamOutputTest(HomeDirectoryTestCase):
+    def test_should_parse_subject_and_description_incrementally(self):
+        # given
+        content = 'Sure!\n```json\n{"subject": "feat: add \\"x\\"", "description": ["first", "second, with comma"]}\n```'
+        parser = CommitMessageStreamParser()
+
+        # when
+        events = [
+            (index, event)
+            for index, character in enumerate(content)
+            for event in parser.feed(character)
+        ]
+
+        # then
+        self.assertEqual(
+            [
+                ("subject", 'feat: add "x"'),
+                ("description", "first"),
+                ("description", "second, with comma"),
+            ],
+            [event for _, event in events],
+        )
+        # subject 는 description 이 도착하기 전에 완성된다
+        self.assertLess(events[0][0], content.index('"description"'))
+
+    def test_should_render_streamed_answer_from_open_ai_and_ollama(self):
+        for model in [Models.GPT_3_5_TURBO.name, Models.LLAMA3.name]:
+            with self.subTest(model=model):
+                with FakeLLMServer(chunk_size=4, chunk_latency=0.01) as server:
+                    # given
+                    acw = self.create_acw(server, model, use_response_cache=False)
+                    stream_renderer = CommitMessageStreamRenderer(acw)
+
+                    # when
+                    with patch("acw.print") as mocked_print:
+                        content = acw.generate_commit_message_using_prompt(
+                            "+added line", stream_renderer=stream_renderer
+                        )
+
+                # then
+                self.assertEqual(
+                    {"subject": "feat: fake subject", "description": ["fake line"]},
+                    json.loads(content),
+                )
+                self.assertTrue(server.requests[0][1]["stream"])
+                self.assertTrue(stream_renderer.rendered)
+                printed = [
+                    call.args[0] for call in mocked_print.call_args_list if call.args
+                ]
+                self.assertIn(" feat: fake subject\n", printed)
+                self.assertIn(" - fake line", printed)
+
+    def test_should_erase_partly_rendered_answer_when_request_fails(self):
+        # given
+        acw = self.create_acw()
+        stream_renderer = CommitMessageStreamRenderer(acw)
+        terminal = io.StringIO()
+        terminal.isatty = lambda: True
+
+        def chunks():
+            yield '{"subject": "feat: cut off", "description": ["first", "sec'
+            raise ConnectionError("stream closed")
+
+        with patch("acw.print"), patch("sys.stdout", terminal):
+            with self.assertRaises(ConnectionError):
+                stream_renderer.render(chunks())
+
+            # when
+            stream_renderer.discard()
+
+        # then
+        # 제목 위의 header 2줄, 위쪽 테두리, 제목과 빈 줄, description 한 줄
+        self.assertEqual("\x1b[6F\x1b[J", terminal.getvalue())
+        self.assertFalse(stream_renderer.rendered)
+
+
+class CommitMessageCandidateTest(HomeDirectoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self.slow_candidates_released = threading.Event()
+
+    def responder(self, messages):
+        with self.lock:
+            index = self.request_count
+            self.request_count += 1
+        # 첫 번째 후보만 바로 응답하고 나머지는 유저가 첫 후보를 본 뒤에 응답한다
+        if index > 0:
+            self.slow_candidates_released.wait(10)
+        return json.dumps(
+            {"subject": f"feat: candidate {index}", "description": ["line"]}
+        )
+
+    def test_should_generate_candidates_in_one_open_ai_request(self):
+        with FakeLLMServer(responder=self.responder) as server:
+            # given
+            acw = self.create_acw(server, Models.GPT_3_5_TURBO.name, candidate_count=3)
+            self.slow_candidates_released.set()
+
+            # when
+            futures = acw.start_commit_message_candidates("+added line")
+            candidates = [c for future in futures for c in future.result()]
+
+        # then
+        self.assertEqual(1, len(server.requests))
+        self.assertEqual(3, server.requests[0][1]["n"])
+        self.assertEqual(0.8, server.requests[0][1]["temperature"])
+        self.assertEqual(3, len(candidates))
+
+    def test_should_offer_first_candidate_before_slower_ones_are_ready(self):
+        with FakeLLMServer(responder=self.responder) as server:
+            # given
+            acw = self.create_acw(server, Models.LLAMA3.name, candidate_count=3)
+            prompted_choices = []
+
+            def prompt(questions):
+                prompted_choices.append(questions[0].choices)
+                self.slow_candidates_released.set()
+                choice = questions[0].choices[-2]
+                if not choice.startswith("Wait"):
+                    choice = questions[0].choices[0]
+                return {"cofirm": choice}
+
+            # when
+            with patch("acw.print"), patch("inquirer.prompt", side_effect=prompt):
+                futures = acw.start_commit_message_candidates("+added line")
+                selected = acw.select_commit_message_candidate(futures, [])
+
+        # then
+        self.assertEqual(3, len(server.requests))
+        self.assertEqual(1, len([c for c in prompted_choices[0] if c[0].isdigit()]))
+        self.assertIn("Wait for more candidates (2 pending)", prompted_choices[0])
+        self.assertEqual(3, len([c for c in prompted_choices[-1] if c[0].isdigit()]))
+        self.assertTrue(selected.startswith("feat: candidate"))
+
+    def test_should_offer_identical_candidates_once(self):
+        with FakeLLMServer() as server:
+            # given
+            acw = self.create_acw(server, Models.GPT_3_5_TURBO.name, candidate_count=3)
+            prompted_choices = []
+
+            def prompt(questions):
+                prompted_choices.append(questions[0].choices)
+                return {"cofirm": questions[0].choices[0]}
+
+            # when
+            with patch("acw.print"), patch("inquirer.prompt", side_effect=prompt):
+                futures = acw.start_commit_message_candidates("+added line")
+                acw.select_commit_message_candidate(futures, [])
+
+        # then
+        self.assertEqual(1, len([c for c in prompted_choices[0] if c[0].isdigit()]))
+
+
+class ChatProviderTest(HomeDirectoryTestCase):
+    def test_should_reuse_pooled_client_and_connection(self):
+        for model in [Models.GPT_3_5_TURBO.name, Models.LLAMA3.name]:
+            with self.subTest(model=model):
+                with FakeLLMServer() as server:
+                    # given
+                    acw = self.create_acw(server, model)
+
+                    # when
+                    acw.generate_commit_message_using_prompt("+first")
+                    acw.generate_commit_message_using_prompt("+second")
+                    other_acw = self.create_acw(server, model)
+                    other_acw.generate_commit_message_using_prompt("+third")
+
+                # then
+                self.assertEqual(1, len(set(server.client_ports)))
+                self.assertIs(
+                    acw.get_provider().get_client(),
+                    other_acw.get_provider().get_client(),
+                )
+                self.assertEqual(2, len(acw.get_provider().latencies))
+
+    def test_should_warm_up_ollama_model_with_keep_alive(self):
+        with FakeLLMServer() as server:
+            # given
+            acw = self.create_acw(server, Models.LLAMA3.name)
+            acw.ollama_keep_alive = "1h"
+
+            # when
+            acw.get_provider().warm_up()
+            acw.generate_commit_message_using_prompt("+added line")
+
+        # then
+        self.assertEqual(
+            ["/api/generate", "/api/chat"], [path for path, _ in server.requests]
+        )
+        self.assertTrue(all(body["keep_alive"] == "1h" for _, body in server.requests))
+
+    def test_should_use_registered_provider_for_new_model(self):
+        # given
+        @register_provider("echo")
+        class EchoChatProvider(ChatProvider):
+            def chat(self, messages):
+                return self.model_id + ":" + messages[-1]["content"]
+
+        register_model("ECHO", "echo", "echo-1", "Echo, for tests.")
+        self.addCleanup(MODEL_REGISTRY.pop, "ECHO")
+        self.addCleanup(PROVIDER_REGISTRY.pop, "echo")
+        acw = self.create_acw()
+        acw.model = "ECHO"
+        acw.use_response_cache = False
+
+        # when
+        content = acw.generate_commit_message_using_prompt("+added line")
+
+        # then
+        self.assertEqual("echo-1:+added line", content)
+
+
+class JsonOutputTest(HomeDirectoryTestCase):
+    def test_should_request_json_output_from_providers(self):
+        with FakeLLMServer() as server:
+            # given
+            open_ai_acw = self.create_acw(server, Models.GPT_3_5_TURBO.name)
+            ollama_acw = self.create_acw(server, Models.LLAMA3.name)
+
+            # when
+            open_ai_acw.generate_commit_message_using_prompt("+added line")
+            ollama_acw.generate_commit_message_using_prompt("+added line")
+            ollama_acw.json_output = False
+            ollama_acw.generate_commit_message_using_prompt("+other line")
+
+        # then
+        bodies = [body for _, body in server.requests]
+        self.assertEqual({"type": "json_object"}, bodies[0]["response_format"])
+        self.assertEqual("json", bodies[1]["format"])
+        self.assertNotIn("format", bodies[2])
+
+    def test_should_recover_commit_message_without_request(self):
+        # given
+        acw = self.create_acw()
+        answers = [
+            '```json\n{"subject": "feat: fenced", "description": ["line"]}\n```',
+            'Here it is: {"subject": "feat: prose {x}", "description": []} Done.',
+            '{"subject": "feat: truncated", "description": ["first", "sec',
+            '{"subject": "feat: string", "description": "first\\nsecond"}',
+        ]
+
+        # when
+        commit_messages = [acw.parse_commit_message(answer) for answer in answers]
+
+        # then
+        self.assertEqual(
+            [
+                {"subject": "feat: fenced", "description": ["line"]},
+                {"subject": "feat: prose {x}", "description": []},
+                {"subject": "feat: truncated", "description": ["first", "sec"]},
+                {"subject": "feat: string", "description": ["first", "second"]},
+            ],
+            commit_messages,
+        )
+        stats = acw.get_response_cache().stats()
+        self.assertEqual(3, stats["json_extracted"])
+        self.assertEqual(1, stats["json_direct"])
+
+    def test_should_skip_braces_in_prose_before_commit_message(self):
+        # given
+        acw = self.create_acw()
+        answers = [
+            'I used {braces} here: {"subject": "feat: after prose", "description": []}',
+            'See {x} and [y]: {"subject": "feat: truncated", "description": ["fir',
+        ]
+
+        # when
+        commit_messages = [acw.extract_json_object(answer) for answer in answers]
+
+        # then
+        self.assertEqual(
+            [
+                {"subject": "feat: after prose", "description": []},
+                {"subject": "feat: truncated", "description": ["fir"]},
+            ],
+            commit_messages,
+        )
+
+    def test_should_repair_invalid_answer_once(self):
+        # given
+        def responder(messages):
+            if messages[0]["content"].startswith("You will be provided with an answer"):
+                return json.dumps({"subject": "feat: repaired", "description": []})
+            return "I changed some files."
+
+        with FakeLLMServer(responder) as server:
+            acw = self.create_acw(server, Models.LLAMA3.name)
+
+            # when
+            commit_message = acw.parse_commit_message(
+                acw.generate_commit_message_using_prompt("+added line")
+            )
+
+        # then
+        self.assertEqual("feat: repaired", commit_message["subject"])
+        self.assertEqual(2, len(server.requests))
+        self.assertEqual("json", server.requests[1][1]["format"])
+        self.assertEqual(1, acw.get_response_cache().stats()["json_repaired"])
+
+    def test_should_raise_when_answer_cannot_be_recovered(self):
+        # given
+        acw = self.create_acw()
+
+        # when
+        with self.assertRaises(CommitMessageFormatError):
+            acw.parse_commit_message('{"description": ["no subject"]}', repair=False)
+
+        # then
+        self.assertEqual(1, acw.get_response_cache().stats()["json_failed"])
+
+    def test_should_not_write_stats_with_no_cache_option(self):
+        # given
+        acw = self.create_acw()
+        acw.use_response_cache = False
+
+        # when
+        acw.parse_commit_message('{"subject": "feat: direct", "description": []}')
+
+        # then
+        self.assertNotIn("json_direct", acw.get_response_cache().stats())
+
+
+class HedgedRequestTest(HomeDirectoryTestCase):
+    def create_hedged_acw(self, primary_server, secondary_server):
+        # MODEL 은 Ollama 로, HEDGE_MODEL 은 OpenAI 로 보낸다
+        return self.create_acw(
+            primary_server,
+            Models.LLAMA3.name,
+            hedge_model=Models.GPT_3_5_TURBO.name,
+            open_ai_base_url=secondary_server.url + "/v1",
+            hedge_delay_seconds=0.2,
+        )
+
+    def answer(self, subject):
+        return lambda messages: json.dumps({"subject": subject, "description": []})
+
+    def stalled_answer(self, subject):
+        # 테스트가 끝날 때까지 답하지 않는다
+        released = threading.Event()
+        self.addCleanup(released.set)
+
+        def responder(messages):
+            released.wait(10)
+            return self.answer(subject)(messages)
+
+        return responder
+
+    def test_should_not_hedge_when_primary_answers_in_time(self):
+        with FakeLLMServer(self.answer("feat: primary")) as primary_server:
+            with FakeLLMServer(self.answer("feat: secondary")) as secondary_server:
+                # given
+                acw = self.create_hedged_acw(primary_server, secondary_server)
+                acw.hedge_delay_seconds = 60.0
+
+                # when
+                content = acw.generate_commit_message_using_prompt("+added line")
+
+        # then
+        self.assertEqual("feat: primary", json.loads(content)["subject"])
+        self.assertEqual(0, len(secondary_server.requests))
+
+    def test_should_take_secondary_when_primary_is_slow(self):
+        with FakeLLMServer(self.stalled_answer("feat: primary")) as primary_server:
+            with FakeLLMServer(self.answer("feat: secondary")) as secondary_server:
+                # given
+                acw = self.create_hedged_acw(primary_server, secondary_server)
+
+                # when
+                content = acw.generate_commit_message_using_prompt("+added line")
+                cached_content = acw.generate_commit_message_using_prompt("+added line")
+
+        # then
+        self.assertEqual("feat: secondary", json.loads(content)["subject"])
+        self.assertEqual(content, cached_content)
+        self.assertEqual(1, len(secondary_server.requests))
+        stats = acw.get_response_cache().stats()
+        self.assertEqual(1, stats["hedge_started"])
+        self.assertEqual(1, stats["hedge_secondary_wins"])
+
+    def test_should_hedge_immediately_when_primary_answer_is_invalid(self):
+        with FakeLLMServer(lambda messages: "not json") as primary_server:
+            with FakeLLMServer(
+                self.answer("feat: secondary"), latency=0.1
+            ) as secondary_server:
+                # given
+                acw = self.create_hedged_acw(primary_server, secondary_server)
+                acw.hedge_delay_seconds = 60.0
+
+                # when
+                started_at = time.perf_counter()
+                content = acw.generate_commit_message_using_prompt("+added line")
+                elapsed = time.perf_counter() - started_at
+
+        # then
+        self.assertEqual("feat: secondary", json.loads(content)["subject"])
+        # hedge_delay_seconds 를 기다리지 않았다
+        self.assertLess(elapsed, 30.0)
+
+    def test_should_give_up_when_no_model_answers_in_time(self):
+        with FakeLLMServer(self.stalled_answer("feat: primary")) as primary_server:
+            with FakeLLMServer(
+                self.stalled_answer("feat: secondary")
+            ) as secondary_server:
+                # given
+                acw = self.create_hedged_acw(primary_server, secondary_server)
+                acw.hedge_timeout_seconds = 0.5
+
+                # when
+                with self.assertRaises(TimeoutError):
+                    acw.generate_commit_message_using_prompt("+added line")
+
+        # then
+        self.assertEqual(1, len(primary_server.requests))
+        self.assertEqual(1, acw.get_response_cache().stats()["hedge_started"])
+
+
+class RepositoryStatusTest(GitRepositoryTestCase):
+    def prepare_working_tree(self):
+        self.commit_files(
+            {
+                "modified.txt": "modified\n",
+                "staged.txt": "staged\n",
+                "deleted.txt": "deleted\n",
+                "renamed_from.txt": "renamed\n",
+            }
+        )
+        self.write_file("modified.txt", "new\n")
+        self.write_file("staged.txt", "new\n")
+        self.git("add", "staged.txt")
+        os.remove("deleted.txt")
+        self.git("mv", "renamed_from.txt", "renamed_to.txt")
+        self.write_file("dir/untracked.txt", "new\n")
+        self.write_file("한글 파일.txt", "new\n")
+
+    def test_should_build_snapshot_with_one_git_status_call(self):
+        # given
+        self.prepare_working_tree()
+        acw = ACW(check_subcommands=False)
+
+        # when
+        with patch("subprocess.check_output", wraps=subprocess.check_output) as git:
+            status = acw.get_repository_status()
+            acw.get_repository_status()
+
+        # then
+        self.assertEqual(1, git.call_count)
+        self.assertEqual(
+            ["dir/untracked.txt", "한글 파일.txt"], sorted(status.untracked)
+        )
+        self.assertEqual(["deleted.txt", "modified.txt"], sorted(status.modified))
+        self.assertEqual(["renamed_to.txt", "staged.txt"], sorted(status.staged))
+        self.assertEqual([("renamed_to.txt", "renamed_from.txt")], status.renamed)
+        self.assertEqual(["deleted.txt"], status.deleted)
+        self.assertEqual(self.git("branch", "--show-current").strip(), status.branch)
+
+    def test_should_parse_upstream_and_ahead_behind(self):
+        # when
+        status = RepositoryStatus.parse(
+            "# branch.oid 1234\0# branch.head main\0"
+            "# branch.upstream origin/main\0# branch.ab +2 -1\0"
+        )
+
+        # then
+        self.assertEqual(
+            ("main", "origin/main", 2, 1),
+            (status.branch, status.upstream, status.ahead, status.behind),
+        )
+
+    def test_should_stage_all_files_with_one_git_call(self):
+        # given
+        self.prepare_working_tree()
+        acw = ACW(check_subcommands=False)
+        status = acw.get_repository_status()
+
+        # when
+        with patch("subprocess.run", wraps=subprocess.run) as git:
+            acw.git_add_files(status.untracked + status.modified)
+
+        # then
+        self.assertEqual(1, git.call_count)
+        status = acw.get_repository_status(refresh=True)
+        self.assertEqual([], status.untracked + status.modified)
+        self.assertIn("deleted.txt", status.staged)
+        self.assertIn("한글 파일.txt", status.staged)
+
+    def test_should_commit_from_subdirectory(self):
+        # given
+        self.commit_files({"root.txt": "root\n", "sub/tracked.txt": "tracked\n"})
+        self.write_file("root.txt", "changed root\n")
+        self.write_file("sub/untracked.txt", "untracked\n")
+        os.chdir("sub")
+
+        with FakeLLMServer() as server:
+            self.write_config(server)
+            acw = self.create_committing_acw()
+
+            # when
+            with patch("acw.print"):
+                acw.commit()
+
+        # then
+        # 백그라운드 warm-up 요청 (/api/generate) 은 제외
+        [(_, body)] = [
+            request for request in server.requests if request[0] == "/api/chat"
+        ]
+        prompt = body["messages"][1]["content"]
+        self.assertIn("changed root", prompt)
+        self.assertIn("untracked", prompt)
+        self.assertEqual(
+            ["root.txt", "sub/untracked.txt"],
+            sorted(self.git("show", "--name-only", "--format=").split()),
+        )
+
+    def test_should_print_message_again_when_streamed_answer_was_repaired(self):
+        # given
+        self.commit_files({"a.txt": "a\n"})
+        self.write_file("a.txt", "changed\n")
+        # 잘린 답은 extract_json_object 가 닫아서 "sec" 까지 description 이 된다
+        truncated = '{"subject": "feat: cut off", "description": ["first", "sec'
+
+        with FakeLLMServer(responder=lambda messages: truncated) as server:
+            self.write_config(server)
+            # 메시지를 확인하는 prompt 는 그대로 두고 print_msg_box 호출을 본다
+            acw = self.create_acw(
+                select_checkbox=lambda message, choices: choices,
+                git_push_if_needed=lambda: None,
+            )
+
+            # when
+            with (
+                patch("acw.print"),
+                patch("inquirer.prompt") as prompt,
+                patch.object(acw, "print_msg_box") as print_msg_box,
+            ):
+                prompt.return_value = {
+                    "cofirm": "Yes, please commit with this message."
+                }
+                acw.commit()
+
+        # then
+        print_msg_box.assert_called_once_with("feat: cut off\n\n- first\n- sec")
+        self.assertEqual(
+            "feat: cut off\n\n- first\n- sec",
+            self.git("log", "-1", "--format=%B").strip(),
+        )
+
+
+class BatchTest(GitRepositoryTestCase):
+    def read_output(self, output_path):
+        with open(output_path, "r") as f:
+            return [json.loads(line) for line in f]
+
+    def test_should_generate_messages_for_commit_range(self):
+        # given
+        self.commit_files({"a.txt": "a\n"})
+        for index in range(4):
+            self.commit_files({f"file_{index}.txt": f"{index}\n"})
+        output_path = os.path.join(self.home_directory.name, "out.jsonl")
+
+        # 요청 2개가 동시에 들어와야 답하므로 동시 실행 수가 시간에 따라 달라지지 않는다
+        requests = threading.Barrier(2)
+
+        def responder(messages):
+            requests.wait(10)
+            return json.dumps(
+                {"subject": "feat: fake subject", "description": ["fake line"]}
+            )
+
+        with FakeLLMServer(responder=responder, latency=0.1) as server:
+            self.write_config(server)
+            acw = self.create_acw()
+
+            # when
+            acw.run_subcommands(
+                [
+                    "batch",
+                    "--range=HEAD~4..HEAD",
+                    f"--output={output_path}",
+                    "--concurrency=2",
+                ]
+            )
+
+        # then
+        results = self.read_output(output_path)
+        self.assertEqual(
+            sorted(self.git("rev-list", "HEAD~4..HEAD").split()),
+            sorted(result["commit"] for result in results),
+        )
+        self.assertTrue(all(r["subject"] == "feat: fake subject" for r in results))
+        self.assertTrue(all(r["latency_seconds"] >= 0.1 for r in results))
+        self.assertEqual(2, server.max_active_request_count)
+        for index in range(4):
+            self.assertTrue(
+                any(
+                    f"file_{index}.txt" in body["messages"][1]["content"]
+                    for _, body in server.requests
+                )
+            )
+
+    def test_should_retry_rate_limited_requests_for_repositories(self):
+        # given
+        self.commit_files({"a.txt": "a\n"})
+        self.write_file("a.txt", "changed\n")
+        output_path = os.path.join(self.home_directory.name, "out.jsonl")
+        responses = iter([FakeHTTPError(429, retry_after=0), FakeHTTPError(503)])
+
+        def responder(messages):
+            error = next(responses, None)
+            if error:
+                raise error
+            return json.dumps({"subject": "fix: retried", "description": ["ok"]})
+
+        with FakeLLMServer(responder=responder) as server:
+            self.write_config(server)
+            acw = self.create_acw()
+            acw.retry_base_delay = 0.01
+
+            # when
+            acw.run_subcommands(
+                ["batch", f"--output={output_path}", self.repository_directory.name]
+            )
+
+        # then
+        [result] = self.read_output(output_path)
+        self.assertEqual("fix: retried", result["subject"])
+        self.assertEqual(2, result["retries"])
+        self.assertEqual(3, len(server.requests))
+
+
+class DaemonTest(GitRepositoryTestCase):
+    def write_config(self, server, mtime=None, **settings):
+        super().write_config(server, **settings)
+        if mtime:
+            config_path = os.path.join(self.home_directory.name, ".acw")
+            os.utime(config_path, (mtime, mtime))
+
+    def chat_requests(self, server):
+        # daemon 이 시작할 때 보내는 warm-up 요청은 제외
+        return [request for request in server.requests if request[0] == "/api/chat"]
+
+    def start_daemon(self):
+        daemon = self.create_acw()
+        server = daemon.create_daemon_server()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return daemon
+
+    def test_should_generate_with_daemon_and_reload_changed_config(self):
+        # given
+        self.commit_files({"a.txt": "a\n"})
+        self.write_file("a.txt", "changed\n")
+        request = {
+            "repository": self.repository_directory.name,
+            "untracked": [],
+            "modified": ["a.txt"],
+            "stream": True,
+        }
+        with FakeLLMServer() as first_server, FakeLLMServer() as second_server:
+            self.write_config(first_server, mtime=1000)
+            self.start_daemon()
+            acw = self.create_acw()
+            stream_renderer = unittest.mock.Mock()
+            stream_renderer.render.side_effect = lambda chunks: "".join(chunks)
+
+            # when
+            content = acw.request_daemon(request, stream_renderer=stream_renderer)
+            self.write_config(second_server, mtime=2000)
+            acw.request_daemon(dict(request, no_cache=True))
+
+        # then
+        self.assertEqual("feat: fake subject", json.loads(content)["subject"])
+        stream_renderer.render.assert_called_once()
+        [(_, first_body)] = self.chat_requests(first_server)
+        self.assertIn("a.txt", first_body["messages"][1]["content"])
+        self.assertEqual(1, len(self.chat_requests(second_server)))
+
+    def test_should_use_reloaded_config_in_providers_without_warm_up(self):
+        # given
+        self.commit_files({"a.txt": "a\n"})
+        self.write_file("a.txt", "changed\n")
+        request = {
+            "repository": self.repository_directory.name,
+            "untracked": [],
+            "modified": ["a.txt"],
+            "no_cache": True,
+        }
+        with FakeLLMServer() as first_server, FakeLLMServer() as second_server:
+            self.write_config(first_server, mtime=1000, WARM_UP_MODEL=False)
+            self.start_daemon()
+            acw = self.create_acw()
+
+            # when
+            acw.request_daemon(request)
+            self.write_config(second_server, mtime=2000, WARM_UP_MODEL=False)
+            acw.request_daemon(request)
+
+        # then
+        self.assertEqual(1, len(first_server.requests))
+        self.assertEqual(1, len(second_server.requests))
+
+    def test_should_fall_back_when_daemon_is_not_running(self):
+        # given
+        acw = self.create_acw()
+        os.makedirs(acw.cache_directory)
+        with open(acw.daemon_socket_path, "w"):
+            pass
+
+        # when
+        content = acw.request_daemon({"repository": ".", "modified": ["a.txt"]})
+
+        # then
+        self.assertIsNone(content)
+
+    def test_should_write_staged_message_in_prepare_commit_msg_hook(self):
+        # given
+        self.commit_files({"a.txt": "a\n"})
+        self.write_file("a.txt", "staged\n")
+        self.git("add", "a.txt")
+        message_path = os.path.join(self.home_directory.name, "COMMIT_EDITMSG")
+        template = "\n# Please enter the commit message for your changes.\n"
+        with open(message_path, "w") as f:
+            f.write(template)
+
+        with FakeLLMServer() as server:
+            self.write_config(server)
+            self.start_daemon()
+            acw = self.create_acw()
+
+            # when
+            acw.run_subcommands(["prepare-commit-msg", message_path, "message"])
+            with open(message_path, "r") as f:
+                message_with_source = f.read()
+            acw.run_subcommands(["prepare-commit-msg", message_path])
+
+        # then
+        self.assertEqual(template, message_with_source)
+        with open(message_path, "r") as f:
+            message = f.read()
+        self.assertTrue(message.startswith("feat: fake subject\n"))
+        self.assertTrue(message.endswith(template))
+        [(_, body)] = self.chat_requests(server)
+        self.assertIn("staged", body["messages"][1]["content"])
+
+    def test_should_describe_changes_of_commit_all_in_prepare_commit_msg_hook(self):
+        # given
+        self.commit_files({"a.txt": "a\n"})
+        self.write_file("a.txt", "not staged yet\n")
+        hook_path = os.path.join(".git", "hooks", "prepare-commit-msg")
+        acw_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "acw.py")
+        with open(hook_path, "w") as f:
+            f.write(
+                f'#!/bin/sh\nexec "{sys.executable}" "{acw_path}"'
+                ' prepare-commit-msg "$@"\n'
+            )
+        os.chmod(hook_path, 0o755)
+
+        with FakeLLMServer() as server:
+            self.write_config(server)
+            self.start_daemon()
+
+            # when
+            subprocess.run(
+                ["git", "commit", "-q", "-a"],
+                env=dict(os.environ, HOME=self.home_directory.name, GIT_EDITOR="true"),
+                check=True,
+            )
+
+        # then
+        self.assertEqual(
+            "feat: fake subject", self.git("log", "-1", "--format=%s").strip()
+        )
+        [(_, body)] = self.chat_requests(server)
+        self.assertIn("not staged yet", body["messages"][1]["content"])
+
+    def test_should_leave_message_untouched_when_daemon_answer_is_invalid(self):
+        # given
+        self.commit_files({"a.txt": "a\n"})
+        self.write_file("a.txt", "staged\n")
+        self.git("add", "a.txt")
+        message_path = os.path.join(self.home_directory.name, "COMMIT_EDITMSG")
+        template = "\n# Please enter the commit message for your changes.\n"
+        with open(message_path, "w") as f:
+            f.write(template)
+
+        with FakeLLMServer(lambda messages: "I changed some files.") as server:
+            self.write_config(server)
+            self.start_daemon()
+            acw = self.create_acw()
+
+            # when
+            acw.run_subcommands(["prepare-commit-msg", message_path])
+
+        # then
+        with open(message_path, "r") as f:
+            self.assertEqual(template, f.read())
+        self.assertEqual(1, len(self.chat_requests(server)))
+
+    def test_should_generate_locally_when_daemon_stops_answering(self):
+        # given
+        self.commit_files({"a.txt": "a\n"})
+        self.write_file("a.txt", "changed\n")
+        acw = self.create_acw()
+        acw.model = Models.LLAMA3.name
+        acw.daemon_timeout_seconds = 0.2
+        os.makedirs(acw.cache_directory)
+        stalled_daemon = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(stalled_daemon.close)
+        stalled_daemon.bind(acw.daemon_socket_path)
+        stalled_daemon.listen()
+
+        with FakeLLMServer() as server:
+            acw.ollama_host = server.url
+
+            # when
+            content = acw.generate_commit_message_json(
+                [], ["a.txt"], list(acw.iter_file_diffs(["a.txt"], True))
+            )
+
+        # then
+        self.assertEqual("feat: fake subject", json.loads(content)["subject"])
+        self.assertEqual(1, len(self.chat_requests(server)))
+
+
+class ProfilerTest(GitRepositoryTestCase):
+    def test_should_profile_phases_and_tokens_of_commit(self):
+        for model in [Models.GPT_3_5_TURBO.name, Models.LLAMA3.name]:
+            with self.subTest(model=model):
+                # given
+                self.write_file("a.txt", f"{model}\n")
+                trace_path = os.path.join(self.home_directory.name, "trace.json")
+                stderr = io.StringIO()
+                with FakeLLMServer(chunk_size=4) as server:
+                    self.write_config(server, model, WARM_UP_MODEL=False)
+                    acw = self.create_committing_acw()
+
+                    # when
+                    with patch("acw.print"), patch("sys.stderr", stderr):
+                        acw.run_subcommands(
+                            ["--no-cache", "--profile", f"--trace-file={trace_path}"]
+                        )
+
+                # then
+                rows = {row[0]: row for row in acw.profiler.summarize()}
+                for phase in [
+                    "file discovery",
+                    "read_file_diff",
+                    "parse_diff_lines_to_single_string",
+                    "generate_commit_message_using_prompt",
+                    "git_add_files",
+                    "git_commit",
+                ]:
+                    self.assertEqual(1, rows[phase][1])
+                _, _, _, prompt_tokens, completion_tokens = rows[
+                    "generate_commit_message_using_prompt"
+                ]
+                self.assertEqual(1, prompt_tokens)
+                self.assertGreater(completion_tokens, 1)
+                self.assertIn("acw profile", stderr.getvalue())
+                self.assertIn("git_commit", stderr.getvalue())
+                self.assertIn("acw latency", stderr.getvalue())
+                [provider] = acw.providers.values()
+                self.assertEqual(1, provider.summarize_latencies()[0])
+                self.assertIn(provider.model_id, stderr.getvalue())
+                with open(trace_path, "r") as f:
+                    trace_events = json.load(f)["traceEvents"]
+                self.assertEqual(
+                    {"X"}, {trace_event["ph"] for trace_event in trace_events}
+                )
+                self.assertIn(
+                    {"prompt_tokens": 1, "completion_tokens": completion_tokens},
+                    [trace_event["args"] for trace_event in trace_events],
+                )
+                self.assertEqual(
+                    "feat: fake subject", self.git("log", "-1", "--format=%s").strip()
+                )
+
+    def test_should_not_record_anything_when_disabled(self):
+        # given
+        acw = self.create_acw()
+
+        # when
+        with acw.profiler.phase("read_file_diff") as counts:
+            acw.profiler.count_tokens(10, 20)
+
+        # then
+        self.assertIs(acw.profiler.phase("git_commit"), acw.profiler.phase("x"))
+        self.assertEqual({}, counts)
+        self.assertEqual([], acw.profiler.events)
+
+
+class SummaryCacheTest(GitRepositoryTestCase):
+    def responder(self, messages):
+        if messages[0]["content"].startswith("You will be provided with one part"):
+            file_names = [
+                line.split(" b/")[-1]
+                for line in messages[1]["content"].split("\n")
+                if line.startswith("diff --git ")
+            ]
+            return json.dumps(
+                {file_name: f"summary of {file_name}" for file_name in file_names}
+            )
+        return json.dumps({"subject": "feat: reduce", "description": ["all files"]})
+
+    def map_requests(self, server):
+        return [
+            body["messages"][1]["content"]
+            for _, body in server.requests
+            if body["messages"][0]["content"].startswith("You will be provided")
+        ]
+
+    def test_should_summarize_only_files_with_new_blob_ids(self):
+        # given
+        file_names = ["dir_a/one.py", "dir_a/two.py", "dir_b/three.py"]
+        self.commit_files({file_name: "old\n" for file_name in file_names})
+        for file_name in file_names:
+            self.write_file(file_name, f"new {file_name}\n")
+        acw = self.create_acw()
+        acw.model = Models.LLAMA3.name
+        acw.map_reduce_file_threshold = 2
+        acw.history_example_count = 0
+
+        with FakeLLMServer(responder=self.responder) as server:
+            acw.ollama_host = server.url
+            acw.generate_commit_message_json(
+                [], file_names, list(acw.iter_file_diffs(file_names, True))
+            )
+            first_map_requests = self.map_requests(server)
+            self.write_file("dir_a/two.py", "changed again\n")
+
+            # when
+            acw.generate_commit_message_json(
+                [], file_names, list(acw.iter_file_diffs(file_names, True))
+            )
+
+        # then
+        self.assertEqual(2, len(first_map_requests))
+        self.assertNotIn("index ", first_map_requests[0])
+        [second_map_request] = self.map_requests(server)[2:]
+        self.assertIn("+changed again", second_map_request)
+        self.assertNotIn("dir_a/one.py", second_map_request)
+        # 두 번째 reduce 는 입력이 같아서 응답 cache 에서 가져온다
+        reduce_message = [
+            body["messages"][1]["content"]
+            for _, body in server.requests
+            if body["messages"][1]["content"].startswith("Summaries")
+        ][-1]
+        for file_name in file_names:
+            self.assertIn(f"{file_name}: summary of {file_name}", reduce_message)
+
+    def test_should_evict_expired_and_least_recently_used_summaries(self):
+        # given
+        summary_cache = SummaryCache(
+            self.home_directory.name, max_bytes=100, max_age_seconds=60
+        )
+        summary_cache.put("expired", "old summary")
+        summary_cache.put("recent", "recent summary")
+        expired_at = time.time() - 120
+        os.utime(
+            os.path.join(summary_cache.response_directory, "expired.json"),
+            (expired_at, expired_at),
+        )
+
+        # when
+        summary_cache.put("large", "x" * 60)
+
+        # then
+        self.assertIsNone(summary_cache.get("expired"))
+        self.assertIsNone(summary_cache.get("recent"))
+        self.assertEqual("x" * 60, summary_cache.get("large"))
+
+
+class SpeculationTest(GitRepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.commit_files({"a.txt": "a\n", "b.txt": "b\n"})
+        self.write_file("a.txt", "changed a\n")
+        self.write_file("b.txt", "changed b\n")
+        self.request_started_at = []
+        self.request_received = threading.Event()
+
+    def responder(self, messages):
+        self.request_started_at.append(time.perf_counter())
+        self.request_received.set()
+        return json.dumps({"subject": "feat: fake subject", "description": ["ok"]})
+
+    def create_speculating_acw(self, server, select, speculative_generation=True):
+        self.write_config(
+            server,
+            WARM_UP_MODEL=False,
+            SPECULATIVE_GENERATION=speculative_generation,
+        )
+        return self.create_committing_acw(
+            use_response_cache=False, select_checkbox=select
+        )
+
+    def test_should_reuse_message_generated_while_picker_is_open(self):
+        # given
+        picker_closed_at = []
+
+        def select_all(message, choices):
+            # 미리 보낸 요청이 도착한 뒤에 picker 를 닫는다
+            self.request_received.wait(10)
+            picker_closed_at.append(time.perf_counter())
+            return choices
+
+        with FakeLLMServer(responder=self.responder, latency=0.2) as server:
+            acw = self.create_speculating_acw(server, select_all)
+
+            # when
+            with patch("acw.print"):
+                acw.commit()
+
+        # then
+        self.assertEqual(1, len(server.requests))
+        self.assertLess(self.request_started_at[0], picker_closed_at[0])
+        self.assertEqual(
+            "feat: fake subject", self.git("log", "-1", "--format=%s").strip()
+        )
+        self.assertEqual(
+            ["a.txt", "b.txt"],
+            self.git("show", "--name-only", "--format=").split(),
+        )
+
+    def test_should_generate_again_when_selection_differs(self):
+        # given
+        def select_first(message, choices):
+            self.request_received.wait(10)
+            return choices[:1]
+
+        with FakeLLMServer(
+            responder=self.responder, chunk_size=4, chunk_latency=0.02
+        ) as server:
+            acw = self.create_speculating_acw(server, select_first)
+
+            # when
+            with patch("acw.print"):
+                acw.commit()
+
+        # then
+        self.assertEqual(2, len(server.requests))
+        final_prompt = server.requests[-1][1]["messages"][1]["content"]
+        self.assertIn("changed a", final_prompt)
+        self.assertNotIn("changed b", final_prompt)
+        self.assertEqual(
+            ["a.txt"], self.git("show", "--name-only", "--format=").split()
+        )
+
+    def test_should_not_send_changes_before_selection_by_default(self):
+        # given
+        def select_first(message, choices):
+            picker_closed_at.append(time.perf_counter())
+            return choices[:1]
+
+        picker_closed_at = []
+        with FakeLLMServer(responder=self.responder) as server:
+            acw = self.create_speculating_acw(
+                server, select_first, speculative_generation=False
+            )
+
+            # when
+            with patch("acw.print"):
+                acw.commit()
+
+        # then
+        self.assertEqual(1, len(server.requests))
+        self.assertGreater(self.request_started_at[0], picker_closed_at[0])
+        self.assertNotIn("changed b", server.requests[0][1]["messages"][1]["content"])
+
+    def test_should_read_diffs_again_when_speculation_fails(self):
+        # given
+        def failing_run(speculation):
+            error = OSError("git diff failed")
+            speculation.file_diffs.set_exception(error)
+            speculation.content.set_exception(error)
+            speculation.done = True
+
+        with FakeLLMServer(responder=self.responder) as server:
+            acw = self.create_speculating_acw(server, lambda message, choices: choices)
+
+            # when
+            with (
+                patch("acw.print"),
+                patch.object(SpeculativeCommitMessage, "run", failing_run),
+            ):
+                acw.commit()
+
+        # then
+        self.assertEqual(1, len(server.requests))
+        self.assertEqual(
+            ["a.txt", "b.txt"],
+            self.git("show", "--name-only", "--format=").split(),
+        )
+
+    def test_should_warm_up_only_when_commit_message_is_not_cached(self):
+        # given
+        acw = self.create_acw()
+        acw.model = Models.LLAMA3.name
+        acw.history_example_count = 0
+        file_diffs = list(acw.iter_file_diffs(["a.txt", "b.txt"], True))
+        response_cache = acw.get_response_cache()
+        response_cache.put(
+            acw.get_response_cache_key(
+                response_cache, acw.prompt_message, acw.build_prompt_input(file_diffs)
+            ),
+            "cached",
+        )
+
+        # when
+        with patch.object(acw, "warm_up_provider") as warm_up_provider:
+            acw.warm_up_provider_if_not_cached(file_diffs)
+            cached_warm_up_count = warm_up_provider.call_count
+            acw.warm_up_provider_if_not_cached(file_diffs[:1])
+
+        # then
+        self.assertEqual(0, cached_warm_up_count)
+        self.assertEqual(1, warm_up_provider.call_count)
+
+
+class SplitCommitTest(GitRepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.commit_files(
+            {
+                "src/parser.py": "def parse():\n    pass\n",
+                "src/cli.py": "def main():\n    pass\n",
+                "tests/test_parser.py": "def test_parse():\n    pass\n",
+                "docs/guide.md": "# Guide\n",
+            }
+        )
+        # parser 와 그 test 는 항상 같이 바뀌어 왔다
+        for index in range(3):
+            self.write_file("src/parser.py", f"def parse():\n    return {index}\n")
+            self.write_file(
+                "tests/test_parser.py", f"def test_parse():\n    assert {index}\n"
+            )
+            self.git("commit", "-q", "-am", f"parser {index}")
+
+    def responder(self, messages):
+        if "### Group" not in messages[1]["content"]:
+            return json.dumps({"subject": "feat: single", "description": []})
+        return json.dumps(
+            {
+                "commits": [
+                    {"subject": "docs: explain parsing", "description": []},
+                    {"subject": "feat: parse tokens", "description": ["parser"]},
+                ]
+            }
+        )
+
+    def test_should_group_files_by_path_history_and_hunks(self):
+        # given
+        acw = self.create_acw()
+        self.write_file("src/parser.py", "def parse_tokens():\n    pass\n")
+        self.write_file("tests/test_parser.py", "def test_parse():\n    pass\n")
+        self.write_file("docs/guide.md", "# Guide\nUse parse_tokens.\n")
+        self.write_file("docs/faq.md", "# FAQ\n")
+        file_diffs = list(
+            acw.iter_file_diffs(
+                ["src/parser.py", "docs/guide.md", "tests/test_parser.py"], True
+            )
+        ) + list(acw.iter_file_diffs(["docs/faq.md"], False))
+
+        # when
+        groups = acw.plan_commit_groups(file_diffs)
+
+        # then
+        self.assertEqual(
+            [
+                ["docs/guide.md", "docs/faq.md"],
+                ["src/parser.py", "tests/test_parser.py"],
+            ],
+            groups,
+        )
+
+    def test_should_make_commits_with_one_generation_request(self):
+        # given
+        self.write_file("src/parser.py", "def parse_tokens():\n    pass\n")
+        self.write_file("tests/test_parser.py", "def test_parse_tokens():\n    pass\n")
+        self.write_file("docs/guide.md", "# Guide\nUse parse_tokens.\n")
+        # 이미 stage 된 다른 변경은 나눈 커밋에 섞이지 않는다
+        self.write_file("src/cli.py", "def main():\n    return 0\n")
+        self.git("add", "src/cli.py")
+
+        with FakeLLMServer(responder=self.responder) as server:
+            acw = self.create_acw(server, Models.LLAMA3.name, use_response_cache=False)
+            acw.select_checkbox = lambda message, choices: choices
+            acw.confirm_commit_plan = lambda groups: True
+            acw.confirm_commit_message = lambda message, *args, **kwargs: message
+            acw.git_push_if_needed = lambda: None
+            acw.config = lambda: None
+            acw.set_properties_from_current_config_map = lambda: None
+            acw.speculative_generation = False
+            acw.warm_up_model = False
+            acw.options["split"] = True
+
+            # when
+            with patch("acw.print"):
+                acw.commit()
+
+        # then
+        self.assertEqual(1, len(server.requests))
+        self.assertEqual(
+            ["feat: parse tokens", "docs: explain parsing", "parser 2"],
+            self.git("log", "-3", "--format=%s").split("\n")[:3],
+        )
+        self.assertEqual(
+            ["docs/guide.md"],
+            self.git("show", "--name-only", "--format=", "HEAD~1").split(),
+        )
+        self.assertEqual(
+            ["src/parser.py", "tests/test_parser.py"],
+            self.git("show", "--name-only", "--format=", "HEAD").split(),
+        )
+        self.assertEqual("M  src/cli.py\n", self.git("status", "--porcelain"))
+
+
+class CommitHistoryIndexTest(GitRepositoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.acw = self.create_acw()
+        self.commit_files({"README.md": "# readme\n"})
+        for file_name, subject in [
+            ("src/parser.py", "feat(parser): tokenize nested brackets"),
+            ("docs/guide.md", "docs(guide): describe installation"),
+            ("src/cache.py", "perf(cache): evict expired entries first"),
+        ]:
+            self.write_file(file_name, f"{subject}\n")
+            self.git("add", file_name)
+            self.git("commit", "-q", "-m", subject)
+
+    def test_should_index_only_new_commits(self):
+        # given
+        history_index = self.acw.get_commit_history_index()
+        first_count = history_index.update(".")
+
+        # when
+        unchanged_count = history_index.update(".")
+        self.write_file("src/parser.py", "changed\n")
+        self.git("commit", "-q", "-am", "fix(parser): keep trailing comma")
+        new_count = history_index.update(".")
+
+        # then
+        self.assertEqual(4, first_count)
+        self.assertEqual(0, unchanged_count)
+        self.assertEqual(1, new_count)
+        self.assertEqual(
+            [
+                "feat(parser): tokenize nested brackets",
+                "fix(parser): keep trailing comma",
+            ],
+            history_index.search(["src/parser.py"], "+brackets", 2),
+        )
+
+    def test_should_add_similar_commit_subjects_to_prompt(self):
+        # given
+        self.write_file("src/cache.py", "def evict():\n    pass\n")
+        file_diffs = list(self.acw.iter_file_diffs(["src/cache.py"], True))
+
+        # when
+        prompt_input = self.acw.build_prompt_input(file_diffs)
+        self.acw.history_example_count = 0
+        prompt_input_without_examples = self.acw.build_prompt_input(file_diffs)
+
+        # then
+        self.assertTrue(
+            prompt_input.startswith(
+                "Past commit messages of this repository for similar changes"
+            )
+        )
+        self.assertIn("- perf(cache): evict expired entries first\n", prompt_input)
+        self.assertNotIn("docs(guide)", prompt_input)
+        self.assertTrue(prompt_input.endswith(prompt_input_without_examples))
+        self.assertTrue(prompt_input_without_examples.startswith("diff --git"))
+
+
+class TreeFilePickerTest(TestCase):
+    def file_names(self):
+        # 100 directory x 10 sub directory x 100 파일 = 100,000 개
+        return [
+            f"pkg_{package}/module_{module}/file_{index}.py"
+            for package in range(100)
+            for module in range(10)
+            for index in range(100)
+        ]
+
+    def test_should_expand_directories_and_search_100k_paths_quickly(self):
+        # given
+        file_names = self.file_names()
+
+        # when
+        started_at = time.perf_counter()
+        tree = FileTree(file_names)
+        directories, files = tree.get_children("pkg_42/")
+        matched_files = tree.search("MODULE_3/FILE_99.", 1000)
+        elapsed = time.perf_counter() - started_at
+
+        # then
+        # 보통 20ms 안에 끝나지만 부하가 있는 CI 에서도 흔들리지 않도록 넉넉하게 잡는다
+        self.assertLess(elapsed, 5.0)
+        self.assertEqual(
+            [f"pkg_42/module_{index}/" for index in range(10)],
+            [directory for directory, _ in directories],
+        )
+        self.assertEqual({100}, {file_count for _, file_count in directories})
+        self.assertEqual([], files)
+        self.assertEqual(100, len(matched_files))
+        self.assertTrue(all("module_3/file_99.py" in path for path in matched_files))
+        self.assertEqual(
+            ["pkg_1/module_2/file_3.py"], tree.search("pkg_1/module_2/file_3.py", 10)
+        )
+
+    def test_should_select_whole_directory_and_filtered_files(self):
+        # given
+        file_names = ["README.md", "src/a.py", "src/b.py", "src/sub/c.py", "docs/d.md"]
+        acw = ACW(check_subcommands=False)
+        acw.tree_picker_threshold = 2
+        answers = iter(
+            [
+                "select",  # ./ 에서 파일과 directory 선택
+                ["src/"],
+                "filter",
+                "d.md",
+                ["docs/d.md"],
+                "src/",  # src/ 로 이동해서 b.py 만 해제
+                "select",
+                ["src/a.py", "src/sub/"],
+                "done",
+            ]
+        )
+
+        # when
+        with patch(
+            "inquirer.prompt",
+            side_effect=lambda questions: {"answer": next(answers)},
+        ) as mocked_prompt:
+            selected_files = acw.select_checkbox("Select", file_names)
+
+        # then
+        self.assertEqual(["src/a.py", "src/sub/c.py", "docs/d.md"], selected_files)
+        browse_question = mocked_prompt.call_args_list[0].args[0][0]
+        self.assertIn(
+            ("src/ (0/3)", "src/"), [choice.tuple for choice in browse_question.choices]
+        )
+
+
+class DiffPagerTest(TestCase):
+    def create_console(self):
+        from rich.console import Console
+
+        output = io.StringIO()
+        return output, Console(file=output, width=80, color_system=None)
+
+    def test_should_render_only_visible_window_of_large_diff(self):
+        # given
+        # 약 30MB 의 diff
+        diff_lines = [f"+line {index} " + "x" * 20 for index in range(1_000_000)]
+        output, console = self.create_console()
+        keys = iter(["G", "/", "b", "q"])
+        console.input = lambda prompt: "line 500000 "
+        pager = DiffPager(
+            diff_lines, height=10, read_key=lambda: next(keys), console=console
+        )
+
+        # when
+        started_at = time.perf_counter()
+        pager.render()
+        first_page_elapsed = time.perf_counter() - started_at
+        pager.run()
+
+        # then
+        # 첫 화면은 rich 와 pygments import 를 포함해도 diff 크기와 상관없이 빠르다
+        # (보통 0.1초 안쪽이지만 부하가 있는 CI 에서도 흔들리지 않도록 넉넉하게 잡는다)
+        self.assertLess(first_page_elapsed, 3.0)
+        pages = output.getvalue().split("(space/b: page")
+        self.assertIn("+line 0 ", pages[0])
+        self.assertNotIn("+line 10 ", pages[0])
+        self.assertIn("+line 999999 ", output.getvalue())
+        self.assertIn("lines 499991-500000 of 1000000", output.getvalue())
+        self.assertEqual(
+            {10}, {page.count("+line ") for page in pages if "+line " in page}
+        )
+
+    def test_should_view_diff_from_confirmation_prompt(self):
+        # given
+        acw = ACW(check_subcommands=False)
+        answers = iter(["View diff", "Yes, please commit with this message."])
+        acw.view_diff = unittest.mock.Mock()
+
+        # when
+        with (
+            patch("acw.print"),
+            patch(
+                "inquirer.prompt",
+                side_effect=lambda questions: {"cofirm": next(answers)},
+            ),
+        ):
+            message = acw.confirm_commit_message("feat: subject", ["+added"])
+
+        # then
+        self.assertEqual("feat: subject", message)
+        acw.view_diff.assert_called_once_with(["+added"])